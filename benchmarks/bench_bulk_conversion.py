@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""Check and benchmark the topology conversion of sdx.py against the original one.
+
+The reference is a frozen copy of the original per-object converter
+(reference_conversion.py): a poll rebuilt the whole SDX topology with
+convert_topo() and compared it with the previous one with
+check_topo_diff(). sdx.py reuses the OESS objects whose fields did not
+change, and only converts the OESS interfaces and links depending on
+changed ones again, column by column.
+
+Builds a synthetic topology with varied OESS fields and config overrides,
+and checks that sdx.py produces exactly the same topology (including key
+order) and admin/oper diff flags as the reference, from scratch and
+after some changes; exits with status 1 on any mismatch. Then times a
+poll (building the topology model from the parsed OESS results,
+converting it and diffing it) of both, on a topology as OESS returns it,
+with every field set (--varied times the varied topology instead):
+from scratch, with nothing changed and with 1% of the interfaces and
+links changed, and the conversion of the ports and links alone.
+"""
+import argparse
+import gc
+import json
+import random
+import statistics
+import sys
+import time
+
+import reference_conversion as reference
+from common import load_sdx
+from oess_simulator import OessSimulator, build_topology
+
+STATUSES = ["up", "down", "unknown", None]
+BANDWIDTHS = ["100", "1000", "10000", "25000", "40000", "100000", "400000", "123", 1000]
+VLAN_RANGES = ["1-4095", "100-200", "2-4094", "bad", "10-x", "", None]
+
+
+def choose(rng, obj, field, values):
+    """Set a random value, or leave the field out of the OESS payload."""
+    value = rng.choice(values + ["missing"])
+    if value == "missing":
+        obj.pop(field, None)
+    else:
+        obj[field] = value
+
+
+def diversify(topology, rng):
+    """Randomize the OESS fields the converter depends on."""
+    for node in topology["nodes"]:
+        choose(rng, node, "operational_state", STATUSES)
+        choose(rng, node, "in_maint", ["yes", "no"])
+        choose(rng, node, "admin_state", ["active", "up", "decom"])
+    for intf in topology["interfaces"]:
+        if intf["int_role"] != "trunk":
+            choose(rng, intf, "int_role", ["access", "unknown"])
+        choose(rng, intf, "status", STATUSES)
+        choose(rng, intf, "operational_state", STATUSES)
+        choose(rng, intf, "operational_state_mpls", STATUSES)
+        choose(rng, intf, "in_maint", ["yes", "no"])
+        choose(rng, intf, "admin_state", ["active", "down"])
+        choose(rng, intf, "mpls_vlan_tag_range", VLAN_RANGES)
+        intf["bandwidth"] = rng.choice(BANDWIDTHS)
+    for link in topology["links"]:
+        choose(rng, link, "status", STATUSES)
+        choose(rng, link, "link_state", ["active", "decom"])
+        choose(rng, link, "in_maint", ["yes", "no"])
+    return topology
+
+
+def get_config(topology, rng):
+    """Per-interface and per-link overrides of sdx_config.yml, for a fraction of them."""
+    node_names = {node["node_id"]: node["name"] for node in topology["nodes"]}
+    interfaces, links = {}, {}
+    for intf in rng.sample(topology["interfaces"], len(topology["interfaces"]) // 10):
+        config = rng.choice([
+            {"state": "disabled"},
+            {"sdx_nni": "other.net:node1:1"},
+            {"sdx_vlan_range": [[10, 20]]},
+            {"sdx_vlan_range": []},
+            {"entities": ["entity"], "mtu": 9000},
+        ])
+        if rng.random() < 0.5:
+            interfaces[intf["interface_id"]] = config
+        else:
+            interfaces["%s:%s" % (node_names[intf["node_id"]], intf["name"])] = config
+    for link in rng.sample(topology["links"], len(topology["links"]) // 10):
+        links[link["link_id"]] = {"latency": 5, "availability": 99.9, "residual_bandwidth": 50}
+    return {"interfaces": interfaces, "links": links}
+
+
+def load_topology(raw, config):
+    """Import sdx.py with the given config and fetch the raw topology from a simulator."""
+    simulator = OessSimulator(raw).start()
+    try:
+        sdx = load_sdx(simulator.url, **config)
+        sdx.refresh_topology()
+    finally:
+        simulator.stop()
+    return sdx
+
+
+def parse(raw):
+    """Fresh (nodes, links, interfaces) OESS results, as parsed from an OESS response."""
+    return tuple(json.loads(json.dumps(raw[kind])) for kind in ("nodes", "links", "interfaces"))
+
+
+def reference_poll(sdx, results, prev):
+    """Convert the OESS results with the reference, returning the topology and its diff flags."""
+    reference.sdx_config = sdx.sdx_config
+    reference.sdx_topo_conv = sdx.sdx_topo_conv
+    reference.sdx_topology = reference.build_oess_topo(*results)
+    converted = reference.convert_topo(reference.sdx_topology)
+    return converted, reference.check_topo_diff(prev, converted)
+
+
+def sdx_poll(sdx, results, reset=False):
+    """Convert the OESS results with sdx.py as a refresh does, from scratch if reset.
+
+    Returns the topology and its diff flags.
+    """
+    if reset:
+        sdx.conv_cache = {"key": None, "nodes": {}, "ports": {}, "links": {}}
+        sdx.sdx_topology = None
+    sdx.sdx_topology = sdx.build_oess_topo(*results, prev=sdx.sdx_topology)
+    sdx.resolve_config_index(sdx.sdx_topology)
+    converted, _, diff_admin, diff_oper = sdx.convert_topo_incremental(sdx.sdx_topology)
+    return converted, (diff_admin, diff_oper)
+
+
+def change(raw, rng, fraction):
+    """Change the operational state of a fraction of the raw interfaces and links."""
+    for intf in rng.sample(raw["interfaces"], max(1, int(len(raw["interfaces"]) * fraction))):
+        intf["operational_state"] = "down" if intf.get("operational_state") == "up" else "up"
+    for link in rng.sample(raw["links"], max(1, int(len(raw["links"]) * fraction))):
+        link["status"] = "down" if link.get("status") == "up" else "up"
+
+
+def time_no_gc(func, *args):
+    """Time a call of func(*args), with the cyclic GC paused."""
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def time_poll(poll, raw, repeat, before=None):
+    """Median time of poll(results) on freshly parsed results.
+
+    before(raw) runs ahead of each poll, untimed.
+    """
+    durations = []
+    for _ in range(repeat):
+        if before is not None:
+            before(raw)
+        durations.append(time_no_gc(poll, parse(raw)))
+    return statistics.median(durations)
+
+
+def time_ports_links(sdx, raw, repeat):
+    """Median times of the port and link conversion alone, of the reference and of sdx.py."""
+    reference_topo = reference.build_oess_topo(*parse(raw))
+    sdx_topo = sdx.build_oess_topo(*parse(raw))
+    sdx.resolve_config_index(sdx_topo)
+    interfaces = list(sdx_topo["intf_by_id"].values())
+
+    def convert_reference():
+        [reference.get_sdx_port(interface) for interface in reference_topo["intf_by_id"].values()]
+        [reference.get_sdx_link(link) for link in reference_topo["links"]]
+
+    def convert_sdx():
+        sdx.get_sdx_ports_bulk(sdx_topo, interfaces)
+        sdx.get_sdx_links_bulk(sdx_topo, sdx_topo["links"])
+
+    reference.sdx_topology = reference_topo
+    return (
+        statistics.median(time_no_gc(convert_reference) for _ in range(repeat)),
+        statistics.median(time_no_gc(convert_sdx) for _ in range(repeat)),
+    )
+
+
+def check(name, expected, actual):
+    """Compare two conversions, key order included."""
+    same = json.dumps(expected) == json.dumps(actual)
+    print("%-36s %s" % (name, "ok" if same else "MISMATCH"))
+    return same
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nodes", type=int, default=500)
+    parser.add_argument("--interfaces", type=int, default=20, help="interfaces per node")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--varied", action="store_true", help="time the varied topology")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    raw = diversify(build_topology(args.nodes, args.interfaces), rng)
+    sdx = load_topology(raw, get_config(raw, rng))
+    print("nodes=%d interfaces=%d links=%d" % (len(raw["nodes"]), len(raw["interfaces"]), len(raw["links"])))
+
+    expected, _ = reference_poll(sdx, parse(raw), sdx.sdx_topo_conv)
+    actual, _ = sdx_poll(sdx, parse(raw), reset=True)
+    ok = check("topology (full conversion)", expected, actual)
+    # change some interfaces and links: only those are converted again
+    for intf in rng.sample(raw["interfaces"], len(raw["interfaces"]) // 20):
+        intf["operational_state"] = rng.choice(["up", "down"])
+        intf["mpls_vlan_tag_range"] = rng.choice(VLAN_RANGES[:3])
+    for link in rng.sample(raw["links"], len(raw["links"]) // 20):
+        link["status"] = rng.choice(["up", "down"])
+    raw["links"].pop()
+    raw["interfaces"].remove(next(intf for intf in raw["interfaces"] if intf["int_role"] != "trunk"))
+    sdx.sdx_topo_conv = actual
+    expected = reference_poll(sdx, parse(raw), actual)
+    actual = sdx_poll(sdx, parse(raw))
+    ok &= check("topology (incremental conversion)", expected[0], actual[0])
+    ok &= check("diff flags (incremental conversion)", expected[1], actual[1])
+    if not ok:
+        sys.exit(1)
+
+    if not args.varied:
+        raw = build_topology(args.nodes, args.interfaces)
+        sdx = load_topology(raw, {})
+    prev = sdx.sdx_topo_conv
+
+    print("%-28s %12s %12s %9s" % ("poll", "reference", "sdx.py", "speedup"))
+    for name, reference_time, sdx_time in [
+        ("full conversion",
+         time_poll(lambda results: reference_poll(sdx, results, prev), raw, args.repeat),
+         time_poll(lambda results: sdx_poll(sdx, results, reset=True), raw, args.repeat)),
+        ("unchanged",
+         time_poll(lambda results: reference_poll(sdx, results, prev), raw, args.repeat),
+         time_poll(lambda results: sdx_poll(sdx, results), raw, args.repeat)),
+        ("1% changed",
+         time_poll(lambda results: reference_poll(sdx, results, prev), raw, args.repeat,
+                   lambda raw: change(raw, rng, 0.01)),
+         time_poll(lambda results: sdx_poll(sdx, results), raw, args.repeat, lambda raw: change(raw, rng, 0.01))),
+        ("ports and links only",) + time_ports_links(sdx, raw, args.repeat),
+    ]:
+        print("%-28s %10.1fms %10.1fms %8.2fx" % (
+            name, reference_time * 1000, sdx_time * 1000, reference_time / sdx_time
+        ))
+
+
+if __name__ == "__main__":
+    main()
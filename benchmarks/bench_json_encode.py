@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Benchmark topology serialization: whole-document vs streamed JSON.
+
+Compares encode time, time to first byte and peak memory of the
+serialized body built at once (as jsonify does) and of the streamed
+response (json_streaming), with the stdlib encoder and with orjson when
+installed (json_fast_encoder).
+"""
+import argparse
+import statistics
+import time
+import tracemalloc
+
+from common import load_sdx
+from oess_simulator import OessSimulator, build_topology
+
+
+def measure(func, repeat):
+    """Return (median seconds, median seconds to first chunk, peak bytes)."""
+    durations, first_chunks = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        first_chunk = None
+        for _ in func():
+            # chunks are discarded as a WSGI server writing them to the socket
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - start
+        durations.append(time.perf_counter() - start)
+        first_chunks.append(first_chunk)
+    tracemalloc.start()
+    for _ in func():
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(durations), statistics.median(first_chunks), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nodes", type=int, default=500)
+    parser.add_argument("--interfaces", type=int, default=20, help="interfaces per node")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    raw = build_topology(args.nodes, args.interfaces)
+    simulator = OessSimulator(raw).start()
+    try:
+        sdx = load_sdx(simulator.url)
+        sdx.refresh_topology()
+    finally:
+        simulator.stop()
+    topo = sdx.sdx_topo_conv
+
+    encoders = [("stdlib", False)]
+    if sdx.orjson is not None:
+        encoders.append(("orjson", True))
+    print("nodes=%d ports=%d links=%d" % (
+        len(topo["nodes"]), sum(len(node["ports"]) for node in topo["nodes"]), len(topo["links"])
+    ))
+    print("%-18s %10s %12s %10s" % ("mode", "encode", "first byte", "peak MB"))
+    for name, fast in encoders:
+        sdx.sdx_config["json_fast_encoder"] = fast
+        encode = sdx.get_json_encoder()
+        for mode, func in [
+            ("whole", lambda: [encode(topo)]),
+            ("streamed", lambda: sdx.iter_topology_json(topo)),
+        ]:
+            duration, first_chunk, peak = measure(func, args.repeat)
+            print("%-18s %8.1fms %10.1fms %10.2f" % (
+                "%s %s" % (name, mode), duration * 1000, first_chunk * 1000, peak / 2**20
+            ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""Load test of the oess-sdx API against the local OESS simulator.
+
+Runs each scenario for a fixed duration with concurrent clients and
+reports throughput and p50/p99 latency per route. By default sdx.py is
+served in-process by a threaded WSGI server; use --url to target a
+running instance (e.g. gunicorn, sync or gevent workers) instead.
+
+The in-process instance uses the refresh intervals of
+template-sdx_config.yml; override any config key with --set, e.g.
+--set topology_refresh_interval=0 --set circuit_refresh_interval=0 to
+fetch everything from OESS on each request.
+
+Circuits created by the benchmark use VLANs from 4094 downwards, away
+from the ones of the simulator's pre-built circuits. Every create in
+flight has its own VLAN, released once its circuit is removed, so
+concurrent clients never ask for a VLAN already used on a port. Latencies
+are of the successful requests; failed ones are counted per status.
+"""
+import argparse
+import collections
+import itertools
+import queue
+import random
+import statistics
+import threading
+import time
+
+import requests
+import yaml
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from common import load_sdx
+from oess_simulator import OessSimulator, build_topology
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class LoadContext:
+    """State shared by the clients of a run."""
+
+    def __init__(self, url, ports, service_ids):
+        self.url = url
+        self.ports = ports
+        self.service_ids = service_ids
+        self.counter = itertools.count()
+        # VLANs neither used by a create in flight nor left by a circuit that could not be removed
+        self.free_vlans = queue.Queue()
+        for vlan in range(4094, 2094, -1):
+            self.free_vlans.put(vlan)
+
+    def next_endpoints(self):
+        """Pick a name, a pair of ports and a VLAN used by no other client, until release_vlan()."""
+        n = next(self.counter)
+        pair = n % len(self.ports)
+        try:
+            vlan = self.free_vlans.get(timeout=30)
+        except queue.Empty:
+            raise RuntimeError("No free VLAN left: too many circuits could not be removed")
+        return n, self.ports[pair], self.ports[(pair + 1) % len(self.ports)], vlan
+
+    def release_vlan(self, vlan):
+        self.free_vlans.put(vlan)
+
+
+def timed(results, route, func, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        res = func(*args, **kwargs)
+        status = res.status_code
+    except requests.RequestException:
+        res, status = None, None
+    results.append((route, status, time.perf_counter() - start))
+    return res
+
+
+def scenario_topology(session, ctx, results):
+    timed(results, "GET /topology/2.0.0", session.get, ctx.url + "/topology/2.0.0")
+
+
+def scenario_l2vpn_list(session, ctx, results):
+    timed(results, "GET /l2vpn/1.0", session.get, ctx.url + "/l2vpn/1.0")
+
+
+def scenario_l2vpn_get(session, ctx, results):
+    service_id = random.choice(ctx.service_ids)
+    timed(results, "GET /l2vpn/1.0/<id>", session.get, "%s/l2vpn/1.0/%s" % (ctx.url, service_id))
+
+
+def scenario_l2vpn_crud(session, ctx, results):
+    n, port_a, port_z, vlan = ctx.next_endpoints()
+    payload = {
+        "name": "load%d" % n,
+        "endpoints": [{"port_id": port_a, "vlan": str(vlan)}, {"port_id": port_z, "vlan": str(vlan)}],
+    }
+    res = timed(results, "POST /l2vpn/1.0", session.post, ctx.url + "/l2vpn/1.0", json=payload)
+    if res is None or res.status_code != 201:
+        ctx.release_vlan(vlan)
+        return
+    service_id = res.json()["service_id"]
+    res = timed(results, "DELETE /l2vpn/1.0/<id>", session.delete, "%s/l2vpn/1.0/%s" % (ctx.url, service_id))
+    if res is not None and res.status_code == 200:
+        ctx.release_vlan(vlan)
+
+
+def scenario_l2vpn_ptp(session, ctx, results):
+    n, port_a, port_z, vlan = ctx.next_endpoints()
+    name = "load-ptp%d" % n
+    payload = {
+        "name": name,
+        "uni_a": {"port_id": port_a, "tag": {"value": vlan}},
+        "uni_z": {"port_id": port_z, "tag": {"value": vlan}},
+    }
+    res = timed(results, "POST /v1/l2vpn_ptp", session.post, ctx.url + "/v1/l2vpn_ptp", json=payload)
+    if res is None or res.status_code != 201:
+        ctx.release_vlan(vlan)
+        return
+    payload = {
+        "name": name,
+        "uni_a": {"interface_id": port_a, "tag": {"value": vlan}},
+        "uni_z": {"interface_id": port_z, "tag": {"value": vlan}},
+    }
+    res = timed(results, "DELETE /v1/l2vpn_ptp", session.delete, ctx.url + "/v1/l2vpn_ptp", json=payload)
+    if res is not None and res.status_code == 200:
+        ctx.release_vlan(vlan)
+
+
+def scenario_admin_maps(session, ctx, results):
+    timed(results, "GET /admin/oess2sdx", session.get, ctx.url + "/admin/oess2sdx")
+    timed(results, "GET /admin/sdx2oess?node", session.get, ctx.url + "/admin/sdx2oess?node=node1&limit=100")
+
+
+SCENARIOS = {
+    "topology": scenario_topology,
+    "l2vpn-list": scenario_l2vpn_list,
+    "l2vpn-get": scenario_l2vpn_get,
+    "l2vpn-crud": scenario_l2vpn_crud,
+    "l2vpn-ptp": scenario_l2vpn_ptp,
+    "admin-maps": scenario_admin_maps,
+}
+
+
+def run_scenario(scenario, ctx, concurrency, duration):
+    """Run scenario from `concurrency` clients for `duration` seconds."""
+    results = []
+    deadline = time.monotonic() + duration
+
+    def client():
+        session = requests.Session()
+        local = []
+        while time.monotonic() < deadline:
+            scenario(session, ctx, local)
+        results.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.monotonic() - start
+
+
+def get_setup_json(url, attempts=20):
+    """GET url, retrying while OESS errors are injected."""
+    for _ in range(attempts):
+        res = requests.get(url)
+        if res.status_code == 200:
+            return res.json()
+    raise RuntimeError("GET %s failed: %s" % (url, res.text))
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def report(name, results, elapsed):
+    """Print the throughput and latencies of the successful requests, and the failed ones by status."""
+    routes = {}
+    for route, status, latency in results:
+        routes.setdefault(route, []).append((status, latency))
+    for route, samples in routes.items():
+        latencies = sorted(latency for status, latency in samples if status in (200, 201))
+        errors = collections.Counter(status for status, _ in samples if status not in (200, 201))
+        if latencies:
+            stats = "%9.1f %9.1f %9.1f %9.1f" % (
+                len(latencies) / elapsed, percentile(latencies, 0.5) * 1000,
+                percentile(latencies, 0.99) * 1000, statistics.mean(latencies) * 1000,
+            )
+        else:
+            stats = "%9s %9s %9s %9s" % ("-", "-", "-", "-")
+        print("%-12s %-26s %8d %s %7d  %s" % (
+            name, route, len(latencies), stats, sum(errors.values()),
+            " ".join("%s:%d" % (status or "none", count) for status, count in sorted(errors.items(), key=str)) or "-",
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="oess-sdx base URL (default: serve sdx.py in-process)")
+    parser.add_argument("--nodes", type=int, default=50)
+    parser.add_argument("--interfaces", type=int, default=8, help="interfaces per node")
+    parser.add_argument("--circuits", type=int, default=500, help="circuits pre-built in the simulator")
+    parser.add_argument("--latency", type=float, default=0.01, help="OESS latency per call (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of failed OESS calls")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per scenario")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="sdx_config.yml setting")
+    parser.add_argument("--scenarios", nargs="*", default=list(SCENARIOS), choices=list(SCENARIOS))
+    args = parser.parse_args()
+
+    simulator = server = None
+    url = args.url
+    if url is None:
+        simulator = OessSimulator(
+            build_topology(args.nodes, args.interfaces, args.circuits),
+            latency=args.latency,
+            error_rate=args.error_rate,
+        ).start()
+        config = {"topology_refresh_interval": 30, "circuit_refresh_interval": 60}
+        for setting in args.set:
+            key, _, value = setting.partition("=")
+            config[key] = yaml.safe_load(value)
+        sdx = load_sdx(simulator.url, **config)
+        server = make_server("127.0.0.1", 0, sdx.app, threaded=True, request_handler=QuietRequestHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = "http://127.0.0.1:%s" % server.server_port
+    try:
+        topo = get_setup_json(url + "/topology/2.0.0?refresh=1")
+        ports = [port["id"] for node in topo["nodes"] for port in node["ports"] if not port["nni"]]
+        service_ids = list(get_setup_json(url + "/l2vpn/1.0")) or [0]
+        ctx = LoadContext(url, ports, service_ids)
+        print("url=%s ports=%d circuits=%d concurrency=%d duration=%.0fs" % (
+            url, len(ports), len(service_ids), args.concurrency, args.duration
+        ))
+        print("%-12s %-26s %8s %9s %9s %9s %9s %7s  %s" % (
+            "scenario", "route", "ok", "ok/s", "p50 ms", "p99 ms", "mean ms", "errors", "by status"
+        ))
+        for name in args.scenarios:
+            results, elapsed = run_scenario(SCENARIOS[name], ctx, args.concurrency, args.duration)
+            report(name, results, elapsed)
+    finally:
+        if server is not None:
+            server.shutdown()
+        if simulator is not None:
+            simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
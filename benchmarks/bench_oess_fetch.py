@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Benchmark OESS topology fetch: serial bare requests vs get_oess_topo().
+
+The legacy path issues the three topology calls one after another with
+bare requests.get (new connection and auth for each call); get_oess_topo()
+runs them concurrently over the shared pooled session. With --sources N,
+N simulated OESS instances are aggregated (oess_sources) and fetched
+concurrently, against fetching them one after another.
+"""
+import argparse
+import statistics
+
+import requests
+
+from common import load_sdx, timeit
+from oess_simulator import OessSimulator, build_topology
+
+
+def legacy_fetch(sdx, oess_url):
+    """Fetch the topology the way sdx.py did before the pooled session."""
+    cfg = sdx.sdx_config
+    auth = (cfg["username"], cfg["password"])
+    for path in [
+        "/services/data.cgi?method=get_all_node_status",
+        "/services/data.cgi?method=get_all_link_status",
+        "/services/interface.cgi?method=get_workgroup_interfaces&workgroup_id=%s" % cfg["workgroup_id"],
+    ]:
+        requests.get(oess_url + path, verify=False, auth=auth, timeout=30).json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.1, help="OESS latency per call (s)")
+    parser.add_argument("--nodes", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--sources", type=int, default=1, help="OESS instances aggregated with oess_sources")
+    args = parser.parse_args()
+
+    simulators = [
+        OessSimulator(build_topology(args.nodes), latency=args.latency).start() for _ in range(args.sources)
+    ]
+    config = {}
+    if args.sources > 1:
+        config["oess_sources"] = [
+            {"name": "oess%d" % idx, "oess_url": simulator.url, "workgroup_id": 1}
+            for idx, simulator in enumerate(simulators)
+        ]
+    sdx = load_sdx(simulators[0].url, **config)
+    try:
+        legacy = timeit(lambda: [legacy_fetch(sdx, simulator.url) for simulator in simulators], args.repeat)
+        pooled = timeit(sdx.get_oess_topo, args.repeat)
+    finally:
+        for simulator in simulators:
+            simulator.stop()
+    print("OESS latency per call: %.3fs, nodes=%d, sources=%d" % (args.latency, args.nodes, args.sources))
+    print("legacy serial fetch:   median %.3fs" % statistics.median(legacy))
+    print("concurrent pooled:     median %.3fs" % statistics.median(pooled))
+    print("speedup: %.2fx" % (statistics.median(legacy) / statistics.median(pooled)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Benchmark memory and GC cost of the OESS topology model.
+
+The legacy model kept the raw OESS dicts and linked them with cyclic
+references (node <-> interfaces, interface <-> link); build_oess_topo()
+keeps slotted objects referring to each other by id.
+"""
+import argparse
+import gc
+import json
+import statistics
+import time
+import tracemalloc
+
+from common import load_sdx
+from oess_simulator import OessSimulator, build_topology
+
+
+def legacy_build(nodes, links, interfaces):
+    """Build the topology the way get_oess_topo() did before the slotted model."""
+    topo = {"node_by_id": {}, "link_by_id": {}, "intf_by_id": {}}
+    topo["nodes"] = nodes
+    topo["links"] = links
+    for node in topo["nodes"]:
+        topo["node_by_id"][node["node_id"]] = node
+        node["interfaces"] = []
+    for intf in interfaces:
+        topo["intf_by_id"][intf["interface_id"]] = intf
+        node = topo["node_by_id"][intf["node_id"]]
+        node["interfaces"].append(intf)
+        intf["node"] = node
+    for link in topo["links"]:
+        topo["link_by_id"][link["link_id"]] = link
+        topo["intf_by_id"][link["interface_a_id"]]["link"] = link
+        topo["intf_by_id"][link["interface_z_id"]]["link"] = link
+        link["interface_a"] = topo["intf_by_id"][link["interface_a_id"]]
+        link["interface_z"] = topo["intf_by_id"][link["interface_z_id"]]
+    return topo
+
+
+def measure(build, payloads, repeat):
+    """Return (retained bytes, peak bytes, gc.collect seconds, cyclic garbage objects)."""
+    gc.collect()
+    tracemalloc.start()
+    # parse the OESS responses as sdx.py does, so both models pay the same cost
+    topo = build(*[json.loads(payload) for payload in payloads])
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        gc.collect()
+        durations.append(time.perf_counter() - start)
+    # objects only the cyclic GC can free once the topology is replaced
+    del topo
+    garbage = gc.collect()
+    return retained, peak, statistics.median(durations), garbage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nodes", type=int, default=500)
+    parser.add_argument("--interfaces", type=int, default=20, help="interfaces per node")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    raw = build_topology(args.nodes, args.interfaces)
+    simulator = OessSimulator(build_topology(2, 2)).start()
+    try:
+        sdx = load_sdx(simulator.url)
+    finally:
+        simulator.stop()
+    payloads = [json.dumps(raw[key]) for key in ("nodes", "links", "interfaces")]
+    print("nodes=%d interfaces=%d links=%d" % (len(raw["nodes"]), len(raw["interfaces"]), len(raw["links"])))
+    print("%-12s %12s %12s %12s %14s" % ("model", "retained MB", "peak MB", "gc.collect", "cyclic garbage"))
+    for name, build in [("legacy", legacy_build), ("slotted", sdx.build_oess_topo)]:
+        retained, peak, collect, garbage = measure(build, payloads, args.repeat)
+        print("%-12s %12.2f %12.2f %10.1fms %14d" % (name, retained / 2**20, peak / 2**20, collect * 1000, garbage))
+
+
+if __name__ == "__main__":
+    main()
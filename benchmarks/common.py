@@ -0,0 +1,43 @@
+"""Helpers shared by the benchmark scripts."""
+import importlib
+import os
+import sys
+import tempfile
+import time
+
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_sdx(oess_url, **config):
+    """Import sdx.py configured against the given OESS URL."""
+    sdx_config = {
+        "oxp_name": "BenchOXP",
+        "oxp_url": "bench-oxp.net",
+        "model_version": "2.0.0",
+        "oess_url": oess_url,
+        "username": "admin",
+        "password": "admin",
+        "workgroup_id": "1",
+    }
+    sdx_config.update(config)
+    fd, path = tempfile.mkstemp(prefix="oess_sdx_bench_", suffix=".yml")
+    with os.fdopen(fd, "w") as config_file:
+        yaml.safe_dump(sdx_config, config_file)
+    os.environ["OESS_SDX_CONFIG"] = path
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    if "sdx" in sys.modules:
+        return importlib.reload(sys.modules["sdx"])
+    return importlib.import_module("sdx")
+
+
+def timeit(func, repeat=5):
+    """Run func `repeat` times and return the list of durations (seconds)."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
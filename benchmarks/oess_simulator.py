@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""Local OESS stand-in used by the benchmarks.
+
+Serves the OESS services used by sdx.py (data.cgi, interface.cgi and
+circuit.cgi) with a synthetic topology and circuits, an optional
+per-request latency and optional error injection.
+"""
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+NAME_PREFIX = "OESS-SDX-L2VPN--"
+TIMESTAMP = "01/01/2025 00:00:00"
+
+
+def build_topology(num_nodes=10, intfs_per_node=4, num_circuits=0):
+    """Build a synthetic OESS topology: a chain of nodes linked by trunks.
+
+    Circuits connect access interfaces of consecutive nodes, each with its
+    own VLAN.
+    """
+    nodes, interfaces, links = [], [], []
+    for node_id in range(1, num_nodes + 1):
+        nodes.append({
+            "node_id": node_id,
+            "name": "node%d" % node_id,
+            "latitude": "10.0",
+            "longitude": "-20.0",
+            "operational_state": "up",
+            "admin_state": "active",
+            "in_maint": "no",
+        })
+        for idx in range(intfs_per_node):
+            interfaces.append({
+                "interface_id": node_id * 1000 + idx,
+                "node_id": node_id,
+                "name": "et-0/0/%d" % idx,
+                "description": "interface %d" % idx,
+                "bandwidth": "100000",
+                "mtu": "9000",
+                "operational_state": "up",
+                # the first two interfaces connect the chain
+                "int_role": "trunk" if idx < 2 else "access",
+                "mpls_vlan_tag_range": "1-4095",
+            })
+    for node_id in range(1, num_nodes):
+        links.append({
+            "link_id": node_id,
+            "name": "link%d" % node_id,
+            "interface_a_id": node_id * 1000 + 1,
+            "interface_z_id": (node_id + 1) * 1000,
+            "status": "up",
+            "link_state": "active",
+        })
+    topology = {"nodes": nodes, "interfaces": interfaces, "links": links, "circuits": []}
+    node_names = {node["node_id"]: node["name"] for node in nodes}
+    graph = get_link_graph(topology)
+    access = [intf for intf in interfaces if intf["int_role"] == "access"]
+    if num_circuits and len(access) < 2:
+        raise ValueError("at least two access interfaces are needed to build circuits")
+    for idx in range(num_circuits):
+        # spread circuits over consecutive pairs of access interfaces, then VLANs
+        pair, vlan = divmod(idx, 4000)
+        intf_a = access[pair % len(access)]
+        intf_z = access[(pair + 1) % len(access)]
+        topology["circuits"].append(make_circuit(
+            100000 + idx,
+            NAME_PREFIX + "bench%d" % idx,
+            [(intf_a, node_names[intf_a["node_id"]], vlan + 2), (intf_z, node_names[intf_z["node_id"]], vlan + 2)],
+            get_path_links(graph, intf_a["node_id"], intf_z["node_id"]),
+        ))
+    return topology
+
+
+def get_link_graph(topology):
+    """Adjacency {node_id: [(node_id, link)]} of the topology links."""
+    intf_nodes = {intf["interface_id"]: intf["node_id"] for intf in topology["interfaces"]}
+    graph = {}
+    for link in topology["links"]:
+        node_a, node_z = intf_nodes[link["interface_a_id"]], intf_nodes[link["interface_z_id"]]
+        graph.setdefault(node_a, []).append((node_z, link))
+        graph.setdefault(node_z, []).append((node_a, link))
+    return graph
+
+
+def get_path_links(graph, node_a, node_z):
+    """Links of a shortest path between two nodes (BFS), empty if unreachable."""
+    parents = {node_a: None}
+    queue = [node_a]
+    for node in queue:
+        if node == node_z:
+            break
+        for neighbor, link in graph.get(node, []):
+            if neighbor not in parents:
+                parents[neighbor] = (node, link)
+                queue.append(neighbor)
+    links = []
+    node = node_z
+    while parents.get(node):
+        node, link = parents[node]
+        links.append(link)
+    return links[::-1]
+
+
+def make_circuit(circuit_id, description, endpoints, links=()):
+    """Build an OESS circuit from (interface, node name, vlan) endpoints and the links of its path."""
+    return {
+        "circuit_id": circuit_id,
+        "description": description,
+        "state": "active",
+        "created_on": TIMESTAMP,
+        "last_modified_on": TIMESTAMP,
+        "endpoints": [
+            {
+                "interface_id": intf["interface_id"],
+                "interface": intf["name"],
+                "node": node_name,
+                "tag": str(vlan),
+            }
+            for intf, node_name, vlan in endpoints
+        ],
+        "links": [{"link_id": link["link_id"], "name": link["name"]} for link in links],
+    }
+
+
+class OessSimulator:
+    """OESS stand-in running on a local HTTP server thread.
+
+    latency: seconds added to every request (plus up to `jitter` seconds).
+    error_rate: fraction of requests answered with an HTTP 500 error,
+    restricted to `error_methods` when given.
+    """
+
+    def __init__(
+        self, topology=None, latency=0.0, host="127.0.0.1", port=0,
+        jitter=0.0, error_rate=0.0, error_methods=None, seed=None,
+    ):
+        self.topology = topology or build_topology()
+        self.topology.setdefault("circuits", [])
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_methods = set(error_methods) if error_methods else None
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+        self.circuits = {circuit["circuit_id"]: circuit for circuit in self.topology["circuits"]}
+        self.next_circuit_id = itertools.count(max(self.circuits, default=100000) + 1)
+        node_names = {node["node_id"]: node["name"] for node in self.topology["nodes"]}
+        self.intf_by_name = {
+            (node_names[intf["node_id"]], intf["name"]): intf for intf in self.topology["interfaces"]
+        }
+        self.graph = get_link_graph(self.topology)
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return "http://%s:%s/oess" % (host, port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def should_fail(self, method):
+        if not self.error_rate:
+            return False
+        if self.error_methods is not None and method not in self.error_methods:
+            return False
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def handle(self, method, params):
+        """Return (status_code, payload) for an OESS method."""
+        if self.should_fail(method):
+            with self.lock:
+                self.errors += 1
+            return 500, {"error": 1, "error_text": "injected error"}
+        if method == "get_all_node_status":
+            return 200, {"results": self.topology["nodes"]}
+        if method == "get_all_link_status":
+            return 200, {"results": self.topology["links"]}
+        if method == "get_workgroup_interfaces":
+            return 200, {"results": self.topology["interfaces"]}
+        if method == "get":
+            return self.get_circuits(params)
+        if method == "provision":
+            return self.provision_circuit(params)
+        if method == "remove":
+            return self.remove_circuit(params)
+        return 400, {"error": 1, "error_text": "unknown method %s" % method}
+
+    def get_circuits(self, params):
+        circuit_id = params.get("circuit_id", [None])[0]
+        with self.lock:
+            if circuit_id is None:
+                return 200, {"results": list(self.circuits.values())}
+            circuit = self.circuits.get(int(circuit_id))
+        return 200, {"results": [circuit] if circuit else []}
+
+    def provision_circuit(self, params):
+        endpoints = []
+        for endpoint in params.get("endpoint", []):
+            try:
+                endpoint = json.loads(endpoint)
+            except ValueError:
+                return 200, {"error": 1, "error_text": "invalid endpoint %s" % endpoint}
+            intf = self.intf_by_name.get((endpoint["node"], endpoint["interface"]))
+            if intf is None:
+                return 200, {"error": 1, "error_text": "unknown interface %s" % endpoint["interface"]}
+            endpoints.append((intf, endpoint["node"], endpoint["tag"]))
+        if len(endpoints) < 2:
+            return 200, {"error": 1, "error_text": "circuit needs at least two endpoints"}
+        circuit_id = next(self.next_circuit_id)
+        path = get_path_links(self.graph, endpoints[0][0]["node_id"], endpoints[-1][0]["node_id"])
+        circuit = make_circuit(circuit_id, params.get("description", [""])[0], endpoints, path)
+        with self.lock:
+            self.circuits[circuit_id] = circuit
+        return 200, {"success": 1, "circuit_id": circuit_id}
+
+    def remove_circuit(self, params):
+        with self.lock:
+            circuit = self.circuits.pop(int(params.get("circuit_id", ["0"])[0]), None)
+        if circuit is None:
+            return 200, {"error": 1, "error_text": "circuit not found"}
+        return 200, {"results": [{"success": 1}]}
+
+    def _make_handler(self):
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are written separately, avoid delayed ACK stalls
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _dispatch(self, params):
+                with simulator.lock:
+                    simulator.requests += 1
+                    delay = simulator.latency
+                    if simulator.jitter:
+                        delay += simulator.random.uniform(0, simulator.jitter)
+                if delay:
+                    time.sleep(delay)
+                method = params.get("method", [""])[0]
+                status, payload = simulator.handle(method, params)
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._dispatch(parse_qs(urlparse(self.path).query))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                params = parse_qs(self.rfile.read(length).decode())
+                params.update(parse_qs(urlparse(self.path).query))
+                self._dispatch(params)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8181)
+    parser.add_argument("--nodes", type=int, default=10)
+    parser.add_argument("--interfaces", type=int, default=4, help="interfaces per node")
+    parser.add_argument("--circuits", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="max extra seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of failed requests")
+    parser.add_argument("--error-methods", nargs="*", help="OESS methods subject to errors (default all)")
+    args = parser.parse_args()
+    simulator = OessSimulator(
+        build_topology(args.nodes, args.interfaces, args.circuits),
+        latency=args.latency,
+        port=args.port,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_methods=args.error_methods,
+    )
+    print("OESS simulator listening on %s" % simulator.url)
+    simulator.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""Frozen copy of the original per-object topology converter of sdx.py.
+
+Kept as the reference the benchmarks check the converter of sdx.py
+against (same SDX topology and the same admin/oper diff flags) and
+report their speedups against. Do not optimize it: it is the baseline.
+Only the OESS fetch of get_oess_topo() is replaced by build_oess_topo(),
+which builds the same linked dicts from the raw OESS results.
+"""
+from datetime import datetime, timezone
+
+oess2sdx = {}
+sdx2oess = {}
+sdx_config = None
+sdx_topology = None
+sdx_topo_conv = {"links": [], "nodes": []}
+
+
+def utcnow():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def build_oess_topo(nodes, links, interfaces):
+    """Link the raw OESS nodes, links and interfaces (modified in place), as get_oess_topo() did."""
+    topo = {"node_by_id": {}, "link_by_id": {}, "intf_by_id": {}}
+    topo["nodes"] = nodes
+    topo["links"] = links
+    for node in topo["nodes"]:
+        topo["node_by_id"][node["node_id"]] = node
+        node["interfaces"] = []
+    for intf in interfaces:
+        topo["intf_by_id"][intf["interface_id"]] = intf
+        node = topo["node_by_id"][intf["node_id"]]
+        node["interfaces"].append(intf)
+        intf["node"] = node
+    for link in topo["links"]:
+        topo["link_by_id"][link["link_id"]] = link
+        topo["intf_by_id"][link["interface_a_id"]]["link"] = link
+        topo["intf_by_id"][link["interface_z_id"]]["link"] = link
+        link["interface_a"] = topo["intf_by_id"][link["interface_a_id"]]
+        link["interface_z"] = topo["intf_by_id"][link["interface_z_id"]]
+    return topo
+
+
+def sanitize_name(name):
+    # TODO
+    return name
+
+
+def get_intf_config(interface):
+    """Get the interface config."""
+    interfaces = sdx_config.get("interfaces", {})
+    if not interfaces or not isinstance(interfaces, dict):
+        return {}
+    intf_name = f"{interface['node']['name']}:{interface['name']}"
+    if intf_name in interfaces:
+        return interfaces[intf_name]
+    return interfaces.get(int(interface["interface_id"]), {})
+
+
+def get_link_config(link):
+    """Get link config"""
+    links = sdx_config.get("links", {})
+    if not links or not isinstance(links, dict):
+        return {}
+    return links.get(int(link["link_id"]), {})
+
+
+def get_interface_mtu(interface):
+    """Function to try to obtain the MTU of an interface."""
+    return get_intf_config(interface).get("mtu", "1500")
+
+
+def get_interface_state(interface):
+    """Function to try to obtain the state of an interface."""
+    config_state = get_intf_config(interface).get("state")
+    if config_state:
+        return config_state
+    return get_object_state(interface)
+
+
+def get_type_port_speed(bandwidth):
+    """
+    Function to try to obtain the speed of an interface.
+    The type enum is 100FE, 1GE, 10GE, 25GE, 40GE, 50GE, 100GE, 400GE, and Other
+    """
+    juniper_bw_mbps_to_type = {
+        "400000": "400GE",
+        "100000": "100GE",
+        "50000": "50GE",
+        "40000": "40GE",
+        "25000": "25GE",
+        "10000": "10GE",
+        "1000": "1GE",
+        "100": "100FE",
+    }
+    return juniper_bw_mbps_to_type.get(bandwidth, "Other")
+
+
+def get_link_bandwidth(link):
+    """Get link bandwidth (Gbps) based on interface speeds (Mbps)."""
+    intfa_bw = int(link["interface_a"]["bandwidth"]) / 100
+    intfz_bw = int(link["interface_z"]["bandwidth"]) / 100
+    return min(intfa_bw, intfz_bw)
+
+
+def get_port_urn(interface):
+   """generate the full urn address for a port"""
+   return "urn:sdx:port:%s:%s:%s" % (sdx_config["oxp_url"], interface["node"]["name"], interface["name"])
+
+
+def get_link_urn_from_interface(interface):
+   """Return the first active link on this interface"""
+   link = sdx_topology["intf_by_id"].get(interface["interface_id"], {}).get("link")
+   if not link:
+       return ""
+   return "urn:sdx:link:%s:%s" % (sdx_config["oxp_url"], get_link_label(link))
+
+
+def get_link_label(link):
+    """Get the link label"""
+    intfa = link["interface_a"]["name"]
+    nodea = link["interface_a"]["node"]["name"]
+    intfz = link["interface_z"]["name"]
+    nodez = link["interface_z"]["node"]["name"]
+    if nodea == nodez:
+        if intfz < intfa:
+            intfa, intfz = intfz, intfa
+    elif nodez < nodea:
+        nodea, nodez = nodez, nodea
+        intfa, intfz = intfz, intfa
+    return "%s/%s_%s/%s" % (nodea, intfa, nodez, intfz)
+
+
+def get_sdx_port(interface):
+    sdx_port = {}
+    sdx_port["id"] = get_port_urn(interface)
+    sdx_port["name"] = interface["name"][:30]
+    sdx_port["node"] = "urn:sdx:node:%s:%s" % (sdx_config["oxp_url"], interface["node"]["name"])
+    sdx_port["type"] = get_type_port_speed(interface["bandwidth"])
+    sdx_port["status"] = get_object_status(interface)
+    sdx_port["state"] = get_interface_state(interface)
+    sdx_port["mtu"] = int(interface["mtu"])
+
+    intf_config = get_intf_config(interface)
+    if interface.get("int_role", "access") == "trunk":
+        sdx_port["nni"] = get_link_urn_from_interface(interface)
+    elif "sdx_nni" in intf_config:
+        sdx_port["nni"] = "urn:sdx:port:" + intf_config["sdx_nni"]
+    else:
+        sdx_port["nni"] = ""
+
+    vlan_range = intf_config.get("sdx_vlan_range")
+    if vlan_range is None:
+        vlan_range = sdx_config.get("overwrite_vlan_range")
+    if vlan_range is None:
+        vlan_range = interface.get("mpls_vlan_tag_range")
+        if vlan_range:
+            vlans = vlan_range.split("-")
+            if len(vlans) == 2 and vlans[0].isdigit() and vlans[1].isdigit():
+                vlan_range = [[int(vlans[0]), int(vlans[1])]]
+            else:
+                vlan_range = None
+        if not vlan_range:
+            vlan_range = [[1, 4095]]
+
+    sdx_port["services"] = {
+        # "l2vpn-ptmp":{"vlan_range": vlan_range}
+    }
+    if vlan_range:
+        sdx_port["services"]["l2vpn-ptp"] = {"vlan_range": vlan_range}
+
+    sdx_port["entities"] = intf_config.get("entities", [])
+
+    sdx_port["private"] = ["status"]
+
+    return sdx_port
+
+
+def get_object_status(obj):
+    """Get object status (up, down, error)."""
+    if any([
+        obj.get("status") == "up",
+        obj.get("operational_state_mpls") == "up",
+        obj.get("operational_state") == "up",
+    ]):
+        return "up"
+    if any([
+        obj.get("status") == "down",
+        obj.get("operational_state_mpls") == "down",
+        obj.get("operational_state") == "down",
+    ]):
+        return "down"
+    return "error"
+
+
+def get_object_state(obj):
+    """Get node state (enabled, disabled)."""
+    if obj.get("in_maint") == "yes":
+        return "maintenance"
+    if obj.get("link_state") == "active" or obj.get("admin_state") in ["active", "up"]:
+        return "enabled"
+    if "int_role" in obj and obj.get("status") == "up":
+        return "enabled"
+    return "disabled"
+
+
+def get_sdx_ports(interfaces):
+    global sdx2oess, oess2sdx
+    sdx_ports = []
+    for interface in interfaces:
+        sdx_ports.append(get_sdx_port(interface))
+        oess2sdx[interface["interface_id"]] = sdx_ports[-1]
+        sdx2oess[sdx_ports[-1]["id"]] = interface
+    return sdx_ports
+
+
+def get_sdx_node(node):
+    sdx_node = {}
+    sdx_node["name"] = sanitize_name(node["name"])
+    sdx_node["id"] = "urn:sdx:node:%s:%s" % (sdx_config["oxp_url"], sdx_node["name"])
+    sdx_node["location"] = {
+        #"address": kytos_node["metadata"].get("address", ""),
+        "latitude": float(node["latitude"]),
+        "longitude": float(node["longitude"]),
+        #"iso3166_2_lvl4": kytos_node["metadata"].get("iso3166_2_lvl4", ""),
+        "private": [],
+    }
+    sdx_node["ports"] = get_sdx_ports(node["interfaces"])
+    sdx_node["status"] = get_object_status(node)
+    sdx_node["state"] = get_object_state(node)
+    return sdx_node
+
+
+def get_sdx_nodes(oess_topo):
+    sdx_nodes = []
+    for node in oess_topo["nodes"]:
+        sdx_nodes.append(get_sdx_node(node))
+    return sdx_nodes
+
+
+def get_sdx_link(link):
+    """generates a dictionary object for every link in a network,
+    and containing all the attributes for each link"""
+    sdx_link = {}
+    sdx_link["name"] = get_link_label(link)
+    sdx_link["id"] = "urn:sdx:link:%s:%s" % (sdx_config["oxp_url"], sdx_link["name"])
+    sdx_link["ports"] = sorted(
+        [
+            get_port_urn(link["interface_a"]),
+            get_port_urn(link["interface_z"]),
+        ]
+    )
+    sdx_link["type"] = "intra"
+    sdx_link["bandwidth"] = get_link_bandwidth(link)
+    link_config = get_link_config(link)
+    sdx_link["residual_bandwidth"] = link_config.get("residual_bandwidth", 100)
+    sdx_link["latency"] = link_config.get("latency", 0)
+    sdx_link["packet_loss"] = link_config.get("packet_loss", 0)
+    sdx_link["availability"] = link_config.get("availability", 0)
+    sdx_link["status"] = get_object_status(link)
+    sdx_link["state"] = get_object_state(link)
+    sdx_link["private"] = ["packet_loss"]
+    return sdx_link
+
+
+def get_sdx_links(oess_topo):
+    sdx_links = []
+    for link in oess_topo["links"]:
+        sdx_links.append(get_sdx_link(link))
+    return sdx_links
+
+def convert_topo(oess_topo):
+    return {
+        "name": sdx_config["oxp_name"],
+        "id": "urn:sdx:topology:%s" % (sdx_config["oxp_url"]),
+        "model_version": sdx_config["model_version"],
+        "nodes": get_sdx_nodes(oess_topo),
+        "links": get_sdx_links(oess_topo),
+        "services": ["l2vpn-ptp"],
+        "timestamp": sdx_topo_conv.get("timestamp", utcnow()),
+        "version": sdx_topo_conv.get("version", 1),
+    }
+
+
+def check_topo_diff(cur_topo, new_topo):
+    diff_admin, diff_oper = False, False
+
+    #
+    # Nodes
+    #
+    remain_nodes = {}
+    for node in cur_topo["nodes"]:
+        remain_nodes[node["id"]] = node
+    for new_node in new_topo["nodes"]:
+        # node was added
+        cur_node = remain_nodes.pop(new_node["id"], None)
+        if not cur_node:
+            diff_admin = True
+            continue
+        if any([
+            new_node["location"] != cur_node["location"],
+            new_node["state"] != cur_node["state"],
+        ]):
+            diff_admin = True
+        if any([
+            new_node["status"] != cur_node["status"],
+        ]):
+            diff_oper = True
+
+        #
+        # Node > Ports
+        #
+        remain_ports = {}
+        for port in cur_node["ports"]:
+            remain_ports[port["id"]] = port
+        for new_port in new_node["ports"]:
+            cur_port = remain_ports.pop(new_port["id"], None)
+            if not cur_port:
+                diff_admin = True
+                continue
+            if any([
+                new_port["mtu"] != cur_port["mtu"],
+                new_port["nni"] != cur_port["nni"],
+                new_port["services"] != cur_port["services"],
+                new_port["state"] != cur_port["state"],
+                new_port["type"] != cur_port["type"],
+                new_port["private"] != cur_port["private"],
+            ]):
+                diff_admin = True
+            if any([
+                new_port["status"] != cur_port["status"],
+            ]):
+                diff_oper = True
+        # ports removed
+        if remain_ports:
+            diff_admin = True
+    # nodes removed
+    if remain_nodes:
+        diff_admin = True
+
+    #
+    # Links
+    #
+    remain_links = {}
+    for link in cur_topo["links"]:
+        remain_links[link["id"]] = link
+    for new_link in new_topo["links"]:
+        # link was added
+        cur_link = remain_links.pop(new_link["id"], None)
+        if not cur_link:
+            diff_admin = True
+            continue
+        if any([
+            new_link["bandwidth"] != cur_link["bandwidth"],
+            new_link["ports"] != cur_link["ports"],
+            new_link["state"] != cur_link["state"],
+        ]):
+            diff_admin = True
+        if any([
+            new_link["status"] != cur_link["status"],
+        ]):
+            diff_oper = True
+    # links removed
+    if remain_links:
+        diff_admin = True
+
+    return diff_admin, diff_oper
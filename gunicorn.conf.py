@@ -0,0 +1,14 @@
+"""Gunicorn settings for oess-sdx (loaded automatically from the working directory).
+
+Set OESS_SDX_ASYNC=1 to serve with cooperative (gevent) workers: OESS calls
+yield to other requests instead of pinning a worker thread for up to the
+OESS timeout, so one process can hold hundreds of in-flight requests.
+"""
+import os
+
+if os.environ.get("OESS_SDX_ASYNC", "0").lower() in ["1", "true", "yes"]:
+    worker_class = "gevent"
+    worker_connections = int(os.environ.get("OESS_SDX_WORKER_CONNECTIONS", "1000"))
+    # a cooperative worker serves many requests, a couple of them is enough
+    workers = int(os.environ.get("OESS_SDX_WORKERS", "2"))
+    timeout = int(os.environ.get("OESS_SDX_WORKER_TIMEOUT", "120"))
@@ -1,87 +1,951 @@
 #!/bin/usr/python3
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from datetime import datetime, timezone
 import requests
 import traceback
+import gzip
 import sys
 import re
 import os
+import time
+import threading
+import collections
+import hashlib
+import bisect
+import json
+import sqlite3
+import fcntl
+import socket
 import yaml
 import urllib3
+import types
+import zlib
+import uuid
+import atexit
+import queue
+import logging.handlers
+import operator
+import itertools
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 NAME_PREFIX = "OESS-SDX-L2VPN--"
+# OESS fields used to derive the status/state of nodes, interfaces and links
+OESS_STATUS_FIELDS = ("status", "operational_state_mpls", "operational_state", "in_maint", "link_state", "admin_state")
+MISSING = object()
+NODE_ADMIN_FIELDS = ["location", "state"]
+NODE_OPER_FIELDS = ["status"]
+PORT_ADMIN_FIELDS = ["mtu", "nni", "services", "state", "type", "private"]
+PORT_OPER_FIELDS = ["status"]
+LINK_ADMIN_FIELDS = ["bandwidth", "ports", "state"]
+LINK_OPER_FIELDS = ["status"]
+DIFF_FIELDS = {
+    "nodes": (NODE_ADMIN_FIELDS, NODE_OPER_FIELDS),
+    "ports": (PORT_ADMIN_FIELDS, PORT_OPER_FIELDS),
+    "links": (LINK_ADMIN_FIELDS, LINK_OPER_FIELDS),
+}
 VERSION_FILE = "/tmp/oess_sdx.ver"
+STATE_FILE = "/tmp/oess_sdx.state.db"
+SNAPSHOT_KEYS = {"oxp_url", "topology", "version", "sdx2oess", "oess2sdx", "deltas", "delta_floor"}
+CONFIG_FILE = os.environ.get(
+    "OESS_SDX_CONFIG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "sdx_config.yml"),
+)
 timeout = 30
+# size of the chunks written by streamed JSON responses
+STREAM_CHUNK_SIZE = 64 * 1024
 sdx_version = 0
 oess2sdx = {}
 sdx2oess = {}
 sdx_config = None
+# config compiled by compile_config() and resolved per OESS object by resolve_config_index()
+config_index = {"interfaces": {}, "links": {}, "overwrite_vlan_range": None, "oess_sources": []}
+config_file_state = {"stat": None, "hash": None}
+intf_config_by_id = {}
+link_config_by_id = {}
+# (oess_topo, config_index) the two maps above were resolved for
+config_resolved_for = (None, None)
+EMPTY_CONFIG = {}
+JUNIPER_BW_MBPS_TO_TYPE = {
+    "400000": "400GE",
+    "100000": "100GE",
+    "50000": "50GE",
+    "40000": "40GE",
+    "25000": "25GE",
+    "10000": "10GE",
+    "1000": "1GE",
+    "100": "100FE",
+}
 sdx_topology = None
 sdx_topo_conv = {"links": [], "nodes": []}
+sdx_topo_fetched_at = 0
+# when the fetch of the current topology from OESS started
+sdx_topo_fetch_started_at = 0
+conv_cache = {"key": None, "nodes": {}, "ports": {}, "links": {}}
+topo_body_cache = {"topology": None, "body": None, "gzip": None, "etag": None}
+# ETag of the streamed topology (see get_topology_etag)
+topo_etag_cache = {"topology": None, "etag": None}
+topo_body_lock = threading.Lock()
+# nodes, ports and links of the converted topology by id and by field value (see build_topology_index)
+topo_index = None
+# serialized /admin/oess2sdx and /admin/sdx2oess maps of the topology index they were built with
+admin_map_cache = {}
+admin_map_lock = threading.Lock()
+# fields the query endpoints filter on, for each kind of object
+TOPOLOGY_QUERY_FIELDS = {
+    "nodes": ("status", "state"),
+    "ports": ("node", "status", "state", "nni", "service"),
+    "links": ("node", "port", "status", "state"),
+}
+topo_deltas = collections.deque()
+# (version, timestamp, admin) of the last delta dropped from history
+topo_delta_floor = None
+topo_delta_lock = threading.Lock()
+circuit_cache = {"by_id": {}, "by_endpoints": {}, "by_name": {}, "by_vlan": {}, "by_request": {}, "by_element": {}, "status": {}}
+circuit_fetched_at = 0
+circuit_fetch_started_at = 0
+# (time, circuit_id, circuit) of our own creates/deletes, replayed over a concurrent refresh
+circuit_local_ops = []
+# start time -> count of the circuit fetches in progress, the ops they may predate are kept
+circuit_fetches = collections.Counter()
+circuit_lock = threading.Lock()
+circuit_refresh_lock = threading.Lock()
+# incremented each time circuit statuses are recomputed after a topology change
+circuit_status_generation = 0
+# interface_id -> (sdx_port, bitmap of the VLANs allowed on the port)
+vlan_mask_cache = {}
+# (interface_id, vlan) of the circuits being provisioned
+vlan_reservations = set()
+# L2VPN request key -> Future of the create in progress, shared by identical requests
+l2vpn_inflight = {}
+l2vpn_inflight_lock = threading.Lock()
+# (route, Idempotency-Key) -> (request hash, expiry time, Future of the result)
+idempotency_keys = collections.OrderedDict()
+idempotency_lock = threading.Lock()
+# job_id -> L2VPN job (status and result) run in background with l2vpn_async
+l2vpn_jobs = collections.OrderedDict()
+# job_id -> (function, args, ordering keys) of the jobs not finished yet
+l2vpn_job_tasks = {}
+# ordering key (port or service) -> deque of the unfinished job_ids using it, in submission order
+l2vpn_job_queues = {}
+# ordering key of the jobs run after every job queued before them (see submit_l2vpn_job)
+L2VPN_JOB_BARRIER = ("barrier", "")
+l2vpn_jobs_lock = threading.Lock()
+l2vpn_job_pool = None
+# circuit_id -> (name, status, state, endpoints key) of the SDX circuits at the last refresh
+circuit_snapshot = None
+# circuit_id -> change event waiting to be pushed to circuit_events_url
+circuit_events = {}
+circuit_events_lock = threading.Lock()
+circuit_events_session = requests.Session()
+circuit_events_failures = 0
+circuit_events_retry_at = 0
+topo_lock = threading.Lock()
+# (username, password, pool size, retries) -> pooled HTTP session of the OESS sources using them
+oess_sessions = {}
+oess_session_lock = threading.Lock()
+# (source name, OESS method) -> circuit breaker and latency stats (see get_oess_endpoint)
+oess_endpoints = {}
+oess_endpoints_lock = threading.Lock()
+# (username, URL) -> Future of the in-flight OESS read shared by concurrent callers
+oess_inflight = {}
+oess_inflight_lock = threading.Lock()
+oess_fetch_pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix="oess-fetch")
+# fetches of the circuits we just provisioned, kept off the topology fetch pool
+circuit_fetch_pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix="circuit-fetch")
+# source name -> ((nodes, links, interfaces) with namespaced ids, monotonic time) of its last successful fetch
+oess_source_topos = {}
+# source name -> Future of its topology fetch in progress
+oess_source_fetches = {}
+oess_source_lock = threading.Lock()
+state_store = None
+state_generation = 0
+# when a request last checked the shared state (see sync_shared_state)
+state_synced_at = 0
+# topology last saved to the snapshot file
+snapshot_saved_topo = None
+# state waiting for the snapshot writer, (path, captured state) or None
+snapshot_pending = None
+snapshot_pending_lock = threading.Lock()
+snapshot_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot-writer")
+metrics_enabled = True
+metrics = {"counters": {}, "histograms": {}}
+metrics_lock = threading.Lock()
+METRIC_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
 
 app = Flask(__name__)
+# writes the records queued by app.logger (see setup_log_queue)
+log_listener = None
+
+
+class OessUnavailable(requests.ConnectionError):
+    """OESS call rejected without being sent: the circuit breaker of its method is open."""
+
+
+class RecordQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler enqueuing the records as they are, formatted by the handlers of the listener thread."""
+
+    def prepare(self, record):
+        return record
+
+
+class OessObject:
+    """Compact OESS object, keeping only the fields used by the converter.
+
+    Fields missing from the OESS payload are set to MISSING, so `field in obj`
+    and obj.get(field, default) behave as they did on the raw dicts, and
+    reading a field never raises (which is slow when done for every object).
+    Objects refer to each other by id, through the topology indexes.
+    """
+
+    __slots__ = ()
+    # fields copied from the OESS payload, which make the object content
+    FIELDS = ()
+
+    @classmethod
+    def from_dict(cls, data):
+        obj = cls()
+        for field in cls.__slots__:
+            setattr(obj, field, data.get(field, MISSING))
+        return obj
+
+    def get(self, field, default=None):
+        value = getattr(self, field, MISSING)
+        return default if value is MISSING else value
+
+    def __contains__(self, field):
+        return getattr(self, field, MISSING) is not MISSING
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__ if getattr(self, field) is not MISSING}
+
+    @classmethod
+    def get_payload(cls, data):
+        """Tuple of the OESS fields of a raw OESS object, as content() returns them."""
+        return tuple(map(data.get, cls.FIELDS, itertools.repeat(MISSING)))
+
+    def content(self):
+        """Tuple of the OESS fields."""
+        return self.get_content(self)
+
+
+class OessNode(OessObject):
+    FIELDS = ("node_id", "name", "latitude", "longitude") + OESS_STATUS_FIELDS
+    __slots__ = FIELDS + ("interface_ids",)
+    get_content = operator.attrgetter(*FIELDS)
+
+
+class OessInterface(OessObject):
+    FIELDS = (
+        "interface_id", "node_id", "name", "bandwidth", "mtu", "int_role", "mpls_vlan_tag_range",
+    ) + OESS_STATUS_FIELDS
+    __slots__ = FIELDS + ("node_name", "link_id", "source")
+    get_content = operator.attrgetter(*FIELDS)
+
+
+class OessLink(OessObject):
+    FIELDS = ("link_id", "interface_a_id", "interface_z_id") + OESS_STATUS_FIELDS
+    __slots__ = FIELDS
+    get_content = operator.attrgetter(*FIELDS)
+
 
 def utcnow():
     return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
 def load_config(fallback_prev_config=True):
+    """Load the config file, only parsing it again when its mtime/content changed."""
     global sdx_config
-    dirname = os.path.dirname(os.path.abspath(__file__))
     try:
-        new_config = yaml.safe_load(open(dirname + '/sdx_config.yml', 'r'))
+        stat = os.stat(CONFIG_FILE)
+        file_stat = (stat.st_mtime_ns, stat.st_size)
+        if sdx_config is not None and file_stat == config_file_state["stat"]:
+            return
+        with open(CONFIG_FILE, "rb") as config_file:
+            raw_config = config_file.read()
+        file_hash = hashlib.sha256(raw_config).hexdigest()
+        if sdx_config is not None and file_hash == config_file_state["hash"]:
+            config_file_state["stat"] = file_stat
+            return
+        new_config = yaml.safe_load(raw_config)
+        compile_config(new_config)
     except Exception as exc:
         if fallback_prev_config:
             return
         err = traceback.format_exc().replace("\n", ", ")
         raise ValueError("Unable to read config: %s - %s" % (exc, err))
+    config_file_state["stat"], config_file_state["hash"] = file_stat, file_hash
     sdx_config = new_config
 
 
+def compile_config(config):
+    """Compile the per-interface and per-link overrides of the config."""
+    global config_index
+    interfaces = config.get("interfaces")
+    links = config.get("links")
+    config_index = {
+        "interfaces": interfaces if interfaces and isinstance(interfaces, dict) else {},
+        "links": links if links and isinstance(links, dict) else {},
+        "overwrite_vlan_range": config.get("overwrite_vlan_range"),
+        "oess_sources": compile_oess_sources(config),
+    }
+
+
+def compile_oess_sources(config):
+    """Get the OESS sources of the config: oess_sources, or the single oess_url/workgroup_id.
+
+    Each source is a dict with name, oess_url, workgroup_id, username and
+    password (defaulting to the top-level ones). Sources of oess_sources
+    need a unique name, used to namespace their ids; the single source of
+    oess_url has no name and its ids are kept as is.
+    """
+    defaults = {"username": config.get("username"), "password": config.get("password")}
+    sources = config.get("oess_sources")
+    if not sources:
+        return [dict(defaults, name=None, oess_url=config.get("oess_url"), workgroup_id=config.get("workgroup_id"))]
+    compiled = []
+    for source in sources:
+        name = source.get("name") if isinstance(source, dict) else None
+        if not name or not source.get("oess_url") or source.get("workgroup_id") is None:
+            raise ValueError("Invalid oess_sources entry %s - name, oess_url and workgroup_id are required" % (name))
+        name = str(name)
+        if ":" in name or any(name == other["name"] for other in compiled):
+            raise ValueError("Invalid oess_sources name %s - names must be unique and without ':'" % (name))
+        compiled.append(dict(defaults, **dict(source, name=name)))
+    return compiled
+
+
+def resolve_config_index(oess_topo):
+    """Resolve the config of every OESS interface and link, by their ids."""
+    global intf_config_by_id, link_config_by_id, config_resolved_for
+    if config_resolved_for[0] is oess_topo and config_resolved_for[1] is config_index:
+        return
+    intf_config_by_id = {
+        intf_id: resolve_intf_config(intf) for intf_id, intf in oess_topo["intf_by_id"].items()
+    }
+    link_config_by_id = {
+        link_id: resolve_link_config(link) for link_id, link in oess_topo["link_by_id"].items()
+    }
+    config_resolved_for = (oess_topo, config_index)
+
+
 def update_version(inc=1):
     global sdx_version
-    dirname = os.path.dirname(os.path.abspath(__file__))
+    sdx_version = get_state_store().incr_version(inc)
+
+
+def metric_key(name, labels):
+    """Key of a metric series: its name and sorted (label, value) pairs."""
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+
+def inc_counter(name, value=1, **labels):
+    """Increment a counter metric."""
+    if not metrics_enabled:
+        return
+    key = metric_key(name, labels)
+    with metrics_lock:
+        metrics["counters"][key] = metrics["counters"].get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """Record a value into a histogram metric."""
+    if not metrics_enabled:
+        return
+    key = metric_key(name, labels)
+    idx = bisect.bisect_left(METRIC_BUCKETS, value)
+    with metrics_lock:
+        histogram = metrics["histograms"].get(key)
+        if histogram is None:
+            histogram = metrics["histograms"][key] = [[0] * (len(METRIC_BUCKETS) + 1), 0.0, 0]
+        histogram[0][idx] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+
+def format_labels(labels, **extra):
+    """Format labels in the Prometheus text format."""
+    labels = list(labels) + sorted(extra.items())
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in labels)
+
+
+def get_effective_handlers(logger):
+    """Get the handlers the records of a logger reach: its own and those of the ancestors it propagates to."""
+    handlers = []
+    while logger is not None:
+        handlers.extend(handler for handler in logger.handlers if handler not in handlers)
+        if not logger.propagate:
+            break
+        logger = logger.parent
+    return handlers
+
+
+def setup_log_queue():
+    """Put the handlers of app.logger behind a queue, written by a listener thread (log_queue).
+
+    The handlers of the ancestors of app.logger (e.g. those of the root
+    logger configured by flaskapp.wsgi) are moved behind the queue too, and
+    app.logger stops propagating to them. Request threads only enqueue
+    their records, they neither format them nor wait for a slow stream or
+    file handler.
+    """
+    global log_listener
+    if not sdx_config.get("log_queue", True) or log_listener is not None:
+        return
+    handlers = [
+        handler for handler in get_effective_handlers(app.logger)
+        if not isinstance(handler, logging.handlers.QueueHandler)
+    ]
+    if not handlers and logging.lastResort is not None:
+        handlers = [logging.lastResort]
+    records = queue.SimpleQueue()
+    app.logger.handlers = [RecordQueueHandler(records)]
+    app.logger.propagate = False
+    log_listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+
+
+def get_metric_gauges():
+    """Gauges computed at scrape time: topology and cache sizes."""
+    topo = sdx_topo_conv
+    return {
+        "oess_sdx_topology_nodes": len(topo["nodes"]),
+        "oess_sdx_topology_ports": sum(len(node["ports"]) for node in topo["nodes"]),
+        "oess_sdx_topology_links": len(topo["links"]),
+        "oess_sdx_topology_version": sdx_version,
+        "oess_sdx_topology_age_seconds": time.monotonic() - sdx_topo_fetched_at if sdx_topo_fetched_at else -1,
+        "oess_sdx_circuits_cached": len(circuit_cache["by_id"]),
+        "oess_sdx_circuit_events_pending": len(circuit_events),
+        "oess_sdx_l2vpn_jobs_pending": len(l2vpn_job_tasks),
+    }
+
+
+def render_metrics():
+    """Render all metrics in the Prometheus text exposition format."""
+    with metrics_lock:
+        counters = dict(metrics["counters"])
+        histograms = {key: (list(value[0]), value[1], value[2]) for key, value in metrics["histograms"].items()}
+    lines = []
+    seen = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append("# TYPE %s counter" % (name))
+        lines.append("%s%s %s" % (name, format_labels(labels), value))
+    for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append("# TYPE %s histogram" % (name))
+        cumulative = 0
+        for bound, bucket in zip(METRIC_BUCKETS, buckets):
+            cumulative += bucket
+            lines.append("%s_bucket%s %d" % (name, format_labels(labels, le=bound), cumulative))
+        lines.append("%s_bucket%s %d" % (name, format_labels(labels, le="+Inf"), count))
+        lines.append("%s_sum%s %s" % (name, format_labels(labels), total))
+        lines.append("%s_count%s %d" % (name, format_labels(labels), count))
+    for name, value in get_metric_gauges().items():
+        lines.append("# TYPE %s gauge" % (name))
+        lines.append("%s %s" % (name, value))
+    return "\n".join(lines) + "\n"
+
+
+def get_oess_method(path, data=None):
+    """Name of the OESS method of a request, used to label metrics."""
+    for key, value in data if isinstance(data, list) else []:
+        if key == "method":
+            return value
+    match = re.search(r"[?&]method=([^&]+)", path)
+    return match.group(1) if match else "unknown"
+
+
+def get_topology_refresh_interval():
+    """Interval (seconds) of the background topology poller, 0 disables it."""
+    return float(sdx_config.get("topology_refresh_interval") or 0)
+
+
+def get_topology_max_staleness():
+    """Max age (seconds) of the cached topology before a request refreshes it."""
+    max_staleness = sdx_config.get("topology_max_staleness")
+    if max_staleness is not None:
+        return float(max_staleness)
+    # without poller and explicit staleness, keep fetching on every request
+    return 3 * get_topology_refresh_interval()
+
+
+def is_topology_stale():
+    """Check if the cached topology is older than the allowed staleness."""
+    if not sdx_topo_fetched_at:
+        return True
+    return time.monotonic() - sdx_topo_fetched_at >= get_topology_max_staleness()
+
+
+def get_oess_sources():
+    """Get the OESS sources the topology is aggregated from (see compile_oess_sources)."""
+    return config_index["oess_sources"]
+
+
+def get_oess_source(name=None):
+    """Get an OESS source by name, the first one when name is None."""
+    sources = get_oess_sources()
+    if name is None:
+        return sources[0]
+    for source in sources:
+        if source["name"] == name:
+            return source
+    raise ValueError("Unknown OESS source: %s" % (name))
+
+
+def get_oess_labels(oess_method, source):
+    """Metric labels of an OESS call: its method, and its source when named."""
+    if source["name"] is None:
+        return {"method": oess_method}
+    return {"method": oess_method, "source": source["name"]}
+
+
+def get_oess_session(source=None, retry=True):
+    """Get the pooled HTTP session used for the OESS calls of a source.
+
+    Sources with the same credentials share the same session. Calls
+    changing OESS state (provision, remove) use a session without retries.
+    """
+    if source is None:
+        source = get_oess_source()
+    pool_size = int(sdx_config.get("oess_pool_size", 10))
+    retries = int(sdx_config.get("oess_retries", 2)) if retry else 0
+    session_key = (source["username"], source["password"], pool_size, retries)
+    session = oess_sessions.get(session_key)
+    if session is not None:
+        return session
+    with oess_session_lock:
+        session = oess_sessions.get(session_key)
+        if session is not None:
+            return session
+        session = requests.Session()
+        session.auth = (source["username"], source["password"])
+        session.verify = False
+        # only reads are retried (see send_oess_request): a replayed remove would fail
+        # after the first attempt succeeded, and provisioning would be run twice
+        max_retries = Retry(
+            total=retries,
+            backoff_factor=0.2,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=["GET"],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=max_retries)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        oess_sessions[session_key] = session
+    return session
+
+
+def is_oess_read(method, oess_method):
+    """Check if an OESS call only reads data (safe to share and to time out early)."""
+    return method == "GET" and oess_method.startswith("get")
+
+
+def get_oess_endpoint(oess_method, source):
+    """Get the circuit breaker and latency stats of an OESS method of a source (oess_endpoints_lock held)."""
+    key = (source["name"], oess_method)
+    stats = oess_endpoints.get(key)
+    if stats is None:
+        stats = oess_endpoints[key] = {
+            "failures": 0, "opened_at": 0, "probing": False, "latency": None, "deviation": 0.0,
+        }
+    return stats
+
+
+def get_oess_timeout(method, oess_method, source, probe=False):
+    """Timeout of an OESS call.
+
+    Reads get a timeout adapted to the latency observed for their method
+    (2 * EWMA + 4 * mean deviation, within oess_timeout_min/max); provisioning
+    and removal always get oess_timeout_max, as giving up early would not
+    cancel them on OESS. So does the trial call of a half-open breaker, which
+    should not fail only because OESS is still slow.
+    """
+    max_timeout = float(sdx_config.get("oess_timeout_max", timeout))
+    if probe or not sdx_config.get("oess_adaptive_timeout", True) or not is_oess_read(method, oess_method):
+        return max_timeout
+    with oess_endpoints_lock:
+        stats = get_oess_endpoint(oess_method, source)
+        latency, deviation = stats["latency"], stats["deviation"]
+    if latency is None:
+        return max_timeout
+    min_timeout = float(sdx_config.get("oess_timeout_min", 5))
+    return min(max_timeout, max(min_timeout, 2 * latency + 4 * deviation))
+
+
+def check_oess_breaker(oess_method, source):
+    """Raise OessUnavailable if the circuit breaker of an OESS method of a source is open.
+
+    After oess_breaker_failures consecutive failures the breaker opens for
+    oess_breaker_reset seconds, then lets a single trial call through
+    (half-open) to decide whether to close again. Returns True for that
+    trial call.
+    """
+    threshold = int(sdx_config.get("oess_breaker_failures", 5))
+    if not threshold:
+        return False
+    reset = float(sdx_config.get("oess_breaker_reset", 30))
+    with oess_endpoints_lock:
+        stats = get_oess_endpoint(oess_method, source)
+        if stats["failures"] < threshold:
+            return False
+        retry_in = stats["opened_at"] + reset - time.monotonic()
+        if retry_in <= 0 and not stats["probing"]:
+            stats["probing"] = True
+            return True
+    inc_counter("oess_sdx_oess_breaker_rejections_total", **get_oess_labels(oess_method, source))
+    raise OessUnavailable(
+        "OESS %s%s unavailable after %d consecutive failures, retry in %.0fs" % (
+            "%s " % (source["name"]) if source["name"] is not None else "",
+            oess_method, stats["failures"], max(retry_in, 0),
+        )
+    )
+
+
+def record_oess_result(oess_method, source, duration, success, probe=False, timed_out=False):
+    """Update the circuit breaker and latency stats of an OESS method of a source.
+
+    Only the result of the trial call (probe) ends the half-open state. A
+    timeout doubles the smoothed latency and deviation, so the next timeout
+    backs off instead of keeping a value OESS no longer meets.
+    """
+    threshold = int(sdx_config.get("oess_breaker_failures", 5))
+    with oess_endpoints_lock:
+        stats = get_oess_endpoint(oess_method, source)
+        if probe:
+            stats["probing"] = False
+        if timed_out and stats["latency"] is not None:
+            stats["latency"] *= 2
+            stats["deviation"] *= 2
+        if not success:
+            stats["failures"] += 1
+            if threshold and stats["failures"] >= threshold:
+                if stats["failures"] == threshold:
+                    inc_counter("oess_sdx_oess_breaker_opened_total", **get_oess_labels(oess_method, source))
+                stats["opened_at"] = time.monotonic()
+            return
+        stats["failures"] = 0
+        # smoothed latency and mean deviation, as TCP does for its retransmission timeout
+        if stats["latency"] is None:
+            stats["latency"], stats["deviation"] = duration, duration / 2
+        else:
+            stats["deviation"] += 0.25 * (abs(duration - stats["latency"]) - stats["deviation"])
+            stats["latency"] += 0.125 * (duration - stats["latency"])
+
+
+def oess_request(method, path, source=None, **kwargs):
+    """Send a request to an OESS source (the first one by default) through its shared session.
+
+    Concurrent identical reads share a single in-flight call.
+    """
+    if source is None:
+        source = get_oess_source()
+    oess_method = get_oess_method(path, kwargs.get("data"))
+    if kwargs or not is_oess_read(method, oess_method):
+        return send_oess_request(method, path, oess_method, source, **kwargs)
+    key = (source["username"], source["oess_url"] + path)
+    with oess_inflight_lock:
+        future = oess_inflight.get(key)
+        leader = future is None
+        if leader:
+            future = oess_inflight[key] = Future()
+    if not leader:
+        inc_counter("oess_sdx_oess_coalesced_total", **get_oess_labels(oess_method, source))
+        return future.result()
     try:
-        sdx_version = int(open(VERSION_FILE).read())
-    except:
-        sdx_version = 1
-    sdx_version += inc
-    with open(VERSION_FILE, "w") as f:
-        f.write(str(sdx_version))
+        res = send_oess_request(method, path, oess_method, source)
+    except BaseException as exc:
+        future.set_exception(exc)
+        raise
+    else:
+        future.set_result(res)
+    finally:
+        with oess_inflight_lock:
+            del oess_inflight[key]
+    return res
+
+
+def send_oess_request(method, path, oess_method, source, **kwargs):
+    """Send a request to an OESS source, through the circuit breaker of its method."""
+    probe = check_oess_breaker(oess_method, source)
+    kwargs.setdefault("timeout", get_oess_timeout(method, oess_method, source, probe))
+    labels = get_oess_labels(oess_method, source)
+    start = time.perf_counter()
+    success = timed_out = False
+    try:
+        session = get_oess_session(source, retry=is_oess_read(method, oess_method))
+        res = session.request(method, source["oess_url"] + path, **kwargs)
+        success = res.status_code < 500
+    except requests.Timeout:
+        timed_out = True
+        inc_counter("oess_sdx_oess_timeouts_total", **labels)
+        raise
+    except Exception:
+        inc_counter("oess_sdx_oess_errors_total", **labels)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        record_oess_result(oess_method, source, duration, success, probe, timed_out)
+        observe("oess_sdx_oess_request_duration_seconds", duration, **labels)
+    if res.status_code >= 400:
+        inc_counter("oess_sdx_oess_errors_total", **labels)
+    return res
+
+
+def get_oess_results(path, source=None):
+    """Fetch an OESS service and return its results."""
+    return oess_request("GET", path, source).json()["results"]
+
+
+def get_oess_topo_paths(source):
+    """OESS calls returning the nodes, links and interfaces of a source."""
+    return [
+        "/services/data.cgi?method=get_all_node_status",
+        "/services/data.cgi?method=get_all_link_status",
+        "/services/interface.cgi?method=get_workgroup_interfaces&workgroup_id=%s" % (source["workgroup_id"]),
+    ]
 
 
 def get_oess_topo():
-    """Fetch OESS topology and create references for convenience."""
+    """Fetch OESS topology and index its nodes, interfaces and links by id.
+
+    With oess_sources, the topologies of all sources are merged into one.
+    Unchanged objects of the current topology are reused (topo_lock held).
+    """
+    sources = get_oess_sources()
+    if sources[0]["name"] is not None:
+        return build_oess_topo(*get_oess_sources_topo(sources), prev=sdx_topology)
+    # the three calls are independent, run them concurrently
+    futures = [oess_fetch_pool.submit(get_oess_results, path) for path in get_oess_topo_paths(sources[0])]
+    return build_oess_topo(*[future.result() for future in futures], prev=sdx_topology)
+
+
+def new_oess_source_pool(sources):
+    """Create the pool of one fetch cycle of the OESS sources, running the three calls of every source at once.
+
+    Each cycle owns its pool and shuts it down once its calls are
+    submitted: calls still running, such as a fetch outlasting the
+    refresh, finish before its threads exit, and no other cycle
+    submits to it.
+    """
+    return ThreadPoolExecutor(max_workers=3 * len(sources), thread_name_prefix="oess-source")
+
+
+def start_oess_source_fetch(source, pool):
+    """Start fetching the topology of an OESS source, unless a fetch of it is still in progress.
+
+    Returns the Future of its namespaced (nodes, links, interfaces), also
+    kept in oess_source_topos once fetched, so a fetch outlasting a
+    refresh is used by the next one.
+    """
+    name = source["name"]
+    with oess_source_lock:
+        fetch = oess_source_fetches.get(name)
+        if fetch is not None and not fetch.done():
+            return fetch
+        fetch = oess_source_fetches[name] = Future()
+    futures = [pool.submit(get_oess_results, path, source) for path in get_oess_topo_paths(source)]
+    remaining = [len(futures)]
+
+    def on_done(_):
+        with oess_source_lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        try:
+            results = namespace_oess_topo(name, *[future.result() for future in futures])
+        except Exception as exc:
+            fetch.set_exception(exc)
+            return
+        with oess_source_lock:
+            oess_source_topos[name] = (results, time.monotonic())
+        fetch.set_result(results)
+
+    for future in futures:
+        future.add_done_callback(on_done)
+    return fetch
+
+
+def get_oess_sources_topo(sources):
+    """Fetch the OESS sources concurrently and merge their namespaced nodes, links and interfaces.
+
+    A source failing, or slower than oess_source_timeout, contributes its
+    last fetched topology instead (none until it succeeds once), so it
+    neither stalls nor blanks the others. Raises ValueError if no source
+    has a topology.
+    """
+    pool = new_oess_source_pool(sources)
+    fetches = [(source, start_oess_source_fetch(source, pool)) for source in sources]
+    pool.shutdown(wait=False)
+    timeout = float(sdx_config.get("oess_source_timeout", 10))
+    deadline = time.monotonic() + timeout
+    merged = ([], [], [])
+    errors = []
+    for source, fetch in fetches:
+        name = source["name"]
+        try:
+            results = fetch.result(timeout=max(0, deadline - time.monotonic()) if timeout else None)
+        except Exception as exc:
+            error = str(exc) or "no response after %ss" % (timeout)
+            errors.append("%s: %s" % (name, error))
+            inc_counter("oess_sdx_oess_source_failures_total", source=name)
+            with oess_source_lock:
+                cached = oess_source_topos.get(name)
+            if cached is None:
+                app.logger.error("Failed to fetch OESS source %s, left out of the topology: %s" % (name, error))
+                continue
+            results, fetched_at = cached
+            app.logger.error("Failed to fetch OESS source %s, using its topology of %.0fs ago: %s" % (
+                name, time.monotonic() - fetched_at, error
+            ))
+        for objs, source_objs in zip(merged, results):
+            objs.extend(source_objs)
+    if len(errors) == len(sources) and not merged[0]:
+        raise ValueError("No OESS source available - %s" % ("; ".join(errors)))
+    return merged
+
+
+def namespace_oess_topo(name, nodes, links, interfaces):
+    """Copy the OESS nodes, links and interfaces of a named source with namespaced ids.
+
+    Ids become "<source>:<id>" and node names "<source>.<name>", so objects
+    of different sources never collide in the merged topology. Interfaces
+    also keep their source, where their circuits are provisioned.
+    """
+    nodes = [
+        dict(node, node_id="%s:%s" % (name, node["node_id"]), name="%s.%s" % (name, node["name"]))
+        for node in nodes
+    ]
+    links = [
+        dict(
+            link,
+            link_id="%s:%s" % (name, link["link_id"]),
+            interface_a_id="%s:%s" % (name, link["interface_a_id"]),
+            interface_z_id="%s:%s" % (name, link["interface_z_id"]),
+        )
+        for link in links
+    ]
+    interfaces = [
+        dict(
+            intf,
+            interface_id="%s:%s" % (name, intf["interface_id"]),
+            node_id="%s:%s" % (name, intf["node_id"]),
+            source=name,
+        )
+        for intf in interfaces
+    ]
+    return nodes, links, interfaces
+
+
+def get_oess_node_name(interface):
+    """Name of the node of an interface on its OESS source (without the source namespace)."""
+    source = interface.get("source")
+    if source is None:
+        return interface.node_name
+    return interface.node_name[len(source) + 1:]
+
+
+def build_oess_topo(nodes, links, interfaces, prev=None):
+    """Build the OESS topology model from the OESS results.
+
+    Objects of the previous topology (prev) whose OESS fields and
+    references did not change are reused as is, and are never modified, so
+    the converter recognizes unchanged objects by identity. If nothing
+    changed, prev itself is returned.
+    """
+    if prev is None:
+        prev = {"nodes": [], "links": [], "node_by_id": {}, "link_by_id": {}, "intf_by_id": {}}
     topo = {"node_by_id": {}, "link_by_id": {}, "intf_by_id": {}}
-    res = requests.get(sdx_config["oess_url"] + "/services/data.cgi?method=get_all_node_status", verify=False, auth=(sdx_config["username"], sdx_config["password"]), timeout=timeout)
-    topo["nodes"] = res.json()["results"]
-    res = requests.get(sdx_config["oess_url"] + "/services/data.cgi?method=get_all_link_status", verify=False, auth=(sdx_config["username"], sdx_config["password"]), timeout=timeout)
-    topo["links"] = res.json()["results"]
-    for node in topo["nodes"]:
-        topo["node_by_id"][node["node_id"]] = node
-        #res = requests.get(sdx_config["oess_url"] + "/services/data.cgi?method=get_node_interfaces&workgroup_id=%s&node=%s&show_down=1&show_trunk=1" % (sdx_config["workgroup_id"], node["name"]), verify=False, auth=(sdx_config["username"], sdx_config["password"]), timeout=timeout)
-        #node["interfaces"] = res.json()["results"]
-        #for intf in node["interfaces"]:
-        #    intf["node"] = node
-        #    topo["intf_by_id"][intf["interface_id"]] = intf
-        node["interfaces"] = []
-    res = requests.get(sdx_config["oess_url"] + "/services/interface.cgi?method=get_workgroup_interfaces&workgroup_id=%s" % (sdx_config["workgroup_id"]), verify=False, auth=(sdx_config["username"], sdx_config["password"]), timeout=timeout)
-    interfaces = res.json()["results"]
-    for intf in interfaces:
-        topo["intf_by_id"][intf["interface_id"]] = intf
-        node = topo["node_by_id"][intf["node_id"]]
-        node["interfaces"].append(intf)
-        intf["node"] = node
-    for link in topo["links"]:
-        topo["link_by_id"][link["link_id"]] = link
-        topo["intf_by_id"][link["interface_a_id"]]["link"] = link
-        topo["intf_by_id"][link["interface_z_id"]]["link"] = link
-        link["interface_a"] = topo["intf_by_id"][link["interface_a_id"]]
-        link["interface_z"] = topo["intf_by_id"][link["interface_z_id"]]
+    rebuilt = 0
+
+    topo["links"] = []
+    link_by_intf = {}
+    for data in links:
+        link = prev["link_by_id"].get(data.get("link_id"))
+        if link is None or link.get_content(link) != OessLink.get_payload(data):
+            link = OessLink.from_dict(data)
+            rebuilt += 1
+        topo["links"].append(link)
+        topo["link_by_id"][link.link_id] = link
+        link_by_intf[link.interface_a_id] = link_by_intf[link.interface_z_id] = link.link_id
+
+    node_names = {data["node_id"]: data.get("name", MISSING) for data in nodes}
+    interface_ids = {node_id: [] for node_id in node_names}
+    # the loop below runs for every interface of every poll
+    prev_intfs, intf_by_id = prev["intf_by_id"], topo["intf_by_id"]
+    get_content, get_payload = OessInterface.get_content, OessInterface.get_payload
+    for data in interfaces:
+        intf_id = data.get("interface_id")
+        node_name = node_names[data["node_id"]]
+        link_id = link_by_intf.get(intf_id, MISSING)
+        intf = prev_intfs.get(intf_id)
+        if (
+            intf is None
+            or intf.node_name != node_name
+            or intf.link_id != link_id
+            or get_content(intf) != get_payload(data)
+        ):
+            intf = OessInterface.from_dict(data)
+            intf.node_name = node_name
+            intf.link_id = link_id
+            rebuilt += 1
+        intf_by_id[intf_id] = intf
+        interface_ids[intf.node_id].append(intf_id)
+    for intf_id in link_by_intf.keys() - intf_by_id.keys():
+        raise KeyError(intf_id)
+
+    topo["nodes"] = []
+    for data in nodes:
+        node = prev["node_by_id"].get(data["node_id"])
+        if (
+            node is None
+            or node.interface_ids != interface_ids[data["node_id"]]
+            or node.get_content(node) != OessNode.get_payload(data)
+        ):
+            node = OessNode.from_dict(data)
+            node.interface_ids = interface_ids[node.node_id]
+            rebuilt += 1
+        topo["nodes"].append(node)
+        topo["node_by_id"][node.node_id] = node
+
+    if not rebuilt and all(
+        len(topo[index]) == len(prev[index]) for index in ["node_by_id", "link_by_id", "intf_by_id"]
+    ) and topo["nodes"] == prev["nodes"] and topo["links"] == prev["links"]:
+        return prev
     return topo
 
 
+def get_node_interfaces(oess_topo, node):
+    """Get the interfaces of a node of an OESS topology."""
+    return [oess_topo["intf_by_id"][intf_id] for intf_id in node.interface_ids]
+
+
+def get_link_interfaces(oess_topo, link):
+    """Get the (interface_a, interface_z) of a link of an OESS topology."""
+    return oess_topo["intf_by_id"][link.interface_a_id], oess_topo["intf_by_id"][link.interface_z_id]
+
+
+def get_interface_link(oess_topo, interface):
+    """Get the link of an interface of an OESS topology."""
+    link_id = interface.get("link_id")
+    if link_id is None:
+        return None
+    return oess_topo["link_by_id"].get(link_id)
+
+
 def sanitize_name(name):
     # TODO
     return name
@@ -89,80 +953,59 @@ def sanitize_name(name):
 
 def get_intf_config(interface):
     """Get the interface config."""
-    interfaces = sdx_config.get("interfaces", {})
-    if not interfaces or not isinstance(interfaces, dict):
-        return {}
-    intf_name = f"{interface['node']['name']}:{interface['name']}"
+    intf_config = intf_config_by_id.get(interface.interface_id)
+    if intf_config is None:
+        intf_config = resolve_intf_config(interface)
+    return intf_config
+
+
+def resolve_intf_config(interface):
+    """Find the interface config, by "node:interface" name or interface id."""
+    interfaces = config_index["interfaces"]
+    if not interfaces:
+        return EMPTY_CONFIG
+    intf_name = f"{interface.node_name}:{interface.name}"
     if intf_name in interfaces:
         return interfaces[intf_name]
-    return interfaces.get(int(interface["interface_id"]), {})
+    try:
+        return interfaces.get(int(interface.interface_id), EMPTY_CONFIG)
+    except (TypeError, ValueError):
+        # "<source>:<id>" ids of oess_sources
+        return interfaces.get(interface.interface_id, EMPTY_CONFIG)
 
 
 def get_link_config(link):
     """Get link config"""
-    links = sdx_config.get("links", {})
-    if not links or not isinstance(links, dict):
-        return {}
-    return links.get(int(link["link_id"]), {})
-
-
-def get_interface_mtu(interface):
-    """Function to try to obtain the MTU of an interface."""
-    return get_intf_config(interface).get("mtu", "1500")
-
+    link_config = link_config_by_id.get(link.link_id)
+    if link_config is None:
+        link_config = resolve_link_config(link)
+    return link_config
 
-def get_interface_state(interface):
-    """Function to try to obtain the state of an interface."""
-    config_state = get_intf_config(interface).get("state")
-    if config_state:
-        return config_state
-    return get_object_state(interface)
 
-
-def get_type_port_speed(bandwidth):
-    """
-    Function to try to obtain the speed of an interface.
-    The type enum is 100FE, 1GE, 10GE, 25GE, 40GE, 50GE, 100GE, 400GE, and Other
-    """
-    juniper_bw_mbps_to_type = {
-        "400000": "400GE",
-        "100000": "100GE",
-        "50000": "50GE",
-        "40000": "40GE",
-        "25000": "25GE",
-        "10000": "10GE",
-        "1000": "1GE",
-        "100": "100FE",
-    }
-    return juniper_bw_mbps_to_type.get(bandwidth, "Other")
-
-
-def get_link_bandwidth(link):
-    """Get link bandwidth (Gbps) based on interface speeds (Mbps)."""
-    intfa_bw = int(link["interface_a"]["bandwidth"]) / 100
-    intfz_bw = int(link["interface_z"]["bandwidth"]) / 100
-    return min(intfa_bw, intfz_bw)
+def resolve_link_config(link):
+    """Find the link config, by link id."""
+    links = config_index["links"]
+    if not links:
+        return EMPTY_CONFIG
+    try:
+        return links.get(int(link.link_id), EMPTY_CONFIG)
+    except (TypeError, ValueError):
+        # "<source>:<id>" ids of oess_sources
+        return links.get(link.link_id, EMPTY_CONFIG)
 
 
 def get_port_urn(interface):
    """generate the full urn address for a port"""
-   return "urn:sdx:port:%s:%s:%s" % (sdx_config["oxp_url"], interface["node"]["name"], interface["name"])
-
+   return "urn:sdx:port:%s:%s:%s" % (sdx_config["oxp_url"], interface.node_name, interface.name)
 
-def get_link_urn_from_interface(interface):
-   """Return the first active link on this interface"""
-   link = sdx_topology["intf_by_id"].get(interface["interface_id"], {}).get("link")
-   if not link:
-       return ""
-   return "urn:sdx:link:%s:%s" % (sdx_config["oxp_url"], get_link_label(link))
 
-
-def get_link_label(link):
+def get_link_label(oess_topo, link):
     """Get the link label"""
-    intfa = link["interface_a"]["name"]
-    nodea = link["interface_a"]["node"]["name"]
-    intfz = link["interface_z"]["name"]
-    nodez = link["interface_z"]["node"]["name"]
+    intf_a, intf_z = get_link_interfaces(oess_topo, link)
+    intfa = intf_a.name
+    nodea = intf_a.node_name
+    intfz = intf_z.name
+    nodez = intf_z.node_name
     if nodea == nodez:
         if intfz < intfa:
             intfa, intfz = intfz, intfa
@@ -172,49 +1015,12 @@ def get_link_label(link):
     return "%s/%s_%s/%s" % (nodea, intfa, nodez, intfz)
 
 
-def get_sdx_port(interface):
-    sdx_port = {}
-    sdx_port["id"] = get_port_urn(interface)
-    sdx_port["name"] = interface["name"][:30]
-    sdx_port["node"] = "urn:sdx:node:%s:%s" % (sdx_config["oxp_url"], interface["node"]["name"])
-    sdx_port["type"] = get_type_port_speed(interface["bandwidth"])
-    sdx_port["status"] = get_object_status(interface)
-    sdx_port["state"] = get_interface_state(interface)
-    sdx_port["mtu"] = int(interface["mtu"])
-
-    intf_config = get_intf_config(interface)
-    if interface.get("int_role", "access") == "trunk":
-        sdx_port["nni"] = get_link_urn_from_interface(interface)
-    elif "sdx_nni" in intf_config:
-        sdx_port["nni"] = "urn:sdx:port:" + intf_config["sdx_nni"]
-    else:
-        sdx_port["nni"] = ""
-
-    vlan_range = intf_config.get("sdx_vlan_range")
-    if vlan_range is None:
-        vlan_range = sdx_config.get("overwrite_vlan_range")
-    if vlan_range is None:
-        vlan_range = interface.get("mpls_vlan_tag_range")
-        if vlan_range:
-            vlans = vlan_range.split("-")
-            if len(vlans) == 2 and vlans[0].isdigit() and vlans[1].isdigit():
-                vlan_range = [[int(vlans[0]), int(vlans[1])]]
-            else:
-                vlan_range = None
-        if not vlan_range:
-            vlan_range = [[1, 4095]]
-
-    sdx_port["services"] = {
-        # "l2vpn-ptmp":{"vlan_range": vlan_range}
-    }
-    if vlan_range:
-        sdx_port["services"]["l2vpn-ptp"] = {"vlan_range": vlan_range}
-
-    sdx_port["entities"] = intf_config.get("entities", [])
-
-    sdx_port["private"] = ["status"]
-
-    return sdx_port
+def parse_mpls_vlan_range(vlan_range):
+    """Parse an OESS "start-end" VLAN tag range into [[start, end]], None if invalid."""
+    vlans = vlan_range.split("-")
+    if len(vlans) == 2 and vlans[0].isdigit() and vlans[1].isdigit():
+        return [[int(vlans[0]), int(vlans[1])]]
+    return None
 
 
 def get_object_status(obj):
@@ -245,448 +1051,2710 @@ def get_object_state(obj):
     return "disabled"
 
 
-def get_sdx_ports(interfaces):
-    global sdx2oess, oess2sdx
-    sdx_ports = []
-    for interface in interfaces:
-        sdx_ports.append(get_sdx_port(interface))
-        oess2sdx[interface["interface_id"]] = sdx_ports[-1]
-        sdx2oess[sdx_ports[-1]["id"]] = interface
-    return sdx_ports
-
-
-def get_sdx_node(node):
+def get_sdx_node(node, sdx_ports):
     sdx_node = {}
-    sdx_node["name"] = sanitize_name(node["name"])
+    sdx_node["name"] = sanitize_name(node.name)
     sdx_node["id"] = "urn:sdx:node:%s:%s" % (sdx_config["oxp_url"], sdx_node["name"])
     sdx_node["location"] = {
         #"address": kytos_node["metadata"].get("address", ""),
-        "latitude": float(node["latitude"]),
-        "longitude": float(node["longitude"]),
+        "latitude": float(node.latitude),
+        "longitude": float(node.longitude),
         #"iso3166_2_lvl4": kytos_node["metadata"].get("iso3166_2_lvl4", ""),
         "private": [],
     }
-    sdx_node["ports"] = get_sdx_ports(node["interfaces"])
+    sdx_node["ports"] = sdx_ports
     sdx_node["status"] = get_object_status(node)
     sdx_node["state"] = get_object_state(node)
     return sdx_node
 
 
-def get_sdx_nodes(oess_topo):
-    sdx_nodes = []
-    for node in oess_topo["nodes"]:
-        sdx_nodes.append(get_sdx_node(node))
-    return sdx_nodes
-
-
-def get_sdx_link(link):
-    """generates a dictionary object for every link in a network,
-    and containing all the attributes for each link"""
-    sdx_link = {}
-    sdx_link["name"] = get_link_label(link)
-    sdx_link["id"] = "urn:sdx:link:%s:%s" % (sdx_config["oxp_url"], sdx_link["name"])
-    sdx_link["ports"] = sorted(
-        [
-            get_port_urn(link["interface_a"]),
-            get_port_urn(link["interface_z"]),
-        ]
-    )
-    sdx_link["type"] = "intra"
-    sdx_link["bandwidth"] = get_link_bandwidth(link)
-    link_config = get_link_config(link)
-    sdx_link["residual_bandwidth"] = link_config.get("residual_bandwidth", 100)
-    sdx_link["latency"] = link_config.get("latency", 0)
-    sdx_link["packet_loss"] = link_config.get("packet_loss", 0)
-    sdx_link["availability"] = link_config.get("availability", 0)
-    sdx_link["status"] = get_object_status(link)
-    sdx_link["state"] = get_object_state(link)
-    sdx_link["private"] = ["packet_loss"]
-    return sdx_link
-
-
-def get_sdx_links(oess_topo):
+def get_field_columns(objs, fields):
+    """Get the {field: [value of each object]} columns of OESS objects, MISSING where unset."""
+    return {field: list(map(operator.attrgetter(field), objs)) for field in fields}
+
+
+def get_status_columns(columns, with_role=False):
+    """Get the status and state columns of OESS objects, given their field columns.
+
+    get_object_status() and get_object_state() are evaluated once per
+    distinct combination of the OESS fields they depend on.
+    """
+    status_columns = [columns[field] for field in OESS_STATUS_FIELDS]
+    if with_role:
+        status_columns.append([value is not MISSING for value in columns["int_role"]])
+    table = {}
+    for key in set(zip(*status_columns)):
+        probe = {field: value for field, value in zip(OESS_STATUS_FIELDS, key) if value is not MISSING}
+        if with_role and key[-1]:
+            probe["int_role"] = True
+        table[key] = get_object_status(probe), get_object_state(probe)
+    results = [table[key] for key in zip(*status_columns)]
+    return [result[0] for result in results], [result[1] for result in results]
+
+
+def get_link_labels(oess_topo, links):
+    """Get the {link_id: label} of links of an OESS topology."""
+    return {link.link_id: get_link_label(oess_topo, link) for link in links}
+
+
+def get_interface_link_labels(oess_topo, interface):
+    """Get the {link_id: label} of the link of an OESS interface, empty if it has none."""
+    link = get_interface_link(oess_topo, interface)
+    return {link.link_id: get_link_label(oess_topo, link)} if link else {}
+
+
+def get_sdx_ports_bulk(oess_topo, interfaces, columns=None, link_labels=None):
+    """Convert a batch of OESS interfaces into SDX ports, column by column."""
+    if columns is None:
+        columns = get_field_columns(interfaces, OESS_STATUS_FIELDS + ("int_role", "mpls_vlan_tag_range"))
+    if link_labels is None:
+        link_labels = get_link_labels(oess_topo, oess_topo["links"])
+    oxp_url = sdx_config["oxp_url"]
+    overwrite_vlan_range = config_index["overwrite_vlan_range"]
+    node_names = [interface.node_name for interface in interfaces]
+    names = [interface.name for interface in interfaces]
+    configs = [get_intf_config(interface) for interface in interfaces]
+    ids = ["urn:sdx:port:%s:%s:%s" % (oxp_url, node_name, name) for node_name, name in zip(node_names, names)]
+    node_urns = {node_name: "urn:sdx:node:%s:%s" % (oxp_url, node_name) for node_name in set(node_names)}
+    port_types = [JUNIPER_BW_MBPS_TO_TYPE.get(interface.bandwidth, "Other") for interface in interfaces]
+    mtus = [int(interface.mtu) for interface in interfaces]
+    statuses, states = get_status_columns(columns, with_role=True)
+    states = [intf_config.get("state") or state for intf_config, state in zip(configs, states)]
+
+    nnis = []
+    for interface, role, intf_config in zip(interfaces, columns["int_role"], configs):
+        if role == "trunk":
+            label = link_labels.get(interface.link_id)
+            nnis.append("urn:sdx:link:%s:%s" % (oxp_url, label) if label is not None else "")
+        elif "sdx_nni" in intf_config:
+            nnis.append("urn:sdx:port:" + intf_config["sdx_nni"])
+        else:
+            nnis.append("")
+
+    vlan_ranges = []
+    parsed_vlan_ranges = {}
+    for mpls_vlan_range, intf_config in zip(columns["mpls_vlan_tag_range"], configs):
+        vlan_range = intf_config.get("sdx_vlan_range")
+        if vlan_range is None:
+            vlan_range = overwrite_vlan_range
+        if vlan_range is None:
+            vlan_range = mpls_vlan_range if mpls_vlan_range is not MISSING else None
+            if vlan_range:
+                if vlan_range not in parsed_vlan_ranges:
+                    parsed_vlan_ranges[vlan_range] = parse_mpls_vlan_range(vlan_range)
+                bounds = parsed_vlan_ranges[vlan_range]
+                vlan_range = [list(bounds[0])] if bounds else None
+            if not vlan_range:
+                vlan_range = [[1, 4095]]
+        vlan_ranges.append(vlan_range)
+
+    return [
+        {
+            "id": port_id,
+            "name": name[:30],
+            "node": node_urns[node_name],
+            "type": port_type,
+            "status": status,
+            "state": state,
+            "mtu": mtu,
+            "nni": nni,
+            "services": {"l2vpn-ptp": {"vlan_range": vlan_range}} if vlan_range else {},
+            "entities": intf_config.get("entities", []),
+            "private": ["status"],
+        }
+        for port_id, name, node_name, port_type, status, state, mtu, nni, vlan_range, intf_config in zip(
+            ids, names, node_names, port_types, statuses, states, mtus, nnis, vlan_ranges, configs
+        )
+    ]
+
+
+def get_sdx_links_bulk(oess_topo, links, columns=None, link_labels=None):
+    """Convert a batch of OESS links into SDX links, column by column."""
+    if columns is None:
+        columns = get_field_columns(links, OESS_STATUS_FIELDS)
+    if link_labels is None:
+        link_labels = get_link_labels(oess_topo, links)
+    oxp_url = sdx_config["oxp_url"]
+    intf_by_id = oess_topo["intf_by_id"]
+    statuses, states = get_status_columns(columns)
     sdx_links = []
-    for link in oess_topo["links"]:
-        sdx_links.append(get_sdx_link(link))
+    for link, status, state in zip(links, statuses, states):
+        intf_a, intf_z = intf_by_id[link.interface_a_id], intf_by_id[link.interface_z_id]
+        label = link_labels[link.link_id]
+        link_config = get_link_config(link)
+        sdx_links.append({
+            "name": label,
+            "id": "urn:sdx:link:%s:%s" % (oxp_url, label),
+            "ports": sorted([
+                "urn:sdx:port:%s:%s:%s" % (oxp_url, intf.node_name, intf.name) for intf in (intf_a, intf_z)
+            ]),
+            "type": "intra",
+            "bandwidth": min(int(intf_a.bandwidth) / 100, int(intf_z.bandwidth) / 100),
+            "residual_bandwidth": link_config.get("residual_bandwidth", 100),
+            "latency": link_config.get("latency", 0),
+            "packet_loss": link_config.get("packet_loss", 0),
+            "availability": link_config.get("availability", 0),
+            "status": status,
+            "state": state,
+            "private": ["packet_loss"],
+        })
     return sdx_links
 
-def convert_topo(oess_topo):
+
+def convert_changed_bulk(oess_topo, prev):
+    """Find the OESS interfaces and links whose SDX objects depend on something changed and convert them, in batches.
+
+    An SDX port depends on its OESS interface, its config and the label of
+    its link, an SDX link on its OESS link, its two interfaces and its
+    config. build_oess_topo() reuses unchanged OESS objects, so comparing
+    the dependencies does not look at their fields.
+
+    Returns the {kind: {oess_id: dependencies}} and {kind: {oess_id: sdx_obj}}
+    of ports and links, used by convert_topo_incremental().
+    """
+    link_labels = get_link_labels(oess_topo, oess_topo["links"])
+    intf_by_id = oess_topo["intf_by_id"]
+    deps = {
+        "ports": {
+            intf_id: (intf, get_intf_config(intf), link_labels.get(intf.link_id))
+            for intf_id, intf in intf_by_id.items()
+        },
+        "links": {
+            link.link_id: (
+                link, intf_by_id[link.interface_a_id], intf_by_id[link.interface_z_id], get_link_config(link)
+            )
+            for link in oess_topo["links"]
+        },
+    }
+    converted = {}
+    for kind, convert_bulk in [("ports", get_sdx_ports_bulk), ("links", get_sdx_links_bulk)]:
+        prev_entries = prev[kind]
+        missed = [
+            obj_id for obj_id, obj_deps in deps[kind].items()
+            if obj_id not in prev_entries or prev_entries[obj_id][0] != obj_deps
+        ]
+        objs = [deps[kind][obj_id][0] for obj_id in missed]
+        converted[kind] = dict(zip(missed, convert_bulk(oess_topo, objs, link_labels=link_labels)))
+    return deps, converted
+
+
+def new_topo_delta():
+    """Empty topology delta: added objects, removed ids and modified fields."""
+    return {kind: {"added": [], "removed": [], "modified": []} for kind in ["nodes", "ports", "links"]}
+
+
+def diff_sdx_object(delta, kind, cur_obj, new_obj, admin_fields, oper_fields):
+    """Record the fields that changed between two versions of an SDX object.
+
+    Returns the (diff_admin, diff_oper) flags of the change.
+    """
+    changes = {}
+    for field in admin_fields + oper_fields:
+        if new_obj[field] != cur_obj[field]:
+            changes[field] = new_obj[field]
+    if not changes:
+        return False, False
+    modified = {"id": new_obj["id"], "changes": changes}
+    if kind == "ports":
+        modified["node"] = new_obj["node"]
+    delta[kind]["modified"].append(modified)
+    diff_admin = any(field in changes for field in admin_fields)
+    diff_oper = any(field in changes for field in oper_fields)
+    return diff_admin, diff_oper
+
+
+def diff_sdx_objects(delta, kind, cur_objs, new_objs, cur_parents=None, new_parents=None):
+    """Record added, removed and modified objects, given {id: obj} of the changed objects.
+
+    Ports are nested into nodes: ports of added/removed nodes are not
+    reported on their own (cur_parents/new_parents are the node ids).
+    """
+    admin_fields, oper_fields = DIFF_FIELDS[kind]
+    diff_admin, diff_oper = False, False
+    for obj_id, new_obj in new_objs.items():
+        cur_obj = cur_objs.get(obj_id)
+        if cur_obj is None:
+            diff_admin = True
+            if cur_parents is None or new_obj["node"] in cur_parents:
+                delta[kind]["added"].append(new_obj)
+            continue
+        admin, oper = diff_sdx_object(delta, kind, cur_obj, new_obj, admin_fields, oper_fields)
+        diff_admin, diff_oper = diff_admin or admin, diff_oper or oper
+    for obj_id, cur_obj in cur_objs.items():
+        if obj_id in new_objs:
+            continue
+        diff_admin = True
+        if new_parents is None or cur_obj["node"] in new_parents:
+            delta[kind]["removed"].append(obj_id)
+    return diff_admin, diff_oper
+
+
+def new_sdx_topology(sdx_nodes, sdx_links):
+    """SDX topology of the given SDX nodes and links, with the timestamp and version of the current one."""
     return {
         "name": sdx_config["oxp_name"],
         "id": "urn:sdx:topology:%s" % (sdx_config["oxp_url"]),
         "model_version": sdx_config["model_version"],
-        "nodes": get_sdx_nodes(oess_topo),
-        "links": get_sdx_links(oess_topo),
+        "nodes": sdx_nodes,
+        "links": sdx_links,
         "services": ["l2vpn-ptp"],
         "timestamp": sdx_topo_conv.get("timestamp", utcnow()),
         "version": sdx_topo_conv.get("version", 1),
     }
 
 
-def check_topo_diff(cur_topo, new_topo):
+def convert_topo_incremental(oess_topo):
+    """Convert OESS topology reusing the SDX objects of unchanged OESS objects.
+
+    Returns the converted topology, the delta against the previous
+    conversion and its admin/oper diff flags, computed in the same pass.
+    """
+    global conv_cache, oess2sdx, sdx2oess
+    # the config overrides are compiled into a new config_index when the config changes
+    cache_key = (sdx_config["oxp_url"], config_index)
+    prev = conv_cache
+    if prev["key"] != cache_key:
+        prev = {"key": None, "nodes": {}, "ports": {}, "links": {}}
+    elif prev.get("oess_topo") is oess_topo:
+        # build_oess_topo() found nothing changed in OESS
+        conv_cache = dict(prev, key=cache_key, changed={"ports": set(), "links": set()})
+        total = len(prev["nodes"]) + len(prev["ports"]) + len(prev["links"])
+        inc_counter("oess_sdx_cache_requests_total", total, cache="conversion", result="hit")
+        return new_sdx_topology(*prev["sdx_topology"]), new_topo_delta(), False, False
+    new_cache = {"key": cache_key, "nodes": {}, "ports": {}, "links": {}, "oess_topo": oess_topo}
+    # OESS ids of the interfaces and links rebuilt or removed (None: everything changed)
+    new_cache["changed"] = None if prev["key"] is None else {"ports": set(), "links": set()}
+    # {sdx_id: obj} of previous/new versions of rebuilt and removed objects
+    changed = {kind: ({}, {}) for kind in ["nodes", "ports", "links"]}
+    deps, converted_bulk = convert_changed_bulk(oess_topo, prev)
+    # new maps swapped in at the end: requests iterate over the current ones without topo_lock
+    new_oess2sdx, new_sdx2oess = {}, {}
+
+    sdx_nodes = []
+    for node in oess_topo["nodes"]:
+        sdx_ports = []
+        for interface in get_node_interfaces(oess_topo, node):
+            port_deps = deps["ports"][interface.interface_id]
+            entry = prev["ports"].get(interface.interface_id)
+            if entry and entry[0] == port_deps:
+                sdx_port = entry[1]
+            else:
+                sdx_port = converted_bulk["ports"][interface.interface_id]
+                if new_cache["changed"] is not None:
+                    new_cache["changed"]["ports"].add(interface.interface_id)
+                if entry:
+                    changed["ports"][0][entry[1]["id"]] = entry[1]
+                changed["ports"][1][sdx_port["id"]] = sdx_port
+            new_cache["ports"][interface.interface_id] = (port_deps, sdx_port)
+            new_oess2sdx[interface.interface_id] = sdx_port
+            new_sdx2oess[sdx_port["id"]] = interface
+            sdx_ports.append(sdx_port)
+
+        content = node.content()
+        entry = prev["nodes"].get(node.node_id)
+        if entry and entry[0] == content and entry[1]["ports"] == sdx_ports:
+            sdx_node = entry[1]
+        elif entry and entry[0] == content:
+            # only the list of ports changed (accounted as port changes)
+            sdx_node = dict(entry[1], ports=sdx_ports)
+        else:
+            sdx_node = get_sdx_node(node, sdx_ports)
+            if entry:
+                changed["nodes"][0][entry[1]["id"]] = entry[1]
+            changed["nodes"][1][sdx_node["id"]] = sdx_node
+        new_cache["nodes"][node.node_id] = (content, sdx_node)
+        sdx_nodes.append(sdx_node)
+
+    sdx_links = []
+    for link in oess_topo["links"]:
+        link_deps = deps["links"][link.link_id]
+        entry = prev["links"].get(link.link_id)
+        if entry and entry[0] == link_deps:
+            sdx_link = entry[1]
+        else:
+            sdx_link = converted_bulk["links"][link.link_id]
+            if new_cache["changed"] is not None:
+                new_cache["changed"]["links"].add(link.link_id)
+            if entry:
+                changed["links"][0][entry[1]["id"]] = entry[1]
+            changed["links"][1][sdx_link["id"]] = sdx_link
+        new_cache["links"][link.link_id] = (link_deps, sdx_link)
+        sdx_links.append(sdx_link)
+
+    # objects removed from OESS
+    for kind in ["nodes", "ports", "links"]:
+        for obj_id, entry in prev[kind].items():
+            if obj_id not in new_cache[kind]:
+                changed[kind][0][entry[1]["id"]] = entry[1]
+                if kind != "nodes" and new_cache["changed"] is not None:
+                    new_cache["changed"][kind].add(obj_id)
+
+    new_cache["sdx_topology"] = (sdx_nodes, sdx_links)
+    converted = new_sdx_topology(sdx_nodes, sdx_links)
+    if prev["key"] is None:
+        # nothing to compare incrementally against, use the full diff
+        delta, diff_admin, diff_oper = get_topo_delta(sdx_topo_conv, converted)
+    else:
+        start = time.perf_counter()
+        delta, diff_admin, diff_oper = new_topo_delta(), False, False
+        cur_node_ids = {entry[1]["id"] for entry in prev["nodes"].values()}
+        new_node_ids = {sdx_node["id"] for sdx_node in sdx_nodes}
+        for kind in ["nodes", "ports", "links"]:
+            cur_objs, new_objs = changed[kind]
+            parents = (cur_node_ids, new_node_ids) if kind == "ports" else (None, None)
+            admin, oper = diff_sdx_objects(delta, kind, cur_objs, new_objs, *parents)
+            diff_admin, diff_oper = diff_admin or admin, diff_oper or oper
+        observe("oess_sdx_topology_diff_duration_seconds", time.perf_counter() - start, mode="incremental")
+    rebuilt = sum(len(changed[kind][1]) for kind in changed)
+    total = len(new_cache["nodes"]) + len(new_cache["ports"]) + len(new_cache["links"])
+    inc_counter("oess_sdx_cache_requests_total", total - rebuilt, cache="conversion", result="hit")
+    inc_counter("oess_sdx_cache_requests_total", rebuilt, cache="conversion", result="miss")
+    conv_cache = new_cache
+    oess2sdx, sdx2oess = new_oess2sdx, new_sdx2oess
+    return converted, delta, diff_admin, diff_oper
+
+
+def get_topo_delta(cur_topo, new_topo):
+    """Full diff between two converted topologies.
+
+    Returns the delta (added, removed and modified nodes, ports and links)
+    along with the admin/oper diff flags.
+    """
+    start = time.perf_counter()
+    delta = new_topo_delta()
     diff_admin, diff_oper = False, False
+    cur_nodes = {node["id"]: node for node in cur_topo["nodes"]}
+    new_nodes = {node["id"]: node for node in new_topo["nodes"]}
+    cur_ports = {port["id"]: port for node in cur_topo["nodes"] for port in node["ports"]}
+    new_ports = {port["id"]: port for node in new_topo["nodes"] for port in node["ports"]}
+    cur_links = {link["id"]: link for link in cur_topo["links"]}
+    new_links = {link["id"]: link for link in new_topo["links"]}
+    for kind, cur_objs, new_objs, parents in [
+        ("nodes", cur_nodes, new_nodes, (None, None)),
+        ("ports", cur_ports, new_ports, (cur_nodes, new_nodes)),
+        ("links", cur_links, new_links, (None, None)),
+    ]:
+        admin, oper = diff_sdx_objects(delta, kind, cur_objs, new_objs, *parents)
+        diff_admin, diff_oper = diff_admin or admin, diff_oper or oper
+    observe("oess_sdx_topology_diff_duration_seconds", time.perf_counter() - start, mode="full")
+    return delta, diff_admin, diff_oper
+
+
+class MemoryStateStore:
+    """In-process state: nothing is shared between workers.
+
+    The version counter still goes through VERSION_FILE, under an exclusive
+    file lock so concurrent increments are not lost.
+    """
 
-    #
-    # Nodes
-    #
-    remain_nodes = {}
-    for node in cur_topo["nodes"]:
-        remain_nodes[node["id"]] = node
-    for new_node in new_topo["nodes"]:
-        # node was added
-        cur_node = remain_nodes.pop(new_node["id"], None)
-        if not cur_node:
-            diff_admin = True
-            continue
-        if any([
-            new_node["location"] != cur_node["location"],
-            new_node["state"] != cur_node["state"],
-        ]):
-            diff_admin = True
-        if any([
-            new_node["status"] != cur_node["status"],
-        ]):
-            diff_oper = True
-
-        #
-        # Node > Ports
-        #
-        remain_ports = {}
-        for port in cur_node["ports"]:
-            remain_ports[port["id"]] = port
-        for new_port in new_node["ports"]:
-            cur_port = remain_ports.pop(new_port["id"], None)
-            if not cur_port:
-                diff_admin = True
-                continue
-            if any([
-                new_port["mtu"] != cur_port["mtu"],
-                new_port["nni"] != cur_port["nni"],
-                new_port["services"] != cur_port["services"],
-                new_port["state"] != cur_port["state"],
-                new_port["type"] != cur_port["type"],
-                new_port["private"] != cur_port["private"],
-            ]):
-                diff_admin = True
-            if any([
-                new_port["status"] != cur_port["status"],
-            ]):
-                diff_oper = True
-        # ports removed
-        if remain_ports:
-            diff_admin = True
-    # nodes removed
-    if remain_nodes:
-        diff_admin = True
+    shared = False
 
-    #
-    # Links
-    #
-    remain_links = {}
-    for link in cur_topo["links"]:
-        remain_links[link["id"]] = link
-    for new_link in new_topo["links"]:
-        # link was added
-        cur_link = remain_links.pop(new_link["id"], None)
-        if not cur_link:
-            diff_admin = True
-            continue
-        if any([
-            new_link["bandwidth"] != cur_link["bandwidth"],
-            new_link["ports"] != cur_link["ports"],
-            new_link["state"] != cur_link["state"],
-        ]):
-            diff_admin = True
-        if any([
-            new_link["status"] != cur_link["status"],
-        ]):
-            diff_oper = True
-    # links removed
-    if remain_links:
-        diff_admin = True
+    def incr_version(self, inc=1):
+        with open(VERSION_FILE, "a+") as version_file:
+            fcntl.flock(version_file, fcntl.LOCK_EX)
+            version_file.seek(0)
+            try:
+                version = int(version_file.read())
+            except ValueError:
+                version = 1
+            version += inc
+            version_file.seek(0)
+            version_file.truncate()
+            version_file.write(str(version))
+        return version
 
-    return diff_admin, diff_oper
+    def acquire_lease(self, name, ttl):
+        return True
 
+    def publish(self, state):
+        pass
 
-def parse_oess_circuit(circuit):
-    """Convert a circuit from OESS to SDX format."""
-    sdx_l2vpn = {}
-    sdx_l2vpn["service_id"] = circuit["circuit_id"]
-    sdx_l2vpn["name"] = circuit["description"].replace(NAME_PREFIX, "")
-    # TODO: status and state, what about decom circuits? what if all interfaces go down?
-    sdx_l2vpn["status"] = "up" if circuit["state"] == "active" else "down"
-    sdx_l2vpn["state"] = "enabled" if circuit["state"] == "active" else "disabled"
-    sdx_l2vpn["created_on"] = circuit["created_on"]
-    sdx_l2vpn["last_modified_on"] = circuit["last_modified_on"]
-    sdx_l2vpn["endpoints"] = [
-        {
-            "port_id": oess2sdx.get(circuit["endpoints"][0]["interface_id"], {}).get("id", "unknown"),
-            "vlan": circuit["endpoints"][0]["tag"]
-        },
-        {
-            "port_id": oess2sdx.get(circuit["endpoints"][1]["interface_id"], {}).get("id", "unknown"),
-            "vlan": circuit["endpoints"][1]["tag"]
-        },
-    ]
-    return sdx_l2vpn
+    def touch(self):
+        pass
 
+    def load(self, generation):
+        return 0, None
 
-@app.route("/", methods=["GET"])
-def home():
-    return jsonify({}), 204
+    def save_job(self, job, max_jobs):
+        pass
 
+    def load_job(self, job_id):
+        return None
 
-@app.route("/topology/2.0.0", methods=["GET"])
-def get_topology():
-    global sdx_topology, sdx_topo_conv
+
+class SqliteStateStore:
+    """State shared by all workers of a host through a SQLite file.
+
+    Keeps the version counter, the last converted topology with its port
+    maps (published with an increasing generation), and refresh leases so
+    only one worker polls OESS at a time.
+    """
+
+    shared = True
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.owner = "%s:%s" % (socket.gethostname(), os.getpid())
+        conn = self.connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute("CREATE TABLE IF NOT EXISTS lease (name TEXT PRIMARY KEY, owner TEXT, expires REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS job (id TEXT PRIMARY KEY, value TEXT, created REAL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS job_created ON job (created)")
+
+    def connect(self):
+        """Get the connection of the current thread."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    def get(self, conn, key, default=None):
+        row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set(self, conn, key, value):
+        conn.execute("REPLACE INTO kv (key, value) VALUES (?, ?)", (key, value))
+
+    def incr_version(self, inc=1):
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = self.get(conn, "version")
+            if version is None:
+                # carry over the version of the in-process backend
+                try:
+                    version = int(open(VERSION_FILE).read())
+                except (OSError, ValueError):
+                    version = 1
+            version = int(version) + inc
+            self.set(conn, "version", version)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return version
+
+    def acquire_lease(self, name, ttl):
+        conn = self.connect()
+        now = time.time()
+        conn.execute("INSERT OR IGNORE INTO lease (name, owner, expires) VALUES (?, '', 0)", (name,))
+        cur = conn.execute(
+            "UPDATE lease SET owner = ?, expires = ? WHERE name = ? AND (owner = ? OR expires < ?)",
+            (self.owner, now + ttl, name, self.owner, now),
+        )
+        return cur.rowcount == 1
+
+    def publish(self, state):
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            generation = int(self.get(conn, "generation", 0)) + 1
+            state["generation"] = generation
+            self.set(conn, "snapshot", json.dumps(state))
+            self.set(conn, "generation", generation)
+            self.set(conn, "published_at", state["published_at"])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return generation
+
+    def touch(self):
+        """Mark the published topology as still current."""
+        self.set(self.connect(), "published_at", time.time())
+
+    def load(self, generation):
+        """Get the publication time and the published state if newer than generation (else None).
+
+        An up-to-date worker only runs a single query.
+        """
+        conn = self.connect()
+        values = dict(conn.execute("SELECT key, value FROM kv WHERE key IN ('generation', 'published_at')"))
+        published_at = float(values.get("published_at", 0))
+        if int(values.get("generation", 0)) <= generation:
+            return published_at, None
+        state = json.loads(self.get(conn, "snapshot"))
+        state["published_at"] = published_at or state["published_at"]
+        return state["published_at"], state
+
+    def save_job(self, job, max_jobs):
+        """Save an L2VPN job, so any worker can report it, keeping the max_jobs most recent ones."""
+        conn = self.connect()
+        created = conn.execute("SELECT created FROM job WHERE id = ?", (job["job_id"],)).fetchone()
+        conn.execute(
+            "REPLACE INTO job (id, value, created) VALUES (?, ?, ?)",
+            (job["job_id"], json.dumps(job), created[0] if created else time.time()),
+        )
+        if created is None:
+            conn.execute(
+                "DELETE FROM job WHERE created < (SELECT created FROM job ORDER BY created DESC LIMIT 1 OFFSET ?)",
+                (max_jobs - 1,),
+            )
+
+    def load_job(self, job_id):
+        row = self.connect().execute("SELECT value FROM job WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+def get_state_store():
+    """Get the configured state backend (memory or sqlite)."""
+    global state_store
+    if state_store is None:
+        backend = sdx_config.get("state_backend", "memory")
+        if backend == "sqlite":
+            state_store = SqliteStateStore(sdx_config.get("state_file", STATE_FILE))
+        elif backend == "memory":
+            state_store = MemoryStateStore()
+        else:
+            raise ValueError("Invalid state_backend: %s" % (backend))
+    return state_store
+
+
+def capture_state():
+    """Take references to the current topology, port maps, version and deltas.
+
+    Cheap enough to run under topo_lock: the port maps are replaced, never
+    updated, by the next conversion.
+    """
+    with topo_delta_lock:
+        deltas = list(topo_deltas)
+    return {
+        "topology": sdx_topo_conv,
+        "version": sdx_version,
+        "sdx2oess": sdx2oess,
+        "oess2sdx": oess2sdx,
+        "deltas": deltas,
+        "delta_floor": topo_delta_floor,
+    }
+
+
+def get_state(captured=None):
+    """Get the current (or a captured) topology, port maps, version and deltas as plain data."""
+    if captured is None:
+        captured = capture_state()
+    return {
+        "topology": captured["topology"],
+        "version": captured["version"],
+        "sdx2oess": {port_id: intf.to_dict() for port_id, intf in captured["sdx2oess"].items()},
+        "oess2sdx": [[intf_id, sdx_port["id"]] for intf_id, sdx_port in captured["oess2sdx"].items()],
+        "deltas": captured["deltas"],
+        "delta_floor": captured["delta_floor"],
+        "published_at": time.time(),
+    }
+
+
+def apply_state(state, fetched_at):
+    """Serve the topology, port maps, version and deltas of a state (topo_lock held)."""
+    global sdx_topo_conv, sdx2oess, oess2sdx, sdx_version, sdx_topo_fetched_at
+    global topo_delta_floor, conv_cache
+    # decode everything before serving anything, a bad state changes nothing
+    topo = state["topology"]
+    ports = {port["id"]: port for node in topo["nodes"] for port in node["ports"]}
+    new_sdx2oess = {port_id: OessInterface.from_dict(intf) for port_id, intf in state["sdx2oess"].items()}
+    new_oess2sdx = {intf_id: ports[port_id] for intf_id, port_id in state["oess2sdx"] if port_id in ports}
+    delta_floor = tuple(state["delta_floor"]) if state["delta_floor"] else None
+    sdx2oess, oess2sdx = new_sdx2oess, new_oess2sdx
+    sdx_version = state["version"]
+    with topo_delta_lock:
+        topo_deltas.clear()
+        topo_deltas.extend(state["deltas"])
+        topo_delta_floor = delta_floor
+    # the next local conversion must diff against the loaded topology
+    conv_cache = {"key": None, "nodes": {}, "ports": {}, "links": {}}
+    sdx_topo_fetched_at = fetched_at
+    sdx_topo_conv = topo
+    update_topology_index(topo)
+    update_circuit_statuses()
+
+
+def publish_state(prev_topo):
+    """Share the current topology and port maps with the other workers."""
+    global state_generation
+    store = get_state_store()
+    if not store.shared:
+        return
+    if is_same_topology(sdx_topo_conv, prev_topo) and state_generation:
+        store.touch()
+        return
+    state_generation = store.publish(get_state())
+
+
+def is_same_topology(topo, prev_topo):
+    """Check if a converted topology has the same nodes and links objects as the previous one.
+
+    The incremental conversion reuses the objects of unchanged nodes and
+    links, so comparing identities is enough (and does not walk every port).
+    """
+    for key in ("nodes", "links"):
+        if len(topo[key]) != len(prev_topo[key]):
+            return False
+        if not all(obj is prev_obj for obj, prev_obj in zip(topo[key], prev_topo[key])):
+            return False
+    return True
+
+
+def sync_state():
+    """Load the topology published by another worker, if newer than ours."""
+    global sdx_topo_fetched_at, state_generation
+    store = get_state_store()
+    if not store.shared:
+        return
+    published_at, state = store.load(state_generation)
+    if state is None:
+        age = max(0, time.time() - published_at)
+        sdx_topo_fetched_at = max(sdx_topo_fetched_at, time.monotonic() - age)
+        return
+    # a refresh in progress in this worker will publish its own result
+    if not topo_lock.acquire(blocking=False):
+        return
     try:
-        new_topo = get_oess_topo()
-    except Exception as exc:
-        err = traceback.format_exc().replace("\n", ", ")
-        return jsonify({"result": "Failed to obtain topology from OESS: %s - %s" % (exc, err)}), 400
-    sdx_topology = new_topo
-    load_config()
+        age = max(0, time.time() - state["published_at"])
+        apply_state(state, time.monotonic() - age)
+        state_generation = state["generation"]
+    finally:
+        topo_lock.release()
+
+
+def get_snapshot_file():
+    """Path of the on-disk snapshot of the topology, None if disabled (the default)."""
+    return sdx_config.get("snapshot_file") or None
+
+
+def queue_snapshot():
+    """Hand the current state to the snapshot writer if the topology changed (topo_lock held).
+
+    Only references are taken here, the state is serialized, compressed and
+    written by the writer thread. A state still waiting for the writer is
+    replaced by the newer one.
+    """
+    global snapshot_saved_topo, snapshot_pending
+    path = get_snapshot_file()
+    topo = sdx_topo_conv
+    if not path or topo is snapshot_saved_topo:
+        return
+    prev_topo, snapshot_saved_topo = snapshot_saved_topo, topo
+    if prev_topo and is_same_topology(topo, prev_topo):
+        return
+    with snapshot_pending_lock:
+        scheduled = snapshot_pending is not None
+        snapshot_pending = (path, capture_state())
+    if not scheduled:
+        snapshot_pool.submit(write_pending_snapshot)
+
+
+def write_pending_snapshot():
+    """Write the latest state handed to the snapshot writer."""
+    global snapshot_pending
+    with snapshot_pending_lock:
+        pending, snapshot_pending = snapshot_pending, None
+    if pending is None:
+        return
     try:
-        converted = convert_topo(sdx_topology)
+        save_snapshot(*pending)
     except Exception as exc:
         err = traceback.format_exc().replace("\n", ", ")
-        app.logger.error(": %s - %s" % (exc, err))
-        return jsonify({"result": "Failed to convert topology - Check admin logs"}), 400
-    diff_admin, diff_oper = check_topo_diff(sdx_topo_conv, converted)
-    if diff_admin or diff_oper:
-        converted["timestamp"] = utcnow()
-    if diff_admin:
-        update_version()
-        converted["version"] = sdx_version
-    sdx_topo_conv = converted
-    return jsonify(converted), 200
+        app.logger.error("Failed to save snapshot: %s %s" % (exc, err))
 
 
-@app.route("/v1/l2vpn_ptp", methods=["POST"])
-def create_l2vpn_ptp():
-    content = request.get_json()
+def save_snapshot(path, captured):
+    """Save a captured topology, port maps and version to the snapshot file.
 
-    # Sanity checks
-    if not content:
-        return jsonify({"result": "Create L2VPN failed - not a valid JSON payload"}), 400
-    if "name" not in content:
-        msg = "Create L2VPN failed -  missing attribute: name"
-        return jsonify({"result": msg}), 400
-    
-    oess_params = [
-        ("method", "provision"),
-        ("workgroup_id", sdx_config["workgroup_id"]),
-        ("provision_time", -1),
-        ("remove_time", -1),
-        ("circuit_id", -1),
-        ("description", "%s%s" % (NAME_PREFIX, content["name"]))
-    ]
+    The file is written to a temporary path and renamed, so readers never
+    see a partial snapshot.
+    """
+    start = time.perf_counter()
+    state = get_state(captured)
+    state["oxp_url"] = sdx_config["oxp_url"]
+    data = gzip.compress(get_json_encoder()(state), compresslevel=1)
+    tmp_path = "%s.%s.tmp" % (path, os.getpid())
+    try:
+        with open(tmp_path, "wb") as snapshot_file:
+            snapshot_file.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    observe("oess_sdx_snapshot_duration_seconds", time.perf_counter() - start, operation="save")
+
+
+def read_snapshot(path):
+    """Read and decode the snapshot file, None if it can't be used."""
+    if os.stat(path).st_uid != os.getuid():
+        app.logger.error("Ignoring snapshot %s owned by another user" % (path))
+        return None
+    try:
+        with open(path, "rb") as snapshot_file:
+            data = gzip.decompress(snapshot_file.read())
+        state = orjson.loads(data) if orjson is not None else json.loads(data)
+    except (OSError, EOFError, zlib.error, ValueError) as exc:
+        app.logger.error("Ignoring unreadable snapshot %s: %s" % (path, exc))
+        return None
+    if not isinstance(state, dict) or not SNAPSHOT_KEYS <= state.keys():
+        app.logger.error("Ignoring invalid snapshot %s" % (path))
+        return None
+    if state["oxp_url"] != sdx_config["oxp_url"]:
+        app.logger.error("Ignoring snapshot %s of another OXP: %s" % (path, state["oxp_url"]))
+        return None
+    return state
+
+
+def load_snapshot():
+    """Serve the topology saved in the snapshot file until OESS is reached.
+
+    Returns True if a snapshot was loaded, False if there is none or it can't
+    be used, in which case the topology is fetched from OESS as usual.
+    """
+    global snapshot_saved_topo
+    path = get_snapshot_file()
+    if not path or not os.path.exists(path):
+        return False
+    start = time.perf_counter()
+    state = read_snapshot(path)
+    if state is None:
+        return False
+    with topo_lock:
+        try:
+            # fresh until the background reconciliation with OESS replaces it
+            apply_state(state, time.monotonic())
+        except Exception as exc:
+            err = traceback.format_exc().replace("\n", ", ")
+            app.logger.error("Ignoring invalid snapshot %s: %s %s" % (path, exc, err))
+            return False
+        snapshot_saved_topo = sdx_topo_conv
+    observe("oess_sdx_snapshot_duration_seconds", time.perf_counter() - start, operation="load")
+    return True
+
+
+def reconcile_snapshot():
+    """Refresh the topology loaded from the snapshot, retrying until OESS answers."""
+    delay = 1
+    while True:
+        try:
+            refresh_topology()
+            return
+        except Exception as exc:
+            app.logger.error("Failed to reconcile snapshot with OESS (retry in %ss): %s" % (delay, exc))
+        time.sleep(delay)
+        delay = min(2 * delay, 60)
+
+
+def poll_topology():
+    """Refresh the topology, unless another worker holds the refresh lease."""
+    ttl = 2 * get_topology_refresh_interval() + timeout
+    if get_state_store().acquire_lease("topology", ttl):
+        refresh_topology()
+    else:
+        sync_state()
+
+
+def refresh_topology(inc_version=1, since=None):
+    """Fetch topology from OESS, convert it and update the cached snapshot.
+
+    With since, the topology of a fetch started after that time (by a
+    concurrent caller) is returned instead of fetching it again.
+    """
+    global sdx_topology, sdx_topo_conv, sdx_topo_fetched_at, sdx_topo_fetch_started_at
+    with topo_lock:
+        if since is not None and sdx_topo_fetch_started_at >= since:
+            return sdx_topo_conv
+        started = time.monotonic()
+        try:
+            new_topo = get_oess_topo()
+        except Exception as exc:
+            err = traceback.format_exc().replace("\n", ", ")
+            raise ValueError("Failed to obtain topology from OESS: %s - %s" % (exc, err))
+        sdx_topology = new_topo
+        load_config()
+        resolve_config_index(sdx_topology)
+        try:
+            start = time.perf_counter()
+            converted, delta, diff_admin, diff_oper = convert_topo_incremental(sdx_topology)
+            observe("oess_sdx_topology_convert_duration_seconds", time.perf_counter() - start)
+        except Exception as exc:
+            err = traceback.format_exc().replace("\n", ", ")
+            app.logger.error(": %s - %s" % (exc, err))
+            raise ValueError("Failed to convert topology - Check admin logs")
+        if diff_admin or diff_oper:
+            converted["timestamp"] = utcnow()
+        if diff_admin:
+            update_version(inc_version)
+            converted["version"] = sdx_version
+        if "version" not in sdx_topo_conv:
+            reset_topo_deltas(converted)
+        elif diff_admin or diff_oper:
+            record_topo_delta(converted, delta, diff_admin)
+        prev_topo = sdx_topo_conv
+        sdx_topo_conv = converted
+        update_topology_index(converted, changed=diff_admin or diff_oper)
+        sdx_topo_fetched_at = time.monotonic()
+        sdx_topo_fetch_started_at = started
+        changed = conv_cache["changed"]
+        if changed is None:
+            update_circuit_statuses()
+        elif changed["ports"] or changed["links"]:
+            update_circuit_statuses(
+                [("interface", intf_id) for intf_id in changed["ports"]]
+                + [("link", link_id) for link_id in changed["links"]]
+            )
+        try:
+            publish_state(prev_topo)
+        except Exception as exc:
+            app.logger.error("Failed to publish state: %s" % (exc))
+        try:
+            queue_snapshot()
+        except Exception as exc:
+            app.logger.error("Failed to queue snapshot: %s" % (exc))
+        return converted
+
+
+def reset_topo_deltas(topo):
+    """Start the history of deltas from the given topology."""
+    global topo_delta_floor
+    with topo_delta_lock:
+        topo_deltas.clear()
+        topo_delta_floor = (topo["version"], topo["timestamp"], True)
+
+
+def record_topo_delta(topo, delta, diff_admin):
+    """Keep the delta that led to topo in the bounded history of recent deltas."""
+    global topo_delta_floor
+    entry = {"version": topo["version"], "timestamp": topo["timestamp"], "admin": diff_admin}
+    entry.update(delta)
+    history = int(sdx_config.get("topology_delta_history", 100))
+    with topo_delta_lock:
+        topo_deltas.append(entry)
+        while len(topo_deltas) > history:
+            dropped = topo_deltas.popleft()
+            topo_delta_floor = (dropped["version"], dropped["timestamp"], dropped["admin"])
+
+
+def get_topo_deltas_since(version, timestamp=None):
+    """Get the deltas newer than the given version (and timestamp).
+
+    Deltas are idempotent, so ambiguous ones are sent again: without
+    timestamp, all operational deltas of that version are returned. Returns
+    None if the history no longer covers it.
+    """
+    with topo_delta_lock:
+        deltas = list(topo_deltas)
+        floor = topo_delta_floor
+    if floor is None:
+        return None
+    floor_version, floor_timestamp, floor_admin = floor
+    if version < floor_version:
+        return None
+    if version == floor_version:
+        if timestamp is None and not floor_admin:
+            return None
+        if timestamp is not None and timestamp < floor_timestamp:
+            return None
+    result = []
+    for entry in deltas:
+        if entry["version"] > version:
+            result.append(entry)
+        elif entry["version"] == version:
+            if timestamp is None and not entry["admin"]:
+                result.append(entry)
+            elif timestamp is not None and entry["timestamp"] >= timestamp:
+                # timestamps have a resolution of seconds, resending is harmless
+                result.append(entry)
+    return result
+
+
+def run_poller(name, refresh, get_interval):
+    """Periodically call refresh in background."""
+    while True:
+        time.sleep(get_interval() or 1)
+        if not get_interval():
+            continue
+        try:
+            refresh()
+        except Exception as exc:
+            app.logger.error("Failed to refresh %s: %s" % (name, exc))
+
+
+def start_poller(name, refresh, get_interval):
+    """Start a background poller if configured."""
+    if not get_interval():
+        return
+    thread = threading.Thread(
+        target=run_poller, args=(name, refresh, get_interval), name="%s-poller" % (name), daemon=True
+    )
+    thread.start()
 
-    for uni_name in ["uni_a", "uni_z"]:
-        intf = sdx2oess.get(content.get(uni_name, {}).get("port_id"))
-        if not intf:
-            return jsonify({"result": "Invalid/Missing L2VPN endpoint attribute %s" % (uni_name)}), 400
-        vlan = content.get(uni_name, {}).get("tag", {}).get("value")
-        if not isinstance(vlan, int):
-            return jsonify({"result": "Invalid/Missing L2VPN endpoint vlan for %s" % (uni_name)}), 400
-        # TODO: check if vlan is within the allowed range
-        oess_params.append(
-            ("endpoint", '{"tag": %s,"interface":"%s","node":"%s","bandwidth":0}' % (vlan, intf["name"], intf["node"]["name"]))
-        )
 
+def get_topology_etag(topo):
+    """ETag of a converted topology: a hash of its serialized body, computed once per snapshot.
+
+    With json_streaming, the streamed body is hashed chunk by chunk
+    instead of being kept.
+    """
+    global topo_etag_cache
+    if not is_json_streaming():
+        return get_topology_body(topo)["etag"]
+    cache = topo_etag_cache
+    if cache["topology"] is topo:
+        return cache["etag"]
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in iter_topology_json(topo):
+        digest.update(chunk)
+    topo_etag_cache = {"topology": topo, "etag": digest.hexdigest()}
+    return topo_etag_cache["etag"]
+
+
+def get_topology_body(topo):
+    """Get the serialized (and optionally gzipped) topology, encoded once per snapshot."""
+    global topo_body_cache
+    cache = topo_body_cache
+    if cache["topology"] is topo:
+        inc_counter("oess_sdx_cache_requests_total", cache="topology_body", result="hit")
+        return cache
+    inc_counter("oess_sdx_cache_requests_total", cache="topology_body", result="miss")
+    with topo_body_lock:
+        if topo_body_cache["topology"] is topo:
+            return topo_body_cache
+        body = get_json_encoder()(topo)
+        gzip_body = None
+        if sdx_config.get("topology_gzip"):
+            gzip_body = gzip.compress(body, compresslevel=int(sdx_config.get("topology_gzip_level", 6)))
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        topo_body_cache = {"topology": topo, "body": body, "gzip": gzip_body, "etag": etag}
+    return topo_body_cache
+
+
+def build_topology_index(topo):
+    """Index the nodes, ports and links of a converted topology by id and by the query fields.
+
+    Each index maps a field value to the {id: object} having it, in
+    topology order.
+    """
+    index = {"version": topo.get("version"), "timestamp": topo.get("timestamp")}
+    for kind, fields in TOPOLOGY_QUERY_FIELDS.items():
+        index[kind] = {}
+        index[kind + "_by"] = {field: {} for field in fields}
+    nodes_by, ports_by, links_by = index["nodes_by"], index["ports_by"], index["links_by"]
+    for node in topo["nodes"]:
+        index["nodes"][node["id"]] = node
+        nodes_by["status"].setdefault(node["status"], {})[node["id"]] = node
+        nodes_by["state"].setdefault(node["state"], {})[node["id"]] = node
+        for port in node["ports"]:
+            index["ports"][port["id"]] = port
+            for field, value in [
+                ("node", port["node"]),
+                ("status", port["status"]),
+                ("state", port["state"]),
+                ("nni", bool(port["nni"])),
+            ]:
+                ports_by[field].setdefault(value, {})[port["id"]] = port
+            for service in port["services"]:
+                ports_by["service"].setdefault(service, {})[port["id"]] = port
+    for link in topo["links"]:
+        index["links"][link["id"]] = link
+        links_by["status"].setdefault(link["status"], {})[link["id"]] = link
+        links_by["state"].setdefault(link["state"], {})[link["id"]] = link
+        for port_id in link["ports"]:
+            links_by["port"].setdefault(port_id, {})[link["id"]] = link
+            port = index["ports"].get(port_id)
+            if port is not None:
+                links_by["node"].setdefault(port["node"], {})[link["id"]] = link
+    return index
+
+
+def update_topology_index(topo, changed=True):
+    """Index a newly converted topology for the query endpoints, unless it did not change."""
+    global topo_index
+    if changed or topo_index is None:
+        start = time.perf_counter()
+        topo_index = build_topology_index(topo)
+        observe("oess_sdx_topology_index_duration_seconds", time.perf_counter() - start)
+
+
+def parse_topology_filters(kind, args):
+    """Get the {field: value} filters of a query on nodes, ports or links.
+
+    Raises ValueError on unknown fields. Nodes can be given by name
+    instead of URN, and nni takes a boolean (1/0, true/false, yes/no).
+    """
+    filters = {}
+    for field, value in args.items():
+        if field == "refresh":
+            continue
+        if field not in TOPOLOGY_QUERY_FIELDS[kind]:
+            raise ValueError("Invalid filter %s - expected one of: %s" % (field, ", ".join(TOPOLOGY_QUERY_FIELDS[kind])))
+        if field == "node" and not value.startswith("urn:"):
+            value = "urn:sdx:node:%s:%s" % (sdx_config["oxp_url"], value)
+        elif field == "nni":
+            if value.lower() not in ["1", "true", "yes", "0", "false", "no"]:
+                raise ValueError("Invalid filter nni - expected a boolean, was %s" % (value))
+            value = value.lower() in ["1", "true", "yes"]
+        filters[field] = value
+    return filters
+
+
+def query_topology_index(index, kind, filters):
+    """Get the nodes, ports or links matching all filters, in topology order.
+
+    Starts from the smallest matching set, so the cost depends on the
+    number of matches rather than on the topology size.
+    """
+    if not filters:
+        return list(index[kind].values())
+    candidates = sorted((index[kind + "_by"][field].get(value, {}) for field, value in filters.items()), key=len)
+    first, others = candidates[0], candidates[1:]
+    return [obj for obj_id, obj in first.items() if all(obj_id in other for other in others)]
+
+
+def build_admin_map(name):
+    """Serialize the entries of an admin map (oess2sdx or sdx2oess) one by one, sorted by key.
+
+    Returns the "key":value JSON fragments, the positions of the entries
+    of each node (by URN) and the whole serialized map.
+    """
+    encode = get_json_encoder()
+    if name == "oess2sdx":
+        items = [(intf_id, sdx_port, sdx_port["node"]) for intf_id, sdx_port in oess2sdx.items()]
+    else:
+        items = [
+            (port_id, intf.to_dict(), oess2sdx.get(intf.interface_id, {}).get("node"))
+            for port_id, intf in sdx2oess.items()
+        ]
+    items.sort(key=lambda item: item[0])
+    entries, by_node = [], {}
+    for key, value, node in items:
+        # strip the braces of the single-entry object, the key is converted as in the whole map
+        entries.append(encode({key: value})[1:-1])
+        by_node.setdefault(node, []).append(len(entries) - 1)
+    return {"entries": entries, "by_node": by_node, "body": b"{" + b",".join(entries) + b"}"}
+
+
+def get_admin_map(name):
+    """Get the serialized admin map, built once per converted topology (see update_topology_index)."""
+    cache = admin_map_cache.get(name)
+    if cache is not None and cache["index"] is topo_index:
+        inc_counter("oess_sdx_cache_requests_total", cache="admin_map", result="hit")
+        return cache
+    inc_counter("oess_sdx_cache_requests_total", cache="admin_map", result="miss")
+    with admin_map_lock:
+        cache = admin_map_cache.get(name)
+        if cache is not None and cache["index"] is topo_index:
+            return cache
+        index = topo_index
+        cache = dict(build_admin_map(name), index=index)
+        admin_map_cache[name] = cache
+    return cache
+
+
+def get_admin_map_response(name):
+    """Response with an admin map, optionally restricted to a node and paginated (offset, limit).
+
+    The map keeps its shape (a JSON object, sorted by key), the number of
+    matching entries is given in the X-Total-Count header.
+    """
     try:
-        res = requests.post(sdx_config["oess_url"] + "/services/circuit.cgi", data=oess_params, verify=False, auth=(sdx_config["username"], sdx_config["password"]), timeout=timeout)
-        assert res.status_code == 200, res.text
-        assert "circuit_id" in res.json(), res.text
-        circuit_id = res.json()["circuit_id"]
-    except Exception as exc:
-        msg = "Failed to create L2VPN on OESS: %s" % (exc)
-        err = traceback.format_exc().replace("\n", ", ")
-        app.logger.error(msg + " " + err)
-        return jsonify({"result": msg}), 400
+        offset = int(request.args.get("offset", 0))
+        limit = request.args.get("limit")
+        limit = int(limit) if limit is not None else None
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError()
+    except ValueError:
+        return jsonify({"result": "Invalid offset/limit - expected non-negative integers"}), 400
+    node = request.args.get("node")
+    if node is not None and not node.startswith("urn:"):
+        node = "urn:sdx:node:%s:%s" % (sdx_config["oxp_url"], node)
+    cache = get_admin_map(name)
+    if node is None and offset == 0 and limit is None:
+        body, total = cache["body"], len(cache["entries"])
+    else:
+        if node is None:
+            positions = range(len(cache["entries"]))
+        else:
+            positions = cache["by_node"].get(node, [])
+        total = len(positions)
+        end = total if limit is None else offset + limit
+        body = b"{" + b",".join(cache["entries"][pos] for pos in positions[offset:end]) + b"}"
+    response = app.response_class(body, status=200, mimetype="application/json")
+    response.headers["X-Total-Count"] = str(total)
+    return response
+
+
+def get_json_encoder():
+    """Get the function serializing an object to compact JSON bytes.
+
+    orjson is used when installed (and json_fast_encoder is enabled), with
+    sorted keys as the Flask encoder.
+    """
+    if orjson is not None and sdx_config.get("json_fast_encoder", True):
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+        return lambda obj: orjson.dumps(obj, option=options)
+    return lambda obj: app.json.dumps(obj, separators=(",", ":")).encode()
 
-    return jsonify({"service_id": circuit_id}), 201
 
-@app.route("/v1/l2vpn_ptp", methods=["DELETE"])
-def delete_l2vpn_ptp():
-    content = request.get_json()
+def is_json_streaming():
+    return bool(sdx_config.get("json_streaming", False))
 
-    # Sanity check
-    if not content:
-        return jsonify({"result": "Create L2VPN failed - not a valid JSON payload"}), 400
 
-    name = content.get("name")
-    intf_id_0 = sdx2oess.get(content.get("uni_a", {}).get("interface_id"), {}).get("interface_id")
-    intf_id_1 = sdx2oess.get(content.get("uni_z", {}).get("interface_id"), {}).get("interface_id")
-    vlan_0 = content.get("uni_a", {}).get("tag", {}).get("value")
-    vlan_1 = content.get("uni_z", {}).get("tag", {}).get("value")
+def iter_json_array(items, encode):
+    """Serialize items as a JSON array, one item at a time."""
+    yield b"["
+    for idx, item in enumerate(items):
+        yield b"," + encode(item) if idx else encode(item)
+    yield b"]"
+
+
+def iter_json_object(items, encode):
+    """Serialize (key, value) pairs as a JSON object, one pair at a time.
+
+    Generator values are emitted as already serialized chunks.
+    """
+    yield b"{"
+    for idx, (key, value) in enumerate(items):
+        yield b"%s%s:" % (b"," if idx else b"", encode(str(key)))
+        if isinstance(value, types.GeneratorType):
+            yield from value
+        else:
+            yield encode(value)
+    yield b"}"
+
+
+def iter_buffered(chunks, size=STREAM_CHUNK_SIZE):
+    """Group small chunks so each write to the client is about size bytes."""
+    buffer, buffered = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield b"".join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def iter_gzip(chunks, level):
+    """Gzip a stream of chunks."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_topology_json(topo):
+    """Serialize the topology emitting nodes and links one at a time."""
+    encode = get_json_encoder()
+    return iter_buffered(iter_json_object(
+        (
+            (key, iter_json_array(value, encode) if key in ("nodes", "links") else value)
+            for key, value in sorted(topo.items())
+        ),
+        encode,
+    ))
+
+
+def get_circuit_elements(circuit):
+    """Get the ("interface", interface_id) and ("link", link_id) a circuit uses."""
+    elements = []
+    for endpoint in circuit.get("endpoints") or []:
+        if isinstance(endpoint, dict) and "interface_id" in endpoint:
+            elements.append(("interface", endpoint["interface_id"]))
+    for link in circuit.get("links") or []:
+        if isinstance(link, dict) and "link_id" in link:
+            elements.append(("link", link["link_id"]))
+    return elements
+
+
+def get_element_status(kind, element_id):
+    """Get the SDX status of an interface or link, None if unknown."""
+    if kind == "interface":
+        sdx_obj = oess2sdx.get(element_id)
+    else:
+        sdx_obj = conv_cache["links"].get(element_id, (None, None))[1]
+    return sdx_obj["status"] if sdx_obj else None
+
+
+def compute_circuit_status(circuit):
+    """Compute the SDX (status, state) of an OESS circuit from its ports and links."""
+    if circuit.get("state") == "deploying":
+        return "under provisioning", "enabled"
+    if circuit.get("state") != "active":
+        return "down", "disabled"
+    statuses = {get_element_status(kind, element_id) for kind, element_id in get_circuit_elements(circuit)}
+    if "down" in statuses:
+        return "down", "enabled"
+    if "error" in statuses:
+        return "error", "enabled"
+    return "up", "enabled"
+
+
+def get_circuit_status(circuit):
+    """Get the SDX (status, state) of an OESS circuit, precomputed for cached circuits."""
+    cache = circuit_cache
+    circuit_id = get_circuit_key(circuit["circuit_id"])
+    if cache["by_id"].get(circuit_id) is circuit:
+        status = cache["status"].get(circuit_id)
+        if status is not None:
+            return status
+    return compute_circuit_status(circuit)
+
+
+def update_circuit_statuses(elements=None):
+    """Recompute the status of the cached circuits using the given (kind, id) elements.
+
+    All circuits are recomputed when elements is None.
+    """
+    global circuit_status_generation
+    changed = []
+    with circuit_lock:
+        circuit_status_generation += 1
+        cache = circuit_cache
+        if elements is None:
+            circuit_ids = list(cache["by_id"])
+        else:
+            circuit_ids = set()
+            for element_key in elements:
+                circuit_ids.update(cache["by_element"].get(element_key, ()))
+        for circuit_id in circuit_ids:
+            circuit = cache["by_id"][circuit_id]
+            status = compute_circuit_status(circuit)
+            if status != cache["status"].get(circuit_id):
+                cache["status"][circuit_id] = status
+                changed.append((circuit_id, circuit))
+    track_circuit_status_changes(changed)
+
+
+def parse_oess_circuit(circuit):
+    """Convert a circuit from OESS to SDX format."""
+    sdx_l2vpn = {}
+    sdx_l2vpn["service_id"] = circuit["circuit_id"]
+    sdx_l2vpn["name"] = circuit["description"].replace(NAME_PREFIX, "")
+    sdx_l2vpn["status"], sdx_l2vpn["state"] = get_circuit_status(circuit)
+    sdx_l2vpn["created_on"] = circuit["created_on"]
+    sdx_l2vpn["last_modified_on"] = circuit["last_modified_on"]
+    sdx_l2vpn["endpoints"] = [
+        {
+            "port_id": oess2sdx.get(circuit["endpoints"][0]["interface_id"], {}).get("id", "unknown"),
+            "vlan": circuit["endpoints"][0]["tag"]
+        },
+        {
+            "port_id": oess2sdx.get(circuit["endpoints"][1]["interface_id"], {}).get("id", "unknown"),
+            "vlan": circuit["endpoints"][1]["tag"]
+        },
+    ]
+    return sdx_l2vpn
+
 
+def get_circuit_refresh_interval():
+    """Interval (seconds) of the background circuit poller (60 by default), 0 disables it."""
+    return float(sdx_config.get("circuit_refresh_interval", 60) or 0)
+
+
+def is_circuit_cache_stale():
+    """Check if the circuit cache is older than the allowed staleness."""
+    if not circuit_fetched_at:
+        return True
+    max_staleness = sdx_config.get("circuit_max_staleness")
+    if max_staleness is None:
+        max_staleness = 3 * get_circuit_refresh_interval()
+    return time.monotonic() - circuit_fetched_at >= float(max_staleness)
+
+
+def get_circuit_endpoints_key(circuit):
+    """Index key of a circuit by its (interface_id, vlan) endpoints."""
     try:
-        res = requests.get(sdx_config["oess_url"] + "/services/circuit.cgi?method=get&workgroup_id=%s" % (sdx_config["workgroup_id"]), verify=False, auth=(sdx_config["username"], sdx_config["password"]), timeout=timeout)
-        assert res.status_code == 200, res.text
-        data = res.json()
-    except Exception as exc:
-        msg = "Failed to DELETE L2VPN - Failed to get Circuits from OESS: %s" % (exc)
-        err = traceback.format_exc().replace("\n", ", ")
-        app.logger.error(msg + " " + err)
-        return jsonify({"result": msg}), 400
+        return tuple((endpoint["interface_id"], int(endpoint["tag"])) for endpoint in circuit["endpoints"])
+    except (KeyError, TypeError, ValueError):
+        return None
 
-    circuit_id = None
-    for circuit in data["results"]:
-        if all([
-            circuit["description"] == NAME_PREFIX + str(name),
-            len(circuit["endpoints"]) == 2,
-            circuit["endpoints"][0]["interface_id"] == intf_id_0,
-            circuit["endpoints"][1]["interface_id"] == intf_id_1,
-            int(circuit["endpoints"][0]["tag"]) == vlan_0,
-            int(circuit["endpoints"][1]["tag"]) == vlan_1,
-        ]):
-            circuit_id = circuit["circuit_id"]
-            break
 
-    if not circuit_id:
-        return jsonify({"result": "Failed to DELETE L2VPN - Not found"}), 400
+def get_circuit_key(circuit_id):
+    """Key of a circuit in the circuit cache: its OESS id, or "<source>:<id>" with oess_sources."""
+    if isinstance(circuit_id, str) and ":" in circuit_id:
+        return circuit_id
+    return int(circuit_id)
+
+
+def get_source_circuit_id(name, circuit_id):
+    """Service id of an OESS circuit of a source, namespaced for the named sources of oess_sources."""
+    if name is None:
+        return circuit_id
+    return "%s:%s" % (name, circuit_id)
+
+
+def split_circuit_id(circuit_id):
+    """Get the OESS source of a circuit and its id on that source."""
+    if isinstance(circuit_id, str) and ":" in circuit_id:
+        name, oess_id = circuit_id.split(":", 1)
+        return get_oess_source(name), oess_id
+    return get_oess_source(), circuit_id
+
+
+def parse_service_id(service_id):
+    """Parse a service_id given by a client into a circuit cache key, None if invalid.
+
+    Service ids are OESS circuit ids, or "<source>:<circuit id>" with oess_sources.
+    """
+    name, _, oess_id = str(service_id).rpartition(":")
+    if not oess_id.isdigit() or isinstance(service_id, bool):
+        return None
+    if get_oess_sources()[0]["name"] is None:
+        return None if name else int(oess_id)
+    if not any(source["name"] == name for source in get_oess_sources()):
+        return None
+    return get_source_circuit_id(name, int(oess_id))
+
+
+def get_circuit_sdx_name(circuit):
+    """Get the SDX name of a circuit, None if not created through SDX."""
+    description = circuit.get("description") or ""
+    if not description.startswith(NAME_PREFIX):
+        return None
+    return description.replace(NAME_PREFIX, "")
+
+
+def get_l2vpn_request_key(name, endpoints_key):
+    """Dedupe key of an L2VPN: its SDX name and (interface_id, vlan) endpoints in any order."""
+    if name is None or not endpoints_key:
+        return None
+    return name, tuple(sorted(endpoints_key))
+
+
+def index_circuit(cache, circuit):
+    """Add (or replace) a circuit into the cache indexes."""
+    circuit_id = get_circuit_key(circuit["circuit_id"])
+    unindex_circuit(cache, circuit_id)
+    cache["by_id"][circuit_id] = circuit
+    endpoints_key = get_circuit_endpoints_key(circuit)
+    cache["by_endpoints"].setdefault(endpoints_key, set()).add(circuit_id)
+    for vlan_key in endpoints_key or ():
+        cache["by_vlan"].setdefault(vlan_key, set()).add(circuit_id)
+    for element_key in get_circuit_elements(circuit):
+        cache["by_element"].setdefault(element_key, set()).add(circuit_id)
+    cache["status"][circuit_id] = compute_circuit_status(circuit)
+    name = get_circuit_sdx_name(circuit)
+    if name is not None:
+        cache["by_name"].setdefault(name, set()).add(circuit_id)
+    request_key = get_l2vpn_request_key(name, endpoints_key)
+    if request_key is not None:
+        cache["by_request"].setdefault(request_key, set()).add(circuit_id)
+
+
+def unindex_circuit(cache, circuit_id):
+    """Remove a circuit from the cache indexes."""
+    circuit = cache["by_id"].pop(circuit_id, None)
+    if circuit is None:
+        return
+    cache["status"].pop(circuit_id, None)
+    endpoints_key = get_circuit_endpoints_key(circuit)
+    name = get_circuit_sdx_name(circuit)
+    for index, key in [
+        ("by_endpoints", endpoints_key),
+        ("by_name", name),
+        ("by_request", get_l2vpn_request_key(name, endpoints_key)),
+    ] + [("by_vlan", vlan_key) for vlan_key in endpoints_key or ()] + [
+        ("by_element", element_key) for element_key in get_circuit_elements(circuit)
+    ]:
+        circuit_ids = cache[index].get(key)
+        if circuit_ids is None:
+            continue
+        circuit_ids.discard(circuit_id)
+        if not circuit_ids:
+            del cache[index][key]
+
+
+def apply_circuit_op(cache, circuit_id, circuit):
+    """Index circuit into the cache, or remove it when circuit is None."""
+    if circuit is None:
+        unindex_circuit(cache, circuit_id)
+    else:
+        index_circuit(cache, circuit)
+
+
+def refresh_circuits(since=None):
+    """Fetch all circuits of the workgroup(s) from OESS and rebuild the circuit cache.
+
+    With since, the cache of a fetch started after that time (by a
+    concurrent caller) is returned instead of fetching it again.
+    """
+    global circuit_cache, circuit_fetched_at, circuit_fetch_started_at
+    with circuit_refresh_lock:
+        if since is not None and circuit_fetch_started_at >= since:
+            return circuit_cache
+        started = start_circuit_fetch()
+        try:
+            status_generation = circuit_status_generation
+            circuits = get_oess_circuits()
+            cache = {"by_id": {}, "by_endpoints": {}, "by_name": {}, "by_vlan": {}, "by_request": {}, "by_element": {}, "status": {}}
+            for circuit in circuits:
+                index_circuit(cache, circuit)
+        except Exception:
+            with circuit_lock:
+                end_circuit_fetch(started)
+            raise
+        with circuit_lock:
+            # creates/deletes done while fetching may not be in the result yet
+            for op_time, circuit_id, circuit in circuit_local_ops:
+                if op_time >= started:
+                    apply_circuit_op(cache, circuit_id, circuit)
+            end_circuit_fetch(started)
+            trim_circuit_local_ops()
+            if status_generation != circuit_status_generation:
+                # the topology changed while fetching, statuses may be outdated
+                for circuit_id, circuit in cache["by_id"].items():
+                    cache["status"][circuit_id] = compute_circuit_status(circuit)
+            circuit_cache = cache
+            circuit_fetched_at = time.monotonic()
+            circuit_fetch_started_at = started
+        # the objects indexed above, whose statuses get_circuit_status() finds precomputed
+        track_circuit_changes(circuits)
+        return cache
+
+
+def get_oess_source_circuits(source):
+    """Fetch the circuits of the workgroup of an OESS source, with namespaced ids."""
+    res = oess_request("GET", "/services/circuit.cgi?method=get&workgroup_id=%s" % (source["workgroup_id"]), source)
+    assert res.status_code == 200, res.text
+    return [namespace_oess_circuit(source["name"], circuit) for circuit in res.json()["results"]]
+
+
+def get_oess_circuits():
+    """Fetch the circuits of all OESS sources.
+
+    With oess_sources, the sources are fetched concurrently and a failing
+    source keeps its circuits of the circuit cache; only the failure of
+    every source raises.
+    """
+    sources = get_oess_sources()
+    if sources[0]["name"] is None:
+        return get_oess_source_circuits(sources[0])
+    pool = new_oess_source_pool(sources)
+    futures = [(source, pool.submit(get_oess_source_circuits, source)) for source in sources]
+    pool.shutdown(wait=False)
+    circuits = []
+    errors = []
+    for source, future in futures:
+        name = source["name"]
+        try:
+            circuits.extend(future.result())
+        except Exception as exc:
+            errors.append("%s: %s" % (name, exc))
+            inc_counter("oess_sdx_oess_source_failures_total", source=name)
+            app.logger.error("Failed to fetch the circuits of OESS source %s, keeping the cached ones: %s" % (name, exc))
+            with circuit_lock:
+                circuits.extend(circuit for circuit in circuit_cache["by_id"].values() if circuit.get("source") == name)
+    if len(errors) == len(sources):
+        raise ValueError("No OESS source available - %s" % ("; ".join(errors)))
+    return circuits
+
+
+def namespace_oess_circuit(name, circuit):
+    """Copy a circuit of a named OESS source with namespaced ids: its own, its endpoints' and links'."""
+    if name is None:
+        return circuit
+    circuit = dict(circuit, circuit_id=get_source_circuit_id(name, circuit["circuit_id"]), source=name)
+    circuit["endpoints"] = [
+        dict(endpoint, interface_id="%s:%s" % (name, endpoint.get("interface_id")), node="%s.%s" % (name, endpoint.get("node")))
+        for endpoint in circuit.get("endpoints") or []
+    ]
+    if circuit.get("links"):
+        circuit["links"] = [dict(link, link_id="%s:%s" % (name, link.get("link_id"))) for link in circuit["links"]]
+    return circuit
+
+
+def get_oess_circuit(circuit_id):
+    """Fetch a circuit from its OESS source, None if not found."""
+    source, oess_id = split_circuit_id(circuit_id)
+    res = oess_request(
+        "GET",
+        "/services/circuit.cgi?method=get&workgroup_id=%s&circuit_id=%s" % (source["workgroup_id"], oess_id),
+        source,
+    )
+    assert res.status_code == 200, res.text
+    results = res.json().get("results", [])
+    if len(results) != 1:
+        return None
+    return namespace_oess_circuit(source["name"], results[0])
+
+
+def get_circuit_view(circuit):
+    """What the SDX controller sees of a circuit: (name, status, state, endpoints key)."""
+    return (get_circuit_sdx_name(circuit),) + get_circuit_status(circuit) + (get_circuit_endpoints_key(circuit),)
+
+
+def track_circuit_changes(circuits):
+    """Diff the SDX circuits with the ones of the previous refresh and queue change events.
+
+    Nothing is tracked while circuit_events_url is not set.
+    """
+    global circuit_snapshot
+    if not sdx_config.get("circuit_events_url"):
+        circuit_snapshot = None
+        return
+    snapshot = {
+        get_circuit_key(circuit["circuit_id"]): get_circuit_view(circuit)
+        for circuit in circuits
+        if get_circuit_sdx_name(circuit) is not None
+    }
+    prev, circuit_snapshot = circuit_snapshot, snapshot
+    if prev is None or not is_pushing_circuit_events():
+        return
+    for circuit_id, view in snapshot.items():
+        prev_view = prev.get(circuit_id)
+        if prev_view is None:
+            queue_circuit_event(get_circuit_event("created", circuit_id, view))
+        elif prev_view != view:
+            queue_circuit_event(get_circuit_event("modified", circuit_id, view))
+    for circuit_id, view in prev.items():
+        if circuit_id not in snapshot:
+            queue_circuit_event(get_circuit_event("deleted", circuit_id, view))
+
+
+def track_circuit_status_changes(circuits):
+    """Queue change events for the [(circuit_id, circuit)] whose status changed along the topology."""
+    if not circuits or circuit_snapshot is None or not is_pushing_circuit_events():
+        return
+    for circuit_id, circuit in circuits:
+        prev_view = circuit_snapshot.get(circuit_id)
+        if prev_view is None:
+            continue
+        view = get_circuit_view(circuit)
+        if view != prev_view:
+            circuit_snapshot[circuit_id] = view
+            queue_circuit_event(get_circuit_event("modified", circuit_id, view))
+
+
+def is_pushing_circuit_events():
+    """Check if this worker pushes circuit events."""
+    if not sdx_config.get("circuit_events_url"):
+        return False
+    # with a shared state backend, a single worker pushes the events
+    return get_state_store().acquire_lease("circuit-events", 2 * get_circuit_refresh_interval() + timeout)
+
+
+def get_circuit_event(event, circuit_id, view):
+    name, status, state, _ = view
+    return {
+        "service_id": circuit_id,
+        "name": name,
+        "event": event,
+        "status": status,
+        "state": state,
+        "timestamp": utcnow(),
+    }
+
+
+def queue_circuit_event(event):
+    """Queue an event, coalescing it with the pending event of the same circuit."""
+    with circuit_events_lock:
+        pending = circuit_events.pop(event["service_id"], None)
+        if pending is not None and pending["event"] == "created":
+            if event["event"] == "deleted":
+                # created and deleted before being pushed, nothing to tell
+                return
+            event = dict(event, event="created")
+        circuit_events[event["service_id"]] = event
 
+
+def requeue_circuit_events(events):
+    """Put back events that failed to be pushed, ahead of the ones queued since."""
+    global circuit_events
+    with circuit_events_lock:
+        queued, circuit_events = circuit_events, {event["service_id"]: event for event in events}
+    for event in queued.values():
+        queue_circuit_event(event)
+
+
+def get_circuit_events_interval():
+    """Interval (seconds) between pushes of circuit events, 0 if disabled."""
+    if not sdx_config.get("circuit_events_url"):
+        return 0
+    return float(sdx_config.get("circuit_events_interval", 1))
+
+
+def push_circuit_events():
+    """Push the queued circuit events to circuit_events_url, in batches.
+
+    On failure, the events are queued again and pushes are retried with
+    exponential backoff.
+    """
+    global circuit_events_failures, circuit_events_retry_at
+    url = sdx_config.get("circuit_events_url")
+    if not url or time.monotonic() < circuit_events_retry_at:
+        return
+    batch_size = max(1, int(sdx_config.get("circuit_events_batch_size", 100)))
+    while True:
+        with circuit_events_lock:
+            if not circuit_events:
+                return
+            events = [circuit_events.pop(circuit_id) for circuit_id in list(circuit_events)[:batch_size]]
+        try:
+            res = circuit_events_session.post(
+                url, json={"oxp_url": sdx_config["oxp_url"], "events": events}, timeout=timeout
+            )
+            assert res.status_code < 300, "HTTP %s %s" % (res.status_code, res.text[:200])
+        except Exception as exc:
+            requeue_circuit_events(events)
+            circuit_events_failures += 1
+            backoff = min(
+                float(sdx_config.get("circuit_events_max_backoff", 60)),
+                get_circuit_events_interval() * 2 ** circuit_events_failures,
+            )
+            circuit_events_retry_at = time.monotonic() + backoff
+            inc_counter("oess_sdx_circuit_events_total", len(events), result="failed")
+            app.logger.warning("Failed to push %d circuit events (retry in %.1fs): %s" % (len(events), backoff, exc))
+            return
+        circuit_events_failures = 0
+        inc_counter("oess_sdx_circuit_events_total", len(events), result="sent")
+
+
+def get_circuit_cache():
+    """Get the circuit cache, refreshing it from OESS if stale."""
+    if is_circuit_cache_stale():
+        inc_counter("oess_sdx_cache_requests_total", cache="circuits", result="miss")
+        return refresh_circuits(since=time.monotonic())
+    inc_counter("oess_sdx_cache_requests_total", cache="circuits", result="hit")
+    return circuit_cache
+
+
+def get_cached_circuits():
+    """Get the list of cached circuits, refreshing them from OESS if stale."""
+    cache = get_circuit_cache()
+    with circuit_lock:
+        return list(cache["by_id"].values())
+
+
+def start_circuit_fetch():
+    """Register a circuit fetch from OESS, returning its start time (see end_circuit_fetch)."""
+    with circuit_lock:
+        started = time.monotonic()
+        circuit_fetches[started] += 1
+    return started
+
+
+def end_circuit_fetch(started):
+    """Unregister a circuit fetch (circuit_lock held)."""
+    circuit_fetches[started] -= 1
+    if not circuit_fetches[started]:
+        del circuit_fetches[started]
+
+
+def trim_circuit_local_ops():
+    """Drop the local ops older than every circuit fetch in progress (circuit_lock held).
+
+    Fetches started after an op already see its result, so the list only
+    holds the ops done while fetching.
+    """
+    oldest = min(circuit_fetches, default=None)
+    if oldest is None:
+        circuit_local_ops.clear()
+    elif circuit_local_ops and circuit_local_ops[0][0] < oldest:
+        circuit_local_ops[:] = [op for op in circuit_local_ops if op[0] >= oldest]
+
+
+def update_cached_circuit(circuit_id, circuit=None, since=None):
+    """Update the circuit cache after our own create (circuit) or delete (None).
+
+    With since, the update is skipped if the circuit was updated after that time.
+    """
+    circuit_id = get_circuit_key(circuit_id)
+    with circuit_lock:
+        if since is not None and any(op[1] == circuit_id and op[0] >= since for op in circuit_local_ops):
+            return
+        trim_circuit_local_ops()
+        if circuit_fetches:
+            circuit_local_ops.append((time.monotonic(), circuit_id, circuit))
+        apply_circuit_op(circuit_cache, circuit_id, circuit)
+
+
+def refresh_circuit(circuit_id):
+    """Fetch a single circuit from OESS and update it into the circuit cache."""
+    started = start_circuit_fetch()
     try:
-        res = requests.get(sdx_config["oess_url"] + "/services/circuit.cgi?method=remove&workgroup_id=%s&circuit_id=%s" % (sdx_config["workgroup_id"], circuit_id), verify=False, auth=(sdx_config["username"], sdx_config["password"]), timeout=timeout)
-        assert res.status_code == 200, res.text
+        circuit = get_oess_circuit(circuit_id)
+        assert circuit is not None, "L2VPN service not found"
+        # a delete done while fetching must not be undone
+        update_cached_circuit(circuit_id, circuit, since=started)
     except Exception as exc:
-        msg = "Failed to delete L2VPN on OESS: %s" % (exc)
-        err = traceback.format_exc().replace("\n", ", ")
-        app.logger.error(msg + " " + err)
-        return jsonify({"result": msg}), 400
+        app.logger.error("Failed to refresh circuit %s: %s" % (circuit_id, exc))
+    finally:
+        with circuit_lock:
+            end_circuit_fetch(started)
 
-    return jsonify({"result": "L2VPN deleted successfully"}), 200
 
-@app.route("/l2vpn/1.0", methods=["POST"])
-def create_l2vpn():
-    content = request.get_json()
+def cache_created_circuit(circuit_id, name, endpoints):
+    """Index a circuit we just provisioned, given the [(intf, vlan)] endpoints.
+
+    A placeholder is indexed right away (reported "under provisioning")
+    and replaced in background by the circuit as reported by OESS.
+    """
+    circuit = {
+        "circuit_id": circuit_id,
+        "description": "%s%s" % (NAME_PREFIX, name),
+        "state": "deploying",
+        "created_on": "",
+        "last_modified_on": "",
+        "endpoints": [
+            {"interface_id": intf.interface_id, "tag": vlan, "node": intf.node_name, "interface": intf.name}
+            for intf, vlan in endpoints
+        ],
+    }
+    source = endpoints[0][0].get("source")
+    if source is not None:
+        circuit["source"] = source
+    update_cached_circuit(circuit_id, circuit)
+    circuit_fetch_pool.submit(refresh_circuit, circuit_id)
+
+
+def find_circuit_id(name, endpoints_key):
+    """Find the circuit by SDX name and endpoints, refreshing the cache once on miss."""
+    refreshed = is_circuit_cache_stale()
+    cache = get_circuit_cache()
+    while True:
+        with circuit_lock:
+            circuit_ids = cache["by_endpoints"].get(endpoints_key, set()) & cache["by_name"].get(name, set())
+        if circuit_ids:
+            return min(circuit_ids)
+        if refreshed:
+            return None
+        cache = refresh_circuits(since=time.monotonic())
+        refreshed = True
+
+
+def parse_vlan(vlan):
+    """Get the VLAN id of an endpoint, None if it is not a single VLAN (e.g. "any")."""
+    if isinstance(vlan, bool):
+        return None
+    if isinstance(vlan, int):
+        return vlan
+    if isinstance(vlan, str) and vlan.strip().isdigit():
+        return int(vlan)
+    return None
+
+
+def get_vlan_mask(vlan_range):
+    """Bitmap of the VLANs (1-4095) of a [[first, last], ...] range list, None if malformed."""
+    mask = 0
+    try:
+        for first, last in vlan_range:
+            first, last = max(int(first), 1), min(int(last), 4095)
+            if first <= last:
+                mask |= ((1 << (last - first + 1)) - 1) << first
+    except (TypeError, ValueError):
+        return None
+    return mask
+
+
+def get_port_vlan_mask(interface_id):
+    """Bitmap of the VLANs allowed on the SDX port of an OESS interface, None if unknown.
 
+    Computed once per converted port, from the vlan_range of its l2vpn-ptp service.
+    """
+    sdx_port = oess2sdx.get(interface_id)
+    if sdx_port is None:
+        return None
+    cached = vlan_mask_cache.get(interface_id)
+    if cached is not None and cached[0] is sdx_port:
+        return cached[1]
+    vlan_range = sdx_port.get("services", {}).get("l2vpn-ptp", {}).get("vlan_range", [])
+    mask = get_vlan_mask(vlan_range)
+    vlan_mask_cache[interface_id] = (sdx_port, mask)
+    return mask
+
+
+def check_vlan_range(intf, vlan, port_id):
+    """Raise ValueError if vlan is not allowed on the port."""
+    vlan_id = parse_vlan(vlan)
+    if vlan_id is None:
+        # other VLAN values ("any", "untagged", ...) are left to OESS
+        return
+    mask = get_port_vlan_mask(intf.interface_id)
+    if not 1 <= vlan_id <= 4095 or (mask is not None and not (mask >> vlan_id) & 1):
+        raise ValueError("Invalid endpoint - vlan %s not available on %s" % (vlan, port_id))
+
+
+def get_vlan_keys(circuit_endpoints):
+    """Get the (interface_id, vlan) of the single VLAN endpoints of a circuit."""
+    vlan_keys = []
+    for intf, vlan in circuit_endpoints:
+        vlan_id = parse_vlan(vlan)
+        if vlan_id is not None:
+            vlan_keys.append((intf, (intf.interface_id, vlan_id)))
+    return vlan_keys
+
+
+def get_vlan_conflict(circuit_endpoints, request_key=None):
+    """Get the first (interface, vlan) already used by a known or in-flight circuit.
+
+    The circuits of the circuit cache are looked up even when it is stale,
+    as it still has the circuits created through this service (see
+    check_vlan_conflict()). The VLANs of the circuits, or the create in
+    progress, matching request_key (same name and endpoints) are not
+    conflicts: such a request is deduplicated instead. Neither are the VLANs
+    of circuits whose removal is queued, as jobs on the same ports run in
+    order. Must be called with circuit_lock held.
+    """
+    same_circuits = circuit_cache["by_request"].get(request_key, ()) if request_key is not None else ()
+    check_reservations = request_key is None or request_key not in l2vpn_inflight
+    for intf, vlan_key in get_vlan_keys(circuit_endpoints):
+        if check_reservations and vlan_key in vlan_reservations:
+            return intf, vlan_key[1]
+        if any(
+            circuit_id not in same_circuits and ("service", str(circuit_id)) not in l2vpn_job_queues
+            for circuit_id in circuit_cache["by_vlan"].get(vlan_key, ())
+        ):
+            return intf, vlan_key[1]
+    return None
+
+
+def check_vlan_conflict(circuit_endpoints, request_key=None):
+    """Raise ValueError if a VLAN is already used on its port.
+
+    A conflict found in a stale circuit cache is checked again against the
+    circuits of OESS, in case the circuit was removed out of band (it is
+    kept if OESS can't be reached).
+    """
+    with circuit_lock:
+        conflict = get_vlan_conflict(circuit_endpoints, request_key)
+    if conflict is not None and is_circuit_cache_stale():
+        try:
+            get_circuit_cache()
+        except Exception as exc:
+            app.logger.error("Failed to refresh the circuit cache: %s" % (exc))
+        else:
+            with circuit_lock:
+                conflict = get_vlan_conflict(circuit_endpoints, request_key)
+    if conflict is not None:
+        intf, vlan = conflict
+        raise ValueError("Invalid endpoint - vlan %s already in use on %s" % (vlan, get_port_urn(intf)))
+
+
+def reserve_vlans(circuit_endpoints):
+    """Reserve the VLANs of a circuit being provisioned, raise ValueError on conflict."""
+    vlan_keys = {vlan_key for _, vlan_key in get_vlan_keys(circuit_endpoints)}
+    with circuit_lock:
+        conflict = get_vlan_conflict(circuit_endpoints)
+        if conflict is None:
+            vlan_reservations.update(vlan_keys)
+            return vlan_keys
+    intf, vlan = conflict
+    raise ValueError("Invalid endpoint - vlan %s already in use on %s" % (vlan, get_port_urn(intf)))
+
+
+def release_vlans(vlan_keys):
+    with circuit_lock:
+        vlan_reservations.difference_update(vlan_keys)
+
+
+def validate_l2vpn(content):
+    """Validate an L2VPN request against sdx2oess.
+
+    Returns the OESS provision params and the [(interface, vlan)] endpoints,
+    raises ValueError if the request is invalid.
+    """
     # Sanity checks
-    if not content:
-        return jsonify({"result": "Create L2VPN failed - not a valid JSON payload"}), 400
+    if not content or not isinstance(content, dict):
+        raise ValueError("Create L2VPN failed - not a valid JSON payload")
     if "name" not in content:
-        msg = "Create L2VPN failed -  missing attribute: name"
-        return jsonify({"result": msg}), 400
+        raise ValueError("Create L2VPN failed -  missing attribute: name")
     endpoints = content.get("endpoints", [])
+    if not isinstance(endpoints, list):
+        raise ValueError("Create L2VPN failed - invalid list of endpoints: %s" % (endpoints))
     if len(endpoints) != 2:
-        msg = "Create L2VPN failed - invalid list of endpoints: expected=2 was=%d" % (len(endpoints))
-        return jsonify({"result": msg}), 400
-    
-    oess_params = [
-        ("method", "provision"),
-        ("workgroup_id", sdx_config["workgroup_id"]),
-        ("provision_time", -1),
-        ("remove_time", -1),
-        ("circuit_id", -1),
-        ("description", "%s%s" % (NAME_PREFIX, content["name"]))
-    ]
+        raise ValueError("Create L2VPN failed - invalid list of endpoints: expected=2 was=%d" % (len(endpoints)))
 
+    circuit_endpoints = []
     for endpoint in endpoints:
         if not isinstance(endpoint, dict):
-            return jsonify({"result": "Invalid endpoint param format"}), 400
+            raise ValueError("Invalid endpoint param format")
         port_id = endpoint.get("port_id")
         intf = sdx2oess.get(port_id)
         if not intf:
-            return jsonify({"result": "Invalid endpoint - not found: %s" % (port_id)}), 400
-        # TODO: check if vlan is within the allowed range
+            raise ValueError("Invalid endpoint - not found: %s" % (port_id))
         vlan = endpoint.get("vlan")
+        check_vlan_range(intf, vlan, port_id)
+        circuit_endpoints.append((intf, vlan))
+    check_vlan_conflict(circuit_endpoints, get_circuit_endpoints_request_key(content["name"], circuit_endpoints))
+    return get_provision_params(content["name"], circuit_endpoints), circuit_endpoints
+
+
+def get_provision_params(name, circuit_endpoints):
+    """OESS provision params of an L2VPN, for the OESS source of its [(interface, vlan)] endpoints.
+
+    Raises ValueError if the endpoints belong to different OESS sources.
+    """
+    sources = {intf.get("source") for intf, _ in circuit_endpoints}
+    if len(sources) > 1:
+        raise ValueError("Invalid endpoints - ports of different OESS sources: %s" % (", ".join(sorted(sources))))
+    source = get_oess_source(sources.pop() if sources else None)
+    oess_params = [
+        ("method", "provision"),
+        ("workgroup_id", source["workgroup_id"]),
+        ("provision_time", -1),
+        ("remove_time", -1),
+        ("circuit_id", -1),
+        ("description", "%s%s" % (NAME_PREFIX, name))
+    ]
+    for intf, vlan in circuit_endpoints:
         oess_params.append(
-            ("endpoint", '{"tag": %s,"interface":"%s","node":"%s","bandwidth":0}' % (vlan, intf["name"], intf["node"]["name"]))
+            ("endpoint", '{"tag": %s,"interface":"%s","node":"%s","bandwidth":0}' % (vlan, intf.name, get_oess_node_name(intf)))
         )
+    return oess_params
+
+
+def provision_l2vpn(oess_params, source=None):
+    """Provision a circuit on an OESS source, returning its circuit_id."""
+    if source is None:
+        source = get_oess_source()
+    res = oess_request("POST", "/services/circuit.cgi", source, data=oess_params)
+    assert res.status_code == 200, res.text
+    assert "circuit_id" in res.json(), res.text
+    return get_source_circuit_id(source["name"], res.json()["circuit_id"])
+
+
+def remove_l2vpn(service_id):
+    """Remove a circuit from its OESS source."""
+    source, oess_id = split_circuit_id(service_id)
+    res = oess_request(
+        "GET",
+        "/services/circuit.cgi?method=remove&workgroup_id=%s&circuit_id=%s" % (source["workgroup_id"], oess_id),
+        source,
+    )
+    assert res.status_code == 200, res.text
+
+
+def get_circuit_endpoints_request_key(name, circuit_endpoints):
+    """Dedupe key of an L2VPN request, None if a VLAN is not a single VLAN id."""
+    endpoints_key = tuple((intf.interface_id, parse_vlan(vlan)) for intf, vlan in circuit_endpoints)
+    if any(vlan is None for _, vlan in endpoints_key):
+        return None
+    return get_l2vpn_request_key(str(name), endpoints_key)
+
 
+def find_duplicate_l2vpn(request_key):
+    """Find a circuit with the same name and endpoints as an L2VPN request.
+
+    A match of an outdated circuit cache is checked against OESS first; a
+    request matching no cached circuit never calls OESS here.
+    """
+    with circuit_lock:
+        circuit_ids = circuit_cache["by_request"].get(request_key)
+        circuit_id = min(circuit_ids) if circuit_ids else None
+    if circuit_id is None or not is_circuit_cache_stale():
+        return circuit_id
+    try:
+        circuit = get_oess_circuit(circuit_id)
+    except Exception as exc:
+        app.logger.error("Failed to check circuit %s: %s" % (circuit_id, exc))
+        return None
+    if circuit is None:
+        update_cached_circuit(circuit_id)
+        return None
+    if get_l2vpn_request_key(get_circuit_sdx_name(circuit), get_circuit_endpoints_key(circuit)) != request_key:
+        return None
+    return circuit_id
+
+
+def create_l2vpn_item(content, oess_params, circuit_endpoints):
+    """Provision a validated L2VPN, returning (response payload, status code).
+
+    A request matching an existing circuit (same name and endpoints) gets
+    its service_id without provisioning anything, and identical requests
+    in progress share the same OESS provisioning.
+    """
+    request_key = get_circuit_endpoints_request_key(content["name"], circuit_endpoints)
+    if request_key is None:
+        return provision_l2vpn_item(content, oess_params, circuit_endpoints)
+    circuit_id = find_duplicate_l2vpn(request_key)
+    if circuit_id is not None:
+        inc_counter("oess_sdx_l2vpn_dedupe_total", reason="existing")
+        return {"service_id": circuit_id}, 201
+    with l2vpn_inflight_lock:
+        future = l2vpn_inflight.get(request_key)
+        leader = future is None
+        if leader:
+            future = l2vpn_inflight[request_key] = Future()
+    if not leader:
+        inc_counter("oess_sdx_l2vpn_dedupe_total", reason="in_progress")
+        return future.result()
     try:
-        res = requests.post(sdx_config["oess_url"] + "/services/circuit.cgi", data=oess_params, verify=False, auth=(sdx_config["username"], sdx_config["password"]), timeout=timeout)
-        assert res.status_code == 200, res.text
-        assert "circuit_id" in res.json(), res.text
-        circuit_id = res.json()["circuit_id"]
+        result = provision_l2vpn_item(content, oess_params, circuit_endpoints)
+    except Exception as exc:
+        # followers get the same response as the leader, never an exception
+        msg = "Failed to create L2VPN: %s" % (exc)
+        err = traceback.format_exc().replace("\n", ", ")
+        app.logger.error(msg + " " + err)
+        result = {"result": msg}, 400
+    except BaseException as exc:
+        future.set_exception(exc)
+        raise
+    finally:
+        if not future.done():
+            future.set_result(result)
+        with l2vpn_inflight_lock:
+            del l2vpn_inflight[request_key]
+    return result
+
+
+def provision_l2vpn_item(content, oess_params, circuit_endpoints):
+    """Reserve the VLANs of an L2VPN and provision it on OESS."""
+    try:
+        vlan_keys = reserve_vlans(circuit_endpoints)
+    except ValueError as exc:
+        return {"result": str(exc)}, 400
+    try:
+        circuit_id = provision_l2vpn(oess_params, get_oess_source(circuit_endpoints[0][0].get("source")))
     except Exception as exc:
         msg = "Failed to create L2VPN on OESS: %s" % (exc)
         err = traceback.format_exc().replace("\n", ", ")
         app.logger.error(msg + " " + err)
-        return jsonify({"result": msg}), 400
+        return {"result": msg}, 400
+    else:
+        cache_created_circuit(circuit_id, content["name"], circuit_endpoints)
+    finally:
+        release_vlans(vlan_keys)
+    return {"service_id": circuit_id}, 201
 
-    return jsonify({"service_id": circuit_id}), 201
 
-@app.route("/l2vpn/1.0/<int:service_id>", methods=["DELETE"])
-def delete_l2vpn(service_id):
+def delete_l2vpn_item(service_id):
+    """Remove an L2VPN, returning (response payload, status code)."""
     try:
-        res = requests.get(sdx_config["oess_url"] + "/services/circuit.cgi?method=remove&workgroup_id=%s&circuit_id=%s" % (sdx_config["workgroup_id"], service_id), verify=False, auth=(sdx_config["username"], sdx_config["password"]), timeout=timeout)
-        assert res.status_code == 200, res.text
+        remove_l2vpn(service_id)
     except Exception as exc:
         msg = "Failed to delete L2VPN on OESS: %s" % (exc)
         err = traceback.format_exc().replace("\n", ", ")
         app.logger.error(msg + " " + err)
+        return {"result": msg}, 400
+    update_cached_circuit(service_id)
+    return {"result": "L2VPN deleted successfully"}, 200
+
+
+def is_l2vpn_async():
+    """Check if the L2VPN create/delete of the current request runs as a background job.
+
+    Enabled for all requests by l2vpn_async, or per request with a
+    "Prefer: respond-async" header.
+    """
+    return bool(sdx_config.get("l2vpn_async")) or "respond-async" in request.headers.get("Prefer", "")
+
+
+def get_l2vpn_job_pool():
+    """Get the pool running L2VPN jobs (l2vpn_job_workers threads)."""
+    global l2vpn_job_pool
+    with l2vpn_jobs_lock:
+        if l2vpn_job_pool is None:
+            workers = max(1, int(sdx_config.get("l2vpn_job_workers", 4)))
+            l2vpn_job_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="l2vpn-job")
+    return l2vpn_job_pool
+
+
+def save_l2vpn_job(job):
+    """Share a job state through the state backend, so other workers can report it."""
+    try:
+        get_state_store().save_job(dict(job), int(sdx_config.get("l2vpn_jobs_max", 10000)))
+    except Exception as exc:
+        app.logger.error("Failed to save L2VPN job %s: %s" % (job["job_id"], exc))
+
+
+def is_l2vpn_job_ready(job_id):
+    """Check if a job is first in the queue of all its ordering keys (l2vpn_jobs_lock held)."""
+    return all(l2vpn_job_queues[key][0] == job_id for key in l2vpn_job_tasks[job_id][2])
+
+
+def submit_l2vpn_job(operation, func, args, keys, service_id=None, barrier=False):
+    """Queue func(*args), returning (response payload, status code), as an L2VPN job.
+
+    Jobs sharing an ordering key (a port, or the service they delete) run
+    one at a time in submission order, others run concurrently on the job
+    pool. A barrier job (whose ports are unknown) runs after every job
+    queued before it, and holds back the jobs queued after it until it
+    finishes. Only the last l2vpn_jobs_max jobs are kept.
+    """
+    keys = set(keys)
+    job = {
+        "job_id": uuid.uuid4().hex,
+        "operation": operation,
+        "status": "pending",
+        "service_id": service_id,
+        "created_at": utcnow(),
+        "started_at": None,
+        "finished_at": None,
+        "status_code": None,
+        "result": None,
+    }
+    max_jobs = max(1, int(sdx_config.get("l2vpn_jobs_max", 10000)))
+    with l2vpn_jobs_lock:
+        l2vpn_jobs[job["job_id"]] = job
+        # forget the oldest finished jobs
+        for job_id in list(l2vpn_jobs):
+            if len(l2vpn_jobs) <= max_jobs:
+                break
+            if job_id not in l2vpn_job_tasks:
+                del l2vpn_jobs[job_id]
+        if barrier:
+            keys.update(l2vpn_job_queues)
+            keys.add(L2VPN_JOB_BARRIER)
+        elif L2VPN_JOB_BARRIER in l2vpn_job_queues:
+            keys.add(L2VPN_JOB_BARRIER)
+        l2vpn_job_tasks[job["job_id"]] = (func, args, keys, time.monotonic())
+        for key in l2vpn_job_tasks[job["job_id"]][2]:
+            l2vpn_job_queues.setdefault(key, collections.deque()).append(job["job_id"])
+        ready = is_l2vpn_job_ready(job["job_id"])
+        pending = dict(job)
+    save_l2vpn_job(pending)
+    if ready:
+        get_l2vpn_job_pool().submit(run_l2vpn_job, job["job_id"])
+    return pending
+
+
+def run_l2vpn_job(job_id):
+    """Run a queued job, then start the jobs it was holding back."""
+    with l2vpn_jobs_lock:
+        func, args, keys, queued_at = l2vpn_job_tasks[job_id]
+        job = l2vpn_jobs[job_id]
+        job["status"] = "running"
+        job["started_at"] = utcnow()
+        running = dict(job)
+    observe("oess_sdx_l2vpn_job_wait_seconds", time.monotonic() - queued_at, operation=running["operation"])
+    save_l2vpn_job(running)
+    try:
+        result, status = func(*args)
+    except Exception as exc:
+        msg = "Failed to run L2VPN job: %s" % (exc)
+        err = traceback.format_exc().replace("\n", ", ")
+        app.logger.error(msg + " " + err)
+        result, status = {"result": msg}, 400
+    with l2vpn_jobs_lock:
+        job["status"] = "succeeded" if status < 300 else "failed"
+        job["finished_at"] = utcnow()
+        job["status_code"] = status
+        job["result"] = result
+        if job["service_id"] is None and status < 300:
+            job["service_id"] = result.get("service_id")
+        finished = dict(job)
+        del l2vpn_job_tasks[job_id]
+        ready = []
+        for key in keys:
+            queue = l2vpn_job_queues[key]
+            queue.popleft()
+            if not queue:
+                del l2vpn_job_queues[key]
+            elif queue[0] not in ready and is_l2vpn_job_ready(queue[0]):
+                ready.append(queue[0])
+    inc_counter("oess_sdx_l2vpn_jobs_total", operation=finished["operation"], status=finished["status"])
+    save_l2vpn_job(finished)
+    pool = get_l2vpn_job_pool()
+    for next_id in ready:
+        pool.submit(run_l2vpn_job, next_id)
+
+
+def get_l2vpn_job(job_id):
+    """Get a job by id, from this worker or the state backend, None if unknown."""
+    with l2vpn_jobs_lock:
+        job = l2vpn_jobs.get(job_id)
+        if job is not None:
+            return dict(job)
+    try:
+        return get_state_store().load_job(job_id)
+    except Exception as exc:
+        app.logger.error("Failed to load L2VPN job %s: %s" % (job_id, exc))
+        return None
+
+
+def get_l2vpn_job_response(job):
+    """Response payload of a queued job: its id and status."""
+    return {"job_id": job["job_id"], "status": job["status"]}, 202
+
+
+def queue_create_l2vpn(content, oess_params, circuit_endpoints):
+    """Queue the creation of a validated L2VPN, ordered with the other jobs on its ports."""
+    keys = [("port", str(intf.interface_id)) for intf, _ in circuit_endpoints]
+    job = submit_l2vpn_job("create", create_l2vpn_item, (content, oess_params, circuit_endpoints), keys)
+    return get_l2vpn_job_response(job)
+
+
+def queue_delete_l2vpn(service_id):
+    """Queue the removal of an L2VPN, ordered with the other jobs on its ports.
+
+    The ports are taken from the circuit cache, or from OESS when the cache
+    misses the circuit or is outdated. If OESS can't be reached, the removal
+    is ordered with every other job instead.
+    """
+    keys = [("service", str(service_id))]
+    with circuit_lock:
+        circuit = circuit_cache["by_id"].get(service_id)
+    barrier = False
+    if circuit is None or is_circuit_cache_stale():
+        try:
+            circuit = get_oess_circuit(service_id)
+        except Exception as exc:
+            app.logger.error("Failed to get the ports of circuit %s, ordering its removal with all jobs: %s" % (service_id, exc))
+            barrier = True
+    if circuit is not None:
+        keys += [("port", str(endpoint.get("interface_id"))) for endpoint in circuit.get("endpoints") or []]
+    job = submit_l2vpn_job("delete", delete_l2vpn_item, (service_id,), keys, service_id=service_id, barrier=barrier)
+    return get_l2vpn_job_response(job)
+
+
+def make_l2vpn_response(result, status):
+    """JSON response of an L2VPN request, with the Location of the job when queued."""
+    response = jsonify(result)
+    response.status_code = status
+    if status == 202:
+        response.headers["Location"] = "/l2vpn/1.0/jobs/%s" % (result["job_id"])
+    return response
+
+
+def run_idempotent(handler):
+    """Run a create request once per Idempotency-Key header, replaying its result to retries.
+
+    Only successful results are kept (at most idempotency_keys_max, for
+    idempotency_key_ttl seconds), failed requests can be retried. Retries
+    arriving while the request is in progress wait for its result.
+    """
+    key = request.headers.get("Idempotency-Key")
+    max_keys = int(sdx_config.get("idempotency_keys_max", 10000))
+    if not key or not max_keys:
+        return handler()
+    key = (request.path, key)
+    request_hash = hashlib.sha256(request.get_data()).hexdigest()
+    now = time.monotonic()
+    with idempotency_lock:
+        while idempotency_keys and next(iter(idempotency_keys.values()))[1] <= now:
+            idempotency_keys.popitem(last=False)
+        entry = idempotency_keys.get(key)
+        leader = entry is None
+        if leader:
+            entry = idempotency_keys[key] = (
+                request_hash, now + float(sdx_config.get("idempotency_key_ttl", 86400)), Future()
+            )
+            while len(idempotency_keys) > max_keys:
+                idempotency_keys.popitem(last=False)
+    future = entry[2]
+    if not leader:
+        if entry[0] != request_hash:
+            return {"result": "Idempotency-Key %s was already used for a different request" % (key[1])}, 400
+        inc_counter("oess_sdx_l2vpn_dedupe_total", reason="idempotency_key")
+        return future.result()
+    try:
+        result = handler()
+    except BaseException as exc:
+        future.set_exception(exc)
+        result = None
+        raise
+    else:
+        future.set_result(result)
+    finally:
+        if result is None or result[1] >= 300:
+            with idempotency_lock:
+                if idempotency_keys.get(key) is entry:
+                    del idempotency_keys[key]
+    return result
+
+
+def run_batch(func, items):
+    """Run func(*item) for each item with bounded concurrency, keeping the order."""
+    concurrency = max(1, int(sdx_config.get("batch_concurrency", 8)))
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="l2vpn-batch") as pool:
+        return list(pool.map(lambda item: func(*item), items))
+
+
+def get_batch_items(content, key):
+    """Get the list of items of a batch request (a JSON list or {key: [...]})."""
+    if isinstance(content, dict):
+        content = content.get(key)
+    if not isinstance(content, list) or not content:
+        raise ValueError("Invalid batch - expected a non-empty list of %s" % (key))
+    max_items = int(sdx_config.get("batch_max_items", 1000))
+    if len(content) > max_items:
+        raise ValueError("Invalid batch - too many items: max=%d was=%d" % (max_items, len(content)))
+    return content
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    if "request_start" in g:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        labels = {"route": route, "method": request.method}
+        observe("oess_sdx_http_request_duration_seconds", time.perf_counter() - g.request_start, **labels)
+        inc_counter("oess_sdx_http_requests_total", status=response.status_code, **labels)
+    return response
+
+
+@app.before_request
+def sync_shared_state():
+    """Pick up the topology published by another worker, at most every state_sync_interval seconds."""
+    global state_synced_at
+    now = time.monotonic()
+    if now - state_synced_at < float(sdx_config.get("state_sync_interval", 1)):
+        return
+    state_synced_at = now
+    try:
+        sync_state()
+    except Exception as exc:
+        app.logger.error("Failed to sync state: %s" % (exc))
+
+
+@app.route("/", methods=["GET"])
+def home():
+    return jsonify({}), 204
+
+
+def refresh_stale_topology():
+    """Refresh the topology when stale or when the request asks for it (?refresh=1).
+
+    Returns True when the refresh failed and the last converted topology
+    is served instead (see mark_stale). Raises ValueError if the topology
+    cannot be fetched and none was ever loaded.
+    """
+    force_refresh = request.args.get("refresh", "0").lower() in ["1", "true", "yes"]
+    if force_refresh or is_topology_stale():
+        inc_counter("oess_sdx_cache_requests_total", cache="topology", result="miss")
+        try:
+            refresh_topology(since=time.monotonic())
+        except ValueError as exc:
+            if "version" not in sdx_topo_conv:
+                raise
+            app.logger.error("Serving stale topology: %s" % (exc))
+            inc_counter("oess_sdx_cache_requests_total", cache="topology", result="stale")
+            return True
+    else:
+        inc_counter("oess_sdx_cache_requests_total", cache="topology", result="hit")
+    return False
+
+
+def mark_stale(response, stale):
+    """Flag a response built from the last topology when its refresh failed (Age and Warning headers)."""
+    if stale:
+        response.headers["Age"] = str(int(max(time.monotonic() - sdx_topo_fetched_at, 0)))
+        response.headers["Warning"] = '110 - "Response is Stale"'
+    return response
+
+
+@app.route("/topology/2.0.0", methods=["GET"])
+def get_topology():
+    try:
+        stale = refresh_stale_topology()
+    except ValueError as exc:
+        return jsonify({"result": str(exc)}), 400
+    topo = sdx_topo_conv
+    use_gzip = sdx_config.get("topology_gzip") and "gzip" in request.accept_encodings
+    cache = None
+    if not is_json_streaming():
+        cache = get_topology_body(topo)
+        use_gzip = use_gzip and cache["gzip"] is not None
+    etag = get_topology_etag(topo)
+    if use_gzip:
+        # each encoding of the body is a representation of its own
+        etag += "-gzip"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.vary.add("Accept-Encoding")
+        response.set_etag(etag)
+        return mark_stale(response, stale)
+    if cache is None:
+        chunks = iter_topology_json(topo)
+        if use_gzip:
+            chunks = iter_gzip(chunks, int(sdx_config.get("topology_gzip_level", 6)))
+        response = app.response_class(chunks, status=200, mimetype="application/json")
+    else:
+        response = app.response_class(cache["gzip"] if use_gzip else cache["body"], status=200, mimetype="application/json")
+    if use_gzip:
+        response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept-Encoding")
+    response.set_etag(etag)
+    return mark_stale(response, stale)
+
+
+def query_topology(kind):
+    """Response of a query on the nodes, ports or links of the topology, filtered by the request args."""
+    try:
+        filters = parse_topology_filters(kind, request.args)
+        stale = refresh_stale_topology()
+    except ValueError as exc:
+        return jsonify({"result": str(exc)}), 400
+    index = topo_index
+    response = jsonify({
+        "version": index["version"],
+        "timestamp": index["timestamp"],
+        kind: query_topology_index(index, kind, filters),
+    })
+    return mark_stale(response, stale), 200
+
+
+def get_topology_object(kind, obj_id):
+    """Response with a node, port or link of the topology by URN."""
+    try:
+        stale = refresh_stale_topology()
+    except ValueError as exc:
+        return jsonify({"result": str(exc)}), 400
+    obj = topo_index[kind].get(obj_id)
+    if obj is None:
+        return jsonify({"result": "Not found: %s" % (obj_id)}), 400
+    return mark_stale(jsonify(obj), stale), 200
+
+
+@app.route("/topology/2.0.0/nodes", methods=["GET"])
+def get_topology_nodes():
+    return query_topology("nodes")
+
+
+@app.route("/topology/2.0.0/nodes/<path:node_id>", methods=["GET"])
+def get_topology_node(node_id):
+    return get_topology_object("nodes", node_id)
+
+
+@app.route("/topology/2.0.0/ports", methods=["GET"])
+def get_topology_ports():
+    return query_topology("ports")
+
+
+@app.route("/topology/2.0.0/ports/<path:port_id>", methods=["GET"])
+def get_topology_port(port_id):
+    return get_topology_object("ports", port_id)
+
+
+@app.route("/topology/2.0.0/links", methods=["GET"])
+def get_topology_links():
+    return query_topology("links")
+
+
+@app.route("/topology/2.0.0/links/<path:link_id>", methods=["GET"])
+def get_topology_link(link_id):
+    return get_topology_object("links", link_id)
+
+
+@app.route("/topology/2.0.0/changes", methods=["GET"])
+def get_topology_changes():
+    try:
+        since = int(request.args["since"])
+    except (KeyError, ValueError):
+        return jsonify({"result": "Invalid/Missing parameter: since (topology version)"}), 400
+    deltas = get_topo_deltas_since(since, request.args.get("timestamp"))
+    if deltas is None:
+        msg = "Changes since version %s are no longer available - fetch the full topology" % (since)
+        return jsonify({"result": msg}), 410
+    topo = sdx_topo_conv
+    return jsonify({
+        "version": topo.get("version"),
+        "timestamp": topo.get("timestamp"),
+        "changes": deltas,
+    }), 200
+
+
+@app.route("/v1/l2vpn_ptp", methods=["POST"])
+def create_l2vpn_ptp():
+    result, status = run_idempotent(create_l2vpn_ptp_request)
+    return jsonify(result), status
+
+
+def create_l2vpn_ptp_request():
+    """Create an L2VPN from a legacy /v1/l2vpn_ptp request, returning (response payload, status code)."""
+    content = request.get_json()
+
+    # Sanity checks
+    if not content:
+        return {"result": "Create L2VPN failed - not a valid JSON payload"}, 400
+    if "name" not in content:
+        msg = "Create L2VPN failed -  missing attribute: name"
+        return {"result": msg}, 400
+
+    circuit_endpoints = []
+    for uni_name in ["uni_a", "uni_z"]:
+        intf = sdx2oess.get(content.get(uni_name, {}).get("port_id"))
+        if not intf:
+            return {"result": "Invalid/Missing L2VPN endpoint attribute %s" % (uni_name)}, 400
+        vlan = content.get(uni_name, {}).get("tag", {}).get("value")
+        if not isinstance(vlan, int):
+            return {"result": "Invalid/Missing L2VPN endpoint vlan for %s" % (uni_name)}, 400
+        try:
+            check_vlan_range(intf, vlan, content[uni_name]["port_id"])
+        except ValueError as exc:
+            return {"result": str(exc)}, 400
+        circuit_endpoints.append((intf, vlan))
+    try:
+        check_vlan_conflict(circuit_endpoints, get_circuit_endpoints_request_key(content["name"], circuit_endpoints))
+        oess_params = get_provision_params(content["name"], circuit_endpoints)
+    except ValueError as exc:
+        return {"result": str(exc)}, 400
+    return create_l2vpn_item(content, oess_params, circuit_endpoints)
+
+@app.route("/v1/l2vpn_ptp", methods=["DELETE"])
+def delete_l2vpn_ptp():
+    content = request.get_json()
+
+    # Sanity check
+    if not content:
+        return jsonify({"result": "Create L2VPN failed - not a valid JSON payload"}), 400
+
+    name = content.get("name")
+    intf_id_0 = getattr(sdx2oess.get(content.get("uni_a", {}).get("interface_id")), "interface_id", None)
+    intf_id_1 = getattr(sdx2oess.get(content.get("uni_z", {}).get("interface_id")), "interface_id", None)
+    vlan_0 = content.get("uni_a", {}).get("tag", {}).get("value")
+    vlan_1 = content.get("uni_z", {}).get("tag", {}).get("value")
+
+    try:
+        circuit_id = find_circuit_id(str(name), ((intf_id_0, vlan_0), (intf_id_1, vlan_1)))
+    except Exception as exc:
+        msg = "Failed to DELETE L2VPN - Failed to get Circuits from OESS: %s" % (exc)
+        err = traceback.format_exc().replace("\n", ", ")
+        app.logger.error(msg + " " + err)
         return jsonify({"result": msg}), 400
-    return jsonify({"result": "L2VPN deleted successfully"}), 200
+
+    if not circuit_id:
+        return jsonify({"result": "Failed to DELETE L2VPN - Not found"}), 400
+
+    result, status = delete_l2vpn_item(circuit_id)
+    return jsonify(result), status
+
+@app.route("/l2vpn/1.0", methods=["POST"])
+def create_l2vpn():
+    return make_l2vpn_response(*run_idempotent(create_l2vpn_request))
+
+
+def create_l2vpn_request():
+    """Create an L2VPN from a /l2vpn/1.0 request, returning (response payload, status code)."""
+    content = request.get_json()
+    try:
+        oess_params, circuit_endpoints = validate_l2vpn(content)
+    except ValueError as exc:
+        return {"result": str(exc)}, 400
+    if is_l2vpn_async():
+        return queue_create_l2vpn(content, oess_params, circuit_endpoints)
+    return create_l2vpn_item(content, oess_params, circuit_endpoints)
+
+@app.route("/l2vpn/1.0/<service_id>", methods=["DELETE"])
+def delete_l2vpn(service_id):
+    service_id = parse_service_id(service_id)
+    if service_id is None:
+        return jsonify({"result": "Invalid service_id"}), 400
+    if is_l2vpn_async():
+        return make_l2vpn_response(*queue_delete_l2vpn(service_id))
+    result, status = delete_l2vpn_item(service_id)
+    return jsonify(result), status
+
+
+@app.route("/l2vpn/1.0/jobs/<job_id>", methods=["GET"])
+def get_l2vpn_job_status(job_id):
+    job = get_l2vpn_job(job_id)
+    if job is None:
+        return jsonify({"result": "L2VPN job not found"}), 400
+    return jsonify(job), 200
+
+@app.route("/l2vpn/1.0/batch", methods=["POST"])
+def create_l2vpn_batch():
+    try:
+        items = get_batch_items(request.get_json(), "l2vpns")
+    except ValueError as exc:
+        return jsonify({"result": str(exc)}), 400
+    results = [None] * len(items)
+    to_provision = []
+    # validate everything up front, only valid items are sent to OESS
+    for idx, content in enumerate(items):
+        try:
+            oess_params, circuit_endpoints = validate_l2vpn(content)
+        except ValueError as exc:
+            results[idx] = ({"result": str(exc)}, 400)
+            continue
+        to_provision.append((idx, (content, oess_params, circuit_endpoints)))
+    provisioned = run_batch(create_l2vpn_item, [item for _, item in to_provision])
+    for (idx, _), result in zip(to_provision, provisioned):
+        results[idx] = result
+    return jsonify({"results": [dict(result, status=status) for result, status in results]}), 200
+
+@app.route("/l2vpn/1.0/batch", methods=["DELETE"])
+def delete_l2vpn_batch():
+    try:
+        items = get_batch_items(request.get_json(), "service_ids")
+    except ValueError as exc:
+        return jsonify({"result": str(exc)}), 400
+    results = [None] * len(items)
+    # circuit_id -> positions of the items naming it, so a circuit is removed only once
+    to_delete = {}
+    for idx, service_id in enumerate(items):
+        circuit_id = parse_service_id(service_id) if isinstance(service_id, (int, str)) else None
+        if circuit_id is None:
+            results[idx] = ({"result": "Invalid service_id: %s" % (service_id)}, 400)
+            continue
+        to_delete.setdefault(circuit_id, []).append(idx)
+    deleted = run_batch(delete_l2vpn_item, [(circuit_id,) for circuit_id in to_delete])
+    for positions, result in zip(to_delete.values(), deleted):
+        for idx in positions:
+            results[idx] = result
+    return jsonify({"results": [dict(result, status=status) for result, status in results]}), 200
 
 @app.route("/l2vpn/1.0", methods=["GET"])
 def get_all_l2vpn():
     try:
-        res = requests.get(sdx_config["oess_url"] + "/services/circuit.cgi?method=get&workgroup_id=%s" % (sdx_config["workgroup_id"]), verify=False, auth=(sdx_config["username"], sdx_config["password"]), timeout=timeout)
-        assert res.status_code == 200, res.text
-        data = res.json()
+        circuits = get_cached_circuits()
     except Exception as exc:
         msg = "Failed to get L2VPN from OESS: %s" % (exc)
         err = traceback.format_exc().replace("\n", ", ")
         app.logger.error(msg + " " + err)
         return jsonify({"result": msg}), 400
-    all_l2vpn = {}
-    for result in data["results"]:
-        if not result["description"].startswith(NAME_PREFIX):
-            continue
-        sdx_l2vpn = parse_oess_circuit(result)
-        all_l2vpn[sdx_l2vpn["service_id"]] = sdx_l2vpn
+    circuits = [circuit for circuit in circuits if circuit["description"].startswith(NAME_PREFIX)]
+    # OESS may report ids as strings: key circuits by their cache key, as jsonify sorts them
+    keyed = sorted(((get_circuit_key(circuit["circuit_id"]), circuit) for circuit in circuits), key=lambda item: item[0])
+    if is_json_streaming():
+        encode = get_json_encoder()
+        chunks = iter_json_object(((key, parse_oess_circuit(circuit)) for key, circuit in keyed), encode)
+        return app.response_class(iter_buffered(chunks), status=200, mimetype="application/json")
+    all_l2vpn = {key: parse_oess_circuit(circuit) for key, circuit in keyed}
     return jsonify(all_l2vpn), 200
 
-@app.route("/l2vpn/1.0/<int:service_id>", methods=["GET"])
+@app.route("/l2vpn/1.0/<service_id>", methods=["GET"])
 def get_l2vpn(service_id):
+    service_id = parse_service_id(service_id)
+    if service_id is None:
+        return jsonify({"result": "Invalid service_id"}), 400
+    if not is_circuit_cache_stale():
+        circuit = circuit_cache["by_id"].get(service_id)
+        if circuit is not None:
+            return jsonify(parse_oess_circuit(circuit)), 200
     try:
-        res = requests.get(sdx_config["oess_url"] + "/services/circuit.cgi?method=get&workgroup_id=%s&circuit_id=%s" % (sdx_config["workgroup_id"], service_id), verify=False, auth=(sdx_config["username"], sdx_config["password"]), timeout=timeout)
-        assert res.status_code == 200, res.text
-        data = res.json()
-        assert len(data.get("results", [])) == 1, "L2VPN service not found"
+        circuit = get_oess_circuit(service_id)
+        assert circuit is not None, "L2VPN service not found"
     except Exception as exc:
         msg = "Failed to get L2VPN from OESS: %s" % (exc)
         err = traceback.format_exc().replace("\n", ", ")
         app.logger.error(msg + err)
         return jsonify({"result": msg}), 400
-    sdx_l2vpn = parse_oess_circuit(data["results"][0])
+    sdx_l2vpn = parse_oess_circuit(circuit)
     return jsonify(sdx_l2vpn), 200
 
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    return app.response_class(render_metrics(), status=200, mimetype="text/plain; version=0.0.4")
+
 @app.route("/admin/oess2sdx", methods=["GET"])
 def get_admin_map_oess2sdx():
-    return jsonify(oess2sdx), 200
+    return get_admin_map_response("oess2sdx")
 
 @app.route("/admin/sdx2oess", methods=["GET"])
 def get_admin_map_sdx2oess():
-    non_circular_dict = {}
-    for intf_sdx, intf_oess in sdx2oess.items():
-        intf2 = intf_oess.copy()
-        intf2["node"] = intf_oess["node"].copy()
-        intf2["node"]["interfaces"] = "[...]"
-        if "link" in intf_oess:
-            intf2["link"] = intf_oess["link"].copy()
-            intf2["link"]["interface_a"] = "{...}"
-            intf2["link"]["interface_z"] = "{...}"
-        non_circular_dict[intf_sdx] = intf2
-    app.logger.warning(non_circular_dict)
-    return jsonify(non_circular_dict), 200
+    return get_admin_map_response("sdx2oess")
 
 load_config(fallback_prev_config=False)
+setup_log_queue()
+metrics_enabled = bool(sdx_config.get("metrics_enabled", True))
 try:
-    sdx_topology = get_oess_topo()
-    converted = convert_topo(sdx_topology)
-    diff_admin, diff_oper = check_topo_diff(sdx_topo_conv, converted)
-    if diff_admin or diff_oper:
-        converted["timestamp"] = utcnow()
-    if diff_admin:
-        update_version(0)
-        converted["version"] = sdx_version
-    sdx_topo_conv = converted
+    sync_state()
+    if "version" not in sdx_topo_conv and load_snapshot():
+        threading.Thread(target=reconcile_snapshot, name="snapshot-reconcile", daemon=True).start()
+    elif is_topology_stale():
+        refresh_topology(inc_version=0)
 except Exception as exc:
     err = traceback.format_exc().replace("\n", ", ")
     app.logger.error("Failed to load topology: %s %s" % (exc, err))
+start_poller("topology", poll_topology, get_topology_refresh_interval)
+start_poller("circuits", refresh_circuits, get_circuit_refresh_interval)
+start_poller("circuit-events", push_circuit_events, get_circuit_events_interval)
 
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port="8000")